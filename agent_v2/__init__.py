@@ -1,5 +1,6 @@
 from .core import CodeGeneratorAgent
 from .llm import LocalLLM
+from .registry import ModelRegistry
 from .config import MODEL_PATH
 
-__all__ = ["CodeGeneratorAgent", "LocalLLM", "MODEL_PATH"]
+__all__ = ["CodeGeneratorAgent", "LocalLLM", "ModelRegistry", "MODEL_PATH"]
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -6,52 +7,242 @@ load_dotenv()
 
 MODEL_PATH = "./models/qwen2.5-coder-7b-instruct-q5_k_m.gguf"
 
+# Built-in context size; with KV_AUTO_CTX it is replaced by the size actually
+# needed, while any other n_ctx (params or tuning profile) is kept if it fits
+DEFAULT_N_CTX = 4096
+
 MODEL_PARAMS = {
     "model_path": MODEL_PATH,
-    "n_ctx": 4096,
+    "n_ctx": DEFAULT_N_CTX,
     "n_threads": 8,
     "n_gpu_layers": 0,
     "verbose": False
 }
 
+# Per-host tuned llama.cpp parameters written by `python -m agent_v2.tuning`;
+# applied on top of MODEL_PARAMS when an entry matches this host and model
+TUNING_PROFILE_PATH = os.getenv("TUNING_PROFILE_PATH", "./models/tuning_profile.json")
+
+MAX_NEW_TOKENS = 1500
+
+# Longest user prompt accepted by the API
+MAX_PROMPT_CHARS = 1000
+
+# KV cache memory: element type (f16, q8_0, q4_0) and right-sizing n_ctx to the
+# longest system prompt + MAX_PROMPT_CHARS + MAX_NEW_TOKENS instead of 4096
+KV_CACHE_CONFIG = {
+    "type": os.getenv("KV_CACHE_TYPE", "f16"),
+    "auto_ctx": os.getenv("KV_AUTO_CTX", "true").lower() == "true",
+    # Conservative; code and English average closer to 3.5
+    "prompt_chars_per_token": float(os.getenv("KV_PROMPT_CHARS_PER_TOKEN", "2.5")),
+    "ctx_align": 256,
+}
+
 NUM_SAMPLES = 9
 TEMPERATURES = [0.1, 0.2, 0.3, 0.4, 0.5, 0.5, 0.7, 0.9, 0.9]
 
+# Cascade routing: simple prompts are answered by a small model with a few
+# samples; only low-confidence results escalate to the 7B self-consistency path.
+SMALL_MODEL_PATH = os.getenv(
+    "SMALL_MODEL_PATH", "./models/qwen2.5-coder-1.5b-instruct-q5_k_m.gguf"
+)
+
+SMALL_MODEL_PARAMS = {
+    "model_path": SMALL_MODEL_PATH,
+    "n_ctx": DEFAULT_N_CTX,
+    "n_threads": 8,
+    "n_gpu_layers": 0,
+    "verbose": False
+}
+
+# Model registry: every GGUF this process may serve, keyed by name. Models are
+# loaded on first use and the least recently used idle ones are evicted to keep
+# resident weights within MODEL_MEMORY_BUDGET_GB. Point MODEL_REGISTRY_FILE at a
+# JSON file of the same shape to replace the defaults.
+MODEL_REGISTRY = {
+    "qwen2.5-coder-7b": {
+        "model_path": MODEL_PATH,
+        "params": MODEL_PARAMS,
+        "min_size_gb": 3.0
+    },
+    "qwen2.5-coder-1.5b": {
+        "model_path": SMALL_MODEL_PATH,
+        "params": SMALL_MODEL_PARAMS,
+        "min_size_gb": 0.5
+    }
+}
+
+if os.getenv("MODEL_REGISTRY_FILE"):
+    with open(os.getenv("MODEL_REGISTRY_FILE")) as f:
+        MODEL_REGISTRY = json.load(f)
+
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "qwen2.5-coder-7b")
+
+# Per-language model overrides, e.g. {"sql": "qwen2.5-coder-1.5b"}
+LANGUAGE_MODELS = json.loads(os.getenv("LANGUAGE_MODELS", "{}"))
+
+MODEL_MEMORY_BUDGET_GB = float(os.getenv("MODEL_MEMORY_BUDGET_GB", "12"))
+
+# Estimated KV cache / scratch memory per resident model on top of its weights
+MODEL_OVERHEAD_GB = float(os.getenv("MODEL_OVERHEAD_GB", "0.6"))
+
+# Seconds to wait for in-use models to be released before giving up on a load
+MODEL_LOAD_WAIT_S = float(os.getenv("MODEL_LOAD_WAIT_S", "30"))
+
+# Read the GGUF file into the page cache alongside the llama.cpp load; also
+# drives the bytes-mapped progress reported while the model loads
+PREFETCH_ON_LOAD = os.getenv("PREFETCH_ON_LOAD", "true").lower() == "true"
+
+# Context pool: K llama.cpp contexts over one loaded model, so samples and
+# requests decode in parallel (llama.cpp releases the GIL). size 0 sizes the
+# pool to the core count; each context gets cores // K threads, or the host
+# tuning profile's n_threads / n_threads_batch divided by K.
+CONTEXT_POOL_CONFIG = {
+    "size": int(os.getenv("CONTEXT_POOL_SIZE", "0")),
+    "threads_per_context": int(os.getenv("CONTEXT_POOL_THREADS", "4")),
+}
+
+# Idle policy: after timeout_s without requests a model releases its KV context
+# and, with unload_weights, the weights too. Weights are mmapped, so the page
+# cache stays warm and the next request reloads quickly. 0 disables.
+IDLE_CONFIG = {
+    "timeout_s": float(os.getenv("IDLE_UNLOAD_AFTER_S", "0")),
+    "unload_weights": os.getenv("IDLE_UNLOAD_WEIGHTS", "false").lower() == "true",
+    "check_interval_s": float(os.getenv("IDLE_CHECK_INTERVAL_S", "30")),
+}
+
+# Startup warm-up: tiny generations per language until latency settles, so the
+# first real requests do not pay for cold pages and prefix evaluation.
+WARMUP_CONFIG = {
+    "enabled": os.getenv("WARMUP_ENABLED", "true").lower() == "true",
+    "max_tokens": int(os.getenv("WARMUP_MAX_TOKENS", "8")),
+    "max_rounds": int(os.getenv("WARMUP_MAX_ROUNDS", "5")),
+    # Steady state once two consecutive rounds differ by at most this fraction
+    "tolerance": float(os.getenv("WARMUP_TOLERANCE", "0.15")),
+}
+
+CASCADE_CONFIG = {
+    "enabled": os.getenv("CASCADE_ENABLED", "true").lower() == "true",
+    "small_model": os.getenv("CASCADE_SMALL_MODEL", "qwen2.5-coder-1.5b"),
+    "small_num_samples": int(os.getenv("CASCADE_SMALL_SAMPLES", "3")),
+    # Accept the small tier only if its best candidate scores at least this...
+    "min_score": float(os.getenv("CASCADE_MIN_SCORE", "8.0")),
+    # ...or, per language, this: the definition and return features rarely
+    # fire for C and SQL, so their candidates score lower. JSON overrides,
+    # e.g. CASCADE_MIN_SCORE_BY_LANGUAGE='{"sql": 4.5}'
+    "min_score_by_language": {
+        "c": 6.0,
+        "cpp": 6.0,
+        "sql": 5.0,
+        **json.loads(os.getenv("CASCADE_MIN_SCORE_BY_LANGUAGE", "{}")),
+    },
+    # ...and this fraction of its samples survived extraction and syntax checks
+    "min_confidence": float(os.getenv("CASCADE_MIN_CONFIDENCE", "0.66")),
+}
+
+# Guardrail rules beyond the built-in ones: a JSON file of
+# {"rules": [{"name": ..., "pattern": ..., "scope": "prompt"|"output"|"both"}]},
+# re-read when it changes
+GUARDRAILS_CONFIG = {
+    "file": os.getenv("GUARDRAILS_FILE", "./guardrails.json"),
+    "reload_interval_s": float(os.getenv("GUARDRAILS_RELOAD_INTERVAL_S", "2")),
+    # Scan samples as they stream and drop those matching an output rule
+    "scan_output": os.getenv("GUARDRAILS_SCAN_OUTPUT", "true").lower() == "true",
+    # Look-back for regex-checked rules, so matches split across tokens are found
+    "stream_overlap_chars": int(os.getenv("GUARDRAILS_STREAM_OVERLAP", "256")),
+}
+
+# Execution-based verification of candidates in a warm pool of sandboxed,
+# resource-limited worker processes; the verdict adjusts the sample's score.
+# Off unless asked for: it runs model output
+VERIFICATION_CONFIG = {
+    "enabled": os.getenv("VERIFY_ENABLED", "false").lower() == "true",
+    "languages": ("python", "sql"),
+    "workers": int(os.getenv("VERIFY_WORKERS", "2")),
+    "timeout_s": float(os.getenv("VERIFY_TIMEOUT_S", "2.0")),
+    # Address space a worker may grow by, beyond its size at startup
+    "memory_mb": int(os.getenv("VERIFY_MEMORY_MB", "256")),
+    # Workers are replaced after this many candidates
+    "max_tasks_per_child": int(os.getenv("VERIFY_MAX_TASKS_PER_CHILD", "50")),
+    "pass_bonus": float(os.getenv("VERIFY_PASS_BONUS", "3.0")),
+    "fail_penalty": float(os.getenv("VERIFY_FAIL_PENALTY", "5.0")),
+}
+
+# Near-duplicate candidates: MinHash signatures (num_perm hashes of shingles
+# of shingle_tokens tokens) split into LSH bands; candidates at least threshold
+# similar share a cluster, verification and score. With steer, samples that
+# start while at least steer_duplicate_ratio of the candidates so far were
+# duplicates are drawn steer_boost hotter (up to steer_max_temperature).
+DEDUP_CONFIG = {
+    "enabled": os.getenv("DEDUP_ENABLED", "true").lower() == "true",
+    "num_perm": 64,
+    "bands": 16,
+    "shingle_tokens": 3,
+    "threshold": float(os.getenv("DEDUP_THRESHOLD", "0.8")),
+    "steer": os.getenv("DEDUP_STEER", "false").lower() == "true",
+    "steer_duplicate_ratio": float(os.getenv("DEDUP_STEER_RATIO", "0.5")),
+    "steer_boost": float(os.getenv("DEDUP_STEER_BOOST", "0.3")),
+    "steer_max_temperature": float(os.getenv("DEDUP_STEER_MAX_TEMPERATURE", "1.0")),
+}
+
+# Candidate ranking weights: a JSON file of {"bias": ..., "weights": {feature: weight}}
+# (see agent_v2.scoring), re-read when it changes; built-in weights without it.
+# `python -m agent_v2.train_ranker` fits it from the candidate log.
+SCORING_CONFIG = {
+    "weights_file": os.getenv("SCORING_WEIGHTS_FILE", "./models/ranker_weights.json"),
+    # Every request's candidates and outcomes, plus answer feedback, as JSON lines
+    "log_candidates": os.getenv("CANDIDATE_LOG_ENABLED", "true").lower() == "true",
+    "candidate_log": os.getenv("CANDIDATE_LOG_FILE", "./data/candidates.jsonl"),
+}
+
+# Syntax checks before ranking; each language's "syntax_check" in
+# LANGUAGE_CONFIGS names a validator in agent_v2.validators
+VALIDATION_CONFIG = {
+    # Compiler front-ends running at once
+    "max_concurrency": int(os.getenv("VALIDATE_CONCURRENCY", str(min(4, os.cpu_count() or 1)))),
+    "timeout_s": float(os.getenv("VALIDATE_TIMEOUT_S", "10")),
+    # Verdicts remembered by content hash
+    "cache_size": int(os.getenv("VALIDATE_CACHE_SIZE", "1024")),
+    # "sqlite" fails SQL on any SQLite syntax error; "any" lets statements
+    # using Postgres, MySQL or T-SQL constructs through undecided
+    "sql_dialect": os.getenv("VALIDATE_SQL_DIALECT", "any").lower(),
+}
+
 LANGUAGE_CONFIGS = {
     "python": {
         "name": "Python",
         "extension": ".py",
         "comment": "#",
-        "syntax_check": "import ast; ast.parse(code)"
+        "syntax_check": "ast"
     },
     "javascript": {
         "name": "JavaScript",
         "extension": ".js",
         "comment": "//",
-        "syntax_check": "basic"
+        "syntax_check": "node"
     },
     "java": {
         "name": "Java",
         "extension": ".java",
         "comment": "//",
-        "syntax_check": "basic"
+        "syntax_check": "javac"
     },
     "cpp": {
         "name": "C++",
         "extension": ".cpp",
         "comment": "//",
-        "syntax_check": "basic"
+        "syntax_check": "g++"
     },
     "c": {
         "name": "C",
         "extension": ".c",
         "comment": "//",
-        "syntax_check": "basic"
+        "syntax_check": "gcc"
     },
     "sql": {
         "name": "SQL",
         "extension": ".sql",
         "comment": "--",
-        "syntax_check": "basic"
+        "syntax_check": "sqlite"
     }
 }
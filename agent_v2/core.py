@@ -1,28 +1,60 @@
 import logging
 import os
+import time
+import threading
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 from langchain_community.llms import LlamaCpp
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain.tools import Tool
 from langchain import hub
 
-from .config import MODEL_PATH, LANGUAGE_CONFIGS
-from .llm import LocalLLM
+from .config import (
+    MODEL_PATH, LANGUAGE_CONFIGS, NUM_SAMPLES, DEFAULT_MODEL, CASCADE_CONFIG,
+    WARMUP_CONFIG
+)
+from .registry import ModelRegistry
+from .guardrails import output_guardrails
+from .sandbox import verification_pool
+from .validators import syntax_validator
+from .scoring import candidate_scorer, candidate_log
 
 logger = logging.getLogger(__name__)
 
 class CodeGeneratorAgent:
     """Multi-language code generator agent with LangChain"""
     
-    def __init__(self, model_path: str = MODEL_PATH):
+    def __init__(self, model_path: str = MODEL_PATH, registry: Optional[ModelRegistry] = None):
         """Initialize the agent"""
         logger.info("="*80)
         logger.info("🤖 Initializing Code Generator Agent...")
         logger.info("="*80)
         
-        self.local_llm = LocalLLM(model_path)
-        self.is_ready = self.local_llm.is_available
+        self.registry = registry or ModelRegistry()
+        if model_path != MODEL_PATH:
+            spec = self.registry.models.get(DEFAULT_MODEL, {})
+            self.registry.models[DEFAULT_MODEL] = {**spec, "model_path": model_path}
+        
+        # Keep the default model resident from the start
+        self.is_ready = self.registry.preload(DEFAULT_MODEL).is_available
+        
+        # Small tier of the cascade (optional)
+        small_model = CASCADE_CONFIG["small_model"]
+        self.cascade_enabled = CASCADE_CONFIG["enabled"] and self.registry.has_model(small_model)
+        if CASCADE_CONFIG["enabled"] and not self.cascade_enabled:
+            logger.info(f"Cascade disabled - small model {small_model} not available")
+        
+        self._stats_lock = threading.Lock()
+        self.tier_stats = {"small": 0, "large": 0, "fallback": 0}
+        self.cancel_stats = {
+            "requests": 0, "samples_stopped": 0, "samples_skipped": 0, "tokens_discarded": 0
+        }
+        self.blocked_samples: Dict[str, int] = {}
+        
+        self.warmup = {
+            "state": "pending" if WARMUP_CONFIG["enabled"] else "skipped",
+            "languages": {}
+        }
         
         if not self.is_ready:
             logger.error("Agent initialization failed - model not available")
@@ -107,13 +139,29 @@ class CodeGeneratorAgent:
             logger.error(f"⚠️  Agent executor setup failed: {e}")
             self.agent_executor = None
     
-    def generate_code(self, prompt: str, language: str = "python") -> Dict[str, Any]:
+    def generate_code(
+        self,
+        prompt: str,
+        language: str = "python",
+        model: Optional[str] = None,
+        num_samples: Optional[int] = None,
+        deadline: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+        on_sample: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
         """
         Generate code for given prompt and language
         
         Args:
             prompt: Description of code to generate
             language: Programming language (python, javascript, java, cpp, c, sql)
+            model: Registered model name; skips the cascade when given
+            num_samples: Self-consistency samples for the large tier
+                (defaults to NUM_SAMPLES; lowered by the server under load)
+            deadline: time.time() by which to answer; returns the best
+                candidate so far, marked partial, when sampling is cut short
+            cancel: Event that abandons the request (e.g. client disconnect)
+            on_sample: Progress callback, ``on_sample(done, total)`` per sample
         
         Returns:
             Dictionary with generated code and metadata
@@ -126,20 +174,207 @@ class CodeGeneratorAgent:
         logger.info(f" Generating {language} code")
         logger.info(f" Prompt: {prompt[:100]}...")
         
-        code = self.local_llm.generate_with_self_consistency(prompt, language)
+        result, tier = self._generate_cascade(
+            prompt, language, model, num_samples or NUM_SAMPLES, deadline, cancel, on_sample
+        )
         
         status = "success" if self.is_ready else "fallback"
-        logger.info(f" Code generation complete (status: {status})")
+        logger.info(f" Code generation complete (status: {status}, tier: {tier})")
         
         return {
-            "code": code,
+            "code": result["code"],
             "language": language,
             "prompt": prompt,
             "timestamp": datetime.now().isoformat(),
             "status": status,
-            "model_available": self.is_ready
+            "model_available": self.is_ready,
+            "tier": tier,
+            "model": result["model"],
+            "score": result["score"],
+            "num_samples": result["num_samples"],
+            "partial": result["partial"],
+            "cancelled": result["cancelled"],
+            "completion_tokens": result["completion_tokens"],
+            "verification": result.get("verification"),
+            "generation_id": result.get("generation_id"),
+            "clusters": result.get("clusters")
+        }
+    
+    def _generate_cascade(self, prompt: str, language: str, model: Optional[str] = None,
+                          num_samples: int = NUM_SAMPLES, deadline: Optional[float] = None,
+                          cancel: Optional[threading.Event] = None,
+                          on_sample: Optional[Callable[[int, int], None]] = None):
+        """
+        Try the small tier first, escalate to the large self-consistency path
+        
+        The small tier's answer is accepted only when its best candidate passed
+        extraction and syntax checks, scores at least ``min_score`` (or the
+        language's entry in ``min_score_by_language``), and enough of its
+        samples agreed on producing valid code (``min_confidence``).
+        An explicitly requested model bypasses the cascade. If the deadline
+        has passed once the small tier answers, its answer is returned as partial;
+        a cancelled request never escalates.
+        """
+        
+        small = None
+        if model is None and self.cascade_enabled:
+            small_model = CASCADE_CONFIG["small_model"]
+            with self.registry.lease(small_model) as small_llm:
+                small = small_llm.generate(
+                    prompt, language,
+                    num_samples=min(CASCADE_CONFIG["small_num_samples"], num_samples),
+                    deadline=deadline,
+                    cancel=cancel,
+                    on_sample=on_sample
+                )
+            small["model"] = small_model
+            self._record_cancel(small)
+            self._record_blocked(small)
+            if small["cancelled"]:
+                return small, "cancelled"
+            confidence = small["valid_samples"] / max(1, small["num_samples"])
+            min_score = CASCADE_CONFIG["min_score_by_language"].get(language, CASCADE_CONFIG["min_score"])
+            
+            if (not small["fallback"]
+                    and small["score"] >= min_score
+                    and confidence >= CASCADE_CONFIG["min_confidence"]):
+                self._record_tier("small")
+                return small, "small"
+            
+            if not small["fallback"] and deadline is not None and time.time() >= deadline:
+                logger.info(" Deadline reached - returning the small tier's answer")
+                small["partial"] = True
+                self._record_tier("small")
+                return small, "small"
+            
+            logger.info(
+                f" Escalating to large model (score: {small['score']:.2f}, "
+                f"confidence: {confidence:.2f})"
+            )
+        
+        model = self.registry.select(language, model)
+        with self.registry.lease(model) as llm:
+            result = llm.generate(
+                prompt, language, num_samples=num_samples, deadline=deadline,
+                cancel=cancel, on_sample=on_sample
+            )
+        result["model"] = model
+        if small:
+            # Tokens spent on the small tier count towards the request too
+            result["completion_tokens"] += small["completion_tokens"]
+        self._record_cancel(result)
+        self._record_blocked(result)
+        if result["cancelled"]:
+            return result, "cancelled"
+        tier = "fallback" if result["fallback"] else "large"
+        self._record_tier(tier)
+        return result, tier
+    
+    def _record_tier(self, tier: str):
+        """Count which cascade tier answered a request"""
+        with self._stats_lock:
+            self.tier_stats[tier] += 1
+    
+    def _record_cancel(self, result: Dict[str, Any]):
+        """Accumulate work abandoned because the request was cancelled"""
+        if not result.get("cancelled"):
+            return
+        with self._stats_lock:
+            self.cancel_stats["requests"] += 1
+            for key in ("samples_stopped", "samples_skipped", "tokens_discarded"):
+                self.cancel_stats[key] += result.get(key, 0)
+    
+    def _record_blocked(self, result: Dict[str, Any]):
+        """Count samples dropped by the output guardrails, per rule"""
+        with self._stats_lock:
+            for rule in result.get("blocked_rules", []):
+                self.blocked_samples[rule] = self.blocked_samples.get(rule, 0) + 1
+    
+    def output_guardrail_stats(self) -> Dict[str, Any]:
+        """Output rule set and the samples it dropped"""
+        with self._stats_lock:
+            blocked = dict(self.blocked_samples)
+        return {
+            **output_guardrails.status(),
+            "samples_blocked": sum(blocked.values()),
+            "blocked_by_rule": blocked
+        }
+    
+    def cancellation_stats(self) -> Dict[str, int]:
+        """Requests cancelled mid-generation and the work that was cut off"""
+        with self._stats_lock:
+            return dict(self.cancel_stats)
+    
+    def cascade_stats(self) -> Dict[str, Any]:
+        """Per-tier request counts and hit rates"""
+        with self._stats_lock:
+            counts = dict(self.tier_stats)
+        total = sum(counts.values())
+        return {
+            "enabled": self.cascade_enabled,
+            "total": total,
+            "counts": counts,
+            "hit_rates": {
+                tier: (count / total if total else 0.0)
+                for tier, count in counts.items()
+            }
         }
     
+    def after_fork(self, num_cores: Optional[int] = None):
+        """Prepare a forked worker process that inherited this agent"""
+        self._stats_lock = threading.Lock()
+        self.registry.after_fork(num_cores)
+    
+    def warm_up(self):
+        """
+        Run tiny generations per language until latency reaches steady state
+        
+        Each language is warmed on every model that serves traffic (the
+        default model and the cascade's small tier) until two consecutive
+        rounds differ by at most ``tolerance``, or ``max_rounds`` is reached.
+        """
+        if not WARMUP_CONFIG["enabled"] or not self.is_ready:
+            self.warmup["state"] = "skipped"
+            return
+        
+        self.warmup["state"] = "running"
+        logger.info("🔥 Warming up models...")
+        
+        models = [DEFAULT_MODEL]
+        if self.cascade_enabled:
+            models.append(CASCADE_CONFIG["small_model"])
+        
+        try:
+            for model in models:
+                with self.registry.lease(model) as llm:
+                    for language in LANGUAGE_CONFIGS:
+                        latencies = []
+                        for _ in range(WARMUP_CONFIG["max_rounds"]):
+                            latencies.append(
+                                llm.warm_up(language, WARMUP_CONFIG["max_tokens"])
+                            )
+                            if (len(latencies) >= 2 and abs(latencies[-1] - latencies[-2])
+                                    <= WARMUP_CONFIG["tolerance"] * latencies[-2]):
+                                break
+                        self.warmup["languages"][f"{model}/{language}"] = {
+                            "rounds": len(latencies),
+                            "latency_s": round(latencies[-1], 3)
+                        }
+        except Exception as e:
+            # Generation may still work, only cold: serve rather than stay unready
+            logger.warning(f"⚠️  Warm-up failed ({e}) - serving without warm-up")
+            self.warmup["state"] = "failed"
+            self.warmup["error"] = str(e)
+            return
+        
+        self.warmup["state"] = "done"
+        logger.info("✅ Warm-up complete")
+    
+    @property
+    def is_warm(self) -> bool:
+        """Ready for traffic: model loaded and warm-up over (finished, skipped or failed)"""
+        return self.is_ready and self.warmup["state"] in ("done", "skipped", "failed")
+    
     def run_agent(self, query: str) -> str:
         """Run the agent with a query"""
         if not self.agent_executor:
@@ -157,9 +392,19 @@ class CodeGeneratorAgent:
         return {
             "status": "healthy" if self.is_ready else "degraded",
             "model_available": self.is_ready,
+            "model_state": self.registry.model_state(DEFAULT_MODEL),
             "model_path": MODEL_PATH,
             "model_exists": os.path.exists(MODEL_PATH),
             "agent_executor_available": self.agent_executor is not None,
+            "cascade": self.cascade_stats(),
+            "cancellation": self.cancellation_stats(),
+            "output_guardrails": self.output_guardrail_stats(),
+            "verification": verification_pool.status(),
+            "syntax_validation": syntax_validator.status(),
+            "scoring": candidate_scorer.status(),
+            "candidate_log": candidate_log.status(),
+            "warmup": self.warmup,
+            "models": self.registry.status(),
             "supported_languages": list(LANGUAGE_CONFIGS.keys()),
             "timestamp": datetime.now().isoformat()
         }
@@ -0,0 +1,133 @@
+import re
+import random
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import DEDUP_CONFIG
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# ============================================================================
+# NEAR-DUPLICATE CANDIDATES
+# ============================================================================
+#
+# Low-temperature samples often come out (nearly) identical. Each candidate
+# gets a MinHash signature of its token shingles; signatures are split into
+# LSH bands, and a candidate joins the first cluster whose representative
+# shares a band with it and whose estimated Jaccard similarity reaches
+# ``threshold``. Duplicates reuse their representative's verification and
+# score, and the cluster size is a consensus signal for ranking.
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Universal hashing modulo a prime above 2**32; a < 2**31 keeps a * x + b in uint64
+_PRIME = 4294967311
+
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[List[int], List[int]]:
+    rng = random.Random(seed)
+    return (
+        [rng.randrange(1, 1 << 31) for _ in range(num_perm)],
+        [rng.randrange(0, 1 << 32) for _ in range(num_perm)]
+    )
+
+class MinHasher:
+    """MinHash signatures over shingles of ``shingle_tokens`` consecutive tokens"""
+
+    def __init__(self, num_perm: int = DEDUP_CONFIG["num_perm"],
+                 shingle_tokens: int = DEDUP_CONFIG["shingle_tokens"]):
+        self.num_perm = num_perm
+        self.shingle_tokens = shingle_tokens
+        self._a, self._b = _permutations(num_perm)
+        if np is not None:
+            self._a_column = np.array(self._a, dtype=np.uint64)[:, None]
+            self._b_column = np.array(self._b, dtype=np.uint64)[:, None]
+
+    def shingles(self, code: str) -> set:
+        tokens = _TOKEN.findall(code)
+        k = self.shingle_tokens
+        if len(tokens) <= k:
+            return {hash(tuple(tokens)) & 0xFFFFFFFF}
+        return {hash(tuple(tokens[i:i + k])) & 0xFFFFFFFF for i in range(len(tokens) - k + 1)}
+
+    def signature(self, code: str) -> Tuple[int, ...]:
+        hashes = self.shingles(code)
+        if np is not None:
+            x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))[None, :]
+            return tuple(((self._a_column * x + self._b_column) % _PRIME).min(axis=1).tolist())
+        return tuple(min((a * x + b) % _PRIME for x in hashes) for a, b in zip(self._a, self._b))
+
+def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+class CandidateClusters:
+    """
+    Near-duplicate clusters of one request's candidates, built as samples finish
+
+    Thread-safe: samples decode in parallel and add their candidates as they
+    complete. With dedup disabled every candidate is its own cluster.
+    """
+
+    def __init__(self, config: Dict[str, Any] = DEDUP_CONFIG, hasher: Optional[MinHasher] = None):
+        self.config = config
+        self.enabled = config["enabled"]
+        self.threshold = config["threshold"]
+        self.bands = config["bands"]
+        self.hasher = hasher or (minhasher if self.enabled else None)
+        self._rows = config["num_perm"] // self.bands
+        self._lock = threading.Lock()
+        self._buckets: List[Dict[Tuple[int, ...], int]] = [{} for _ in range(self.bands)]
+        self._signatures: List[Optional[Tuple[int, ...]]] = []
+        self._verdicts: Dict[int, Dict[str, Any]] = {}
+        self.added = 0
+        self.duplicates = 0
+
+    def _bands(self, signature: Tuple[int, ...]):
+        rows = self._rows
+        return [signature[band * rows:(band + 1) * rows] for band in range(self.bands)]
+
+    def add(self, code: str) -> Tuple[int, bool]:
+        """Cluster id for a candidate, and whether an earlier candidate already started it"""
+        signature = self.hasher.signature(code) if self.enabled else None
+        with self._lock:
+            self.added += 1
+            if signature is not None:
+                keys = self._bands(signature)
+                seen = {self._buckets[band].get(key) for band, key in enumerate(keys)} - {None}
+                for cluster in sorted(seen):
+                    if similarity(signature, self._signatures[cluster]) >= self.threshold:
+                        self.duplicates += 1
+                        return cluster, True
+            cluster = len(self._signatures)
+            self._signatures.append(signature)
+            if signature is not None:
+                for band, key in enumerate(keys):
+                    self._buckets[band].setdefault(key, cluster)
+            return cluster, False
+
+    def verdict(self, cluster: int) -> Optional[Dict[str, Any]]:
+        """The representative's verification verdict, once it has one"""
+        with self._lock:
+            return self._verdicts.get(cluster)
+
+    def set_verdict(self, cluster: int, verdict: Dict[str, Any]):
+        with self._lock:
+            self._verdicts[cluster] = verdict
+
+    def duplicate_ratio(self) -> float:
+        """Fraction of candidates so far that duplicated an earlier one"""
+        with self._lock:
+            return self.duplicates / self.added if self.added >= 2 else 0.0
+
+    def steer_temperature(self, temperature: float) -> float:
+        """Sampling temperature for the next sample: raised while duplication is high"""
+        if not (self.enabled and self.config["steer"]):
+            return temperature
+        if self.duplicate_ratio() < self.config["steer_duplicate_ratio"]:
+            return temperature
+        return min(self.config["steer_max_temperature"], temperature + self.config["steer_boost"])
+
+minhasher = MinHasher()
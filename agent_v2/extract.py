@@ -0,0 +1,147 @@
+import re
+from typing import List, Optional
+
+# ============================================================================
+# CODE EXTRACTION
+# ============================================================================
+#
+# A sample is read once, as it streams out of the model. Each time a chunk
+# completes a line, the new text is scanned for fences opening or closing a
+# block, the first line of code in the current block (a line starting with one
+# of CODE_START_KEYWORDS) and banned placeholder patterns after it, using
+# str.find, a precompiled regex and substring tests over the new text only. finish() then only
+# has to pick a block and slice it out.
+
+CODE_START_KEYWORDS = (
+    "def ", "class ", "function", "import ", "from ", "public ", "#include", "SELECT", "CREATE"
+)
+
+# Marks of unfinished code; matched case-insensitively
+BANNED_PATTERNS = ("TODO", "FIXME", "placeholder", "implement", "pass  #")
+
+# Fence info strings accepted for each language
+FENCE_TAGS = {
+    "python": ("python", "py", "python3"),
+    "javascript": ("javascript", "js", "jsx", "node", "mjs"),
+    "java": ("java",),
+    "cpp": ("cpp", "c++", "cc", "cxx", "hpp"),
+    "c": ("c", "h"),
+    "sql": ("sql", "sqlite", "postgresql", "mysql"),
+}
+
+MIN_CODE_CHARS = 15
+
+FENCE = "```"
+
+_CODE_START = re.compile(
+    r"^[^\S\n]*(?:" + "|".join(re.escape(kw) for kw in CODE_START_KEYWORDS) + ")", re.MULTILINE
+)
+_BANNED = tuple(p.lower() for p in BANNED_PATTERNS)
+
+class _Block:
+    """Span of a fenced block (or of the text outside any fence), as offsets into the sample"""
+
+    __slots__ = ("tag", "code_start", "end", "banned")
+
+    def __init__(self, tag: Optional[str]):
+        self.tag = tag
+        self.code_start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.banned = False
+
+    def observe(self, text: str, pos: int, stop: int, base: int):
+        """Scan ``text[pos:stop]``, which starts at a line start and at offset ``base + pos``"""
+        if self.code_start is None:
+            match = _CODE_START.search(text, pos, stop)
+            if match is None:
+                return
+            self.code_start = base + match.start()
+            pos = match.start()
+        if not self.banned:
+            # Substring tests on the lowered text beat a case-insensitive regex by far
+            lowered = text[pos:stop].lower()
+            self.banned = any(pattern in lowered for pattern in _BANNED)
+
+class CodeExtractor:
+    """
+    Incremental code extractor for one sample
+
+    feed() takes stream chunks of any size; finish() returns the code of the
+    best block, or "" if there is none, it is too short or it contains a
+    banned pattern. With several fenced blocks, the first one tagged with the
+    requested language that contains code wins, then untagged blocks, then
+    any other. Text outside fences is used only when there are no fences; an
+    unclosed fence runs to the end of the sample.
+    """
+
+    def __init__(self, language: str):
+        self.tags = FENCE_TAGS.get(language, (language,))
+        # Scanned text, in pieces that each end at a line end
+        self._segments: List[str] = []
+        self._length = 0
+        # Chunks since the last line end
+        self._partial: List[str] = []
+        self._blocks: List[_Block] = []
+        self._open: Optional[_Block] = None
+        self._loose = _Block(None)
+
+    def feed(self, chunk: str):
+        newline = chunk.rfind("\n")
+        if newline == -1:
+            self._partial.append(chunk)
+            return
+        self._partial.append(chunk[:newline + 1])
+        segment = "".join(self._partial)
+        self._partial = [chunk[newline + 1:]]
+        self._scan(segment)
+
+    def _scan(self, segment: str):
+        base = self._length
+        self._segments.append(segment)
+        self._length += len(segment)
+        pos = 0
+        while pos < len(segment):
+            fence = segment.find(FENCE, pos)
+            stop = len(segment) if fence == -1 else fence
+            if self._open is not None:
+                self._open.observe(segment, pos, stop, base)
+            elif not self._blocks:
+                self._loose.observe(segment, pos, stop, base)
+            if fence == -1:
+                return
+            line_end = segment.find("\n", fence)
+            if line_end == -1:
+                line_end = len(segment)
+            if self._open is None:
+                # Opening fence; its info string's first word is the tag
+                info = segment[fence + len(FENCE):line_end].split(None, 1)
+                self._open = _Block(info[0].lower() if info else "")
+                self._blocks.append(self._open)
+            else:
+                # Closing fence, possibly right after the last line of code
+                self._open.end = base + fence
+                self._open = None
+            pos = line_end + 1
+
+    def _ranked(self) -> List[_Block]:
+        if not self._blocks:
+            return [self._loose]
+        preference = lambda block: 0 if block.tag in self.tags else 1 if not block.tag else 2
+        return sorted(self._blocks, key=preference)
+
+    def finish(self) -> str:
+        segment = "".join(self._partial)
+        self._partial = []
+        if segment:
+            self._scan(segment)
+        block = next((b for b in self._ranked() if b.code_start is not None), None)
+        if block is None or block.banned:
+            return ""
+        code = "".join(self._segments)[block.code_start:block.end].strip()
+        return code if len(code) >= MIN_CODE_CHARS else ""
+
+def extract_code(response: str, language: str) -> str:
+    """Code in a complete response; see CodeExtractor"""
+    extractor = CodeExtractor(language)
+    extractor.feed(response)
+    return extractor.finish()
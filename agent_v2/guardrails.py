@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import GUARDRAILS_CONFIG
+
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+logger = logging.getLogger(__name__)
+
+# Built-in rules: name -> pattern (matched case-insensitively)
+DEFAULT_RULES: Dict[str, str] = {
+    "drop_table": r'drop\s+table',
+    "delete_from": r'delete\s+from',
+    "truncate_table": r'truncate\s+table',
+    "exec_call": r'exec\s*\(',
+    "eval_call": r'eval\s*\(',
+    "system_call": r'system\s*\(',
+    "os_system": r'os\.system',
+    "subprocess": r'subprocess',
+    "dunder_import": r'__import__',
+    "base64_decode": r'base64\s*decode',
+    "password_assignment": r'password\s*=',
+    "api_key": r'api[_-]?key',
+    "secret_assignment": r'secret\s*=',
+    "rm_rf": r'rm\s+-rf',
+    "chmod_777": r'chmod\s+777',
+    "sudo": r'sudo',
+    "curl_exec": r'curl.*exec',
+    "wget_exec": r'wget.*exec',
+}
+
+# Built-in rules for generated code, scanned while samples stream in
+OUTPUT_RULES: Dict[str, str] = {
+    "os_system": r'os\.system',
+    "subprocess": r'subprocess',
+    # Not a method call: model.eval() is routine in PyTorch code. A lookbehind
+    # rather than a consumed character, so a scan starting mid-text still
+    # sees what precedes the match
+    "eval_call": r'(?<![\w.])eval\s*\(',
+    "exec_call": r'\bexec\s*\(',
+    "dunder_import": r'__import__',
+    "rm_rf": r'rm\s+-rf',
+    "chmod_777": r'chmod\s+777',
+}
+
+SCOPES = ("prompt", "output")
+
+class _Compiled:
+    """
+    An immutable compiled rule set; swapped atomically on reload
+
+    With hyperscan installed, every rule goes into one database and a single
+    scan of the text reports which rules fired; only those rules' regexes run
+    afterwards to recover the matched text. A second, streaming-mode database
+    carries matches across the chunks fed to a scanner. Rules hyperscan cannot
+    compile (backreferences, lookaround) and every rule without hyperscan are
+    checked with their own precompiled regex against the lowercased text, one
+    search per rule. That is deliberate: each regex keeps re's literal-prefix
+    search, while one alternation of all rules tries every branch at every
+    position and measured 2-30x slower on prompt- and code-sized text.
+    """
+
+    def __init__(self, rules: Dict[str, str]):
+        self.rules = dict(rules)
+        self.names = list(self.rules)
+        # Lowercase patterns match the lowercased text without IGNORECASE,
+        # which keeps re's literal-prefix search; others need the flag
+        self.regexes = {
+            name: re.compile(pattern, 0 if pattern == pattern.lower() else re.IGNORECASE)
+            for name, pattern in self.rules.items()
+        }
+        self.database = None
+        self.stream_database = None
+        self.unscanned = list(self.names)
+        if hyperscan is not None and self.rules:
+            self._build_databases()
+        self._local = threading.local()
+        self.close_lock = threading.Lock()
+
+    def _build_databases(self):
+        supported = []
+        for i, name in enumerate(self.names):
+            try:
+                _hyperscan_database([self.rules[name]], [i], hyperscan.HS_MODE_BLOCK)
+                supported.append(i)
+            except hyperscan.error:
+                # Expected for lookaround, e.g. the built-in eval_call rule
+                logger.info(f"Guardrail rule '{name}' not supported by hyperscan - using re")
+        if not supported:
+            return
+        patterns = [self.rules[self.names[i]] for i in supported]
+        self.database = _hyperscan_database(patterns, supported, hyperscan.HS_MODE_BLOCK)
+        self.stream_database = _hyperscan_database(patterns, supported, hyperscan.HS_MODE_STREAM)
+        supported = set(supported)
+        self.unscanned = [name for i, name in enumerate(self.names) if i not in supported]
+
+    @property
+    def backend(self) -> str:
+        return "hyperscan" if self.database is not None else "re"
+
+    def _scratch(self, mode: str = "block"):
+        # Hyperscan scratch space may not be shared between threads
+        scratch = getattr(self._local, mode, None)
+        if scratch is None:
+            database = self.database if mode == "block" else self.stream_database
+            scratch = hyperscan.Scratch(database)
+            setattr(self._local, mode, scratch)
+        return scratch
+
+    def fired(self, text: str, lowered: str) -> List[str]:
+        """Names of the rules with at least one match, in rule order"""
+        found = set()
+        if self.database is not None:
+            def on_match(rule_id, start, end, flags, context):
+                found.add(rule_id)
+            self.database.scan(text.encode("utf-8", "surrogatepass"), match_event_handler=on_match,
+                               scratch=self._scratch())
+        fired = [self.names[i] for i in sorted(found)]
+        fired.extend(name for name in self.unscanned if self.regexes[name].search(lowered))
+        return fired
+
+def _hyperscan_database(patterns: List[str], ids: List[int], mode: int):
+    database = hyperscan.Database(mode=mode)
+    database.compile(
+        expressions=[pattern.encode() for pattern in patterns],
+        ids=ids,
+        flags=hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH
+    )
+    return database
+
+class StreamScanner:
+    """
+    Incremental check of text arriving in chunks (e.g. streamed tokens)
+
+    ``feed`` returns the name of the first rule that fired, or None. With
+    hyperscan the streaming database keeps its state between chunks, so each
+    chunk is scanned once. Rules checked with re look back over the last
+    ``overlap_chars`` characters so matches spanning chunks are caught;
+    ``finish`` re-checks the whole text for longer matches. One more
+    character before the look-back is kept as context only (the search
+    starts after it), so lookbehinds and \\b at the start of the look-back
+    see the real preceding text rather than a string boundary.
+    """
+
+    def __init__(self, compiled: _Compiled, overlap_chars: int = GUARDRAILS_CONFIG["stream_overlap_chars"]):
+        self.compiled = compiled
+        self.overlap_chars = overlap_chars
+        self.fired: Optional[str] = None
+        self._lowered: List[str] = []
+        self._tail = ""
+        self._stream = None
+        self._hits: List[int] = []
+        if compiled.stream_database is not None:
+            self._scratch = compiled._scratch("stream")
+            # The extension keeps only a borrowed reference to the handler
+            self._handler = self._on_match
+            self._stream = compiled.stream_database.stream(match_event_handler=self._handler)
+            self._stream.__enter__()
+
+    def _on_match(self, rule_id, start, end, flags, context):
+        self._hits.append(rule_id)
+        return False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        if self.fired or not chunk:
+            return self.fired
+        compiled = self.compiled
+        if self._stream is not None:
+            self._stream.scan(chunk.encode("utf-8", "surrogatepass"), scratch=self._scratch)
+            if self._hits:
+                self.fired = compiled.names[min(self._hits)]
+                return self.fired
+
+        if compiled.unscanned:
+            lowered = chunk.lower()
+            self._lowered.append(lowered)
+            window = self._tail + lowered
+            start = 1 if len(self._tail) > self.overlap_chars else 0
+            for name in compiled.unscanned:
+                if compiled.regexes[name].search(window, start):
+                    self.fired = name
+                    break
+            self._tail = window[-(self.overlap_chars + 1):]
+        return self.fired
+
+    def finish(self) -> Optional[str]:
+        """Close the scan; the first rule that fired anywhere in the text, or None"""
+        self.close()
+        if not self.fired and self.compiled.unscanned:
+            lowered = "".join(self._lowered)
+            self.fired = next(
+                (name for name in self.compiled.unscanned if self.compiled.regexes[name].search(lowered)),
+                None
+            )
+        return self.fired
+
+    def close(self):
+        if self._stream is not None:
+            # close() crashes when handed a scratch, so it uses the database's
+            # own, which must not be shared between threads
+            with self.compiled.close_lock:
+                self._stream.close()
+            self._stream = None
+            if self._hits and not self.fired:
+                self.fired = self.compiled.names[min(self._hits)]
+
+class GuardrailMatcher:
+    """
+    Case-insensitive guardrail rules, precompiled and swapped on reload
+
+    Rules are the built-in ones plus those of ``scope`` ("prompt" or
+    "output") in an optional JSON pattern file (same name overrides), which is
+    checked for changes at most every ``reload_interval_s`` and recompiled when
+    it changes. An invalid file is logged and the previous rules stay in force.
+    """
+
+    def __init__(
+        self,
+        rules: Optional[Dict[str, str]] = None,
+        path: Optional[str] = GUARDRAILS_CONFIG["file"],
+        reload_interval_s: float = GUARDRAILS_CONFIG["reload_interval_s"],
+        scope: str = "prompt"
+    ):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown guardrail scope: {scope}")
+        self.base_rules = dict(DEFAULT_RULES if rules is None else rules)
+        self.scope = scope
+        self.path = path
+        self.reload_interval_s = reload_interval_s
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._compiled = _Compiled(self.base_rules)
+        self.reload_if_changed(force=True)
+
+    @property
+    def rules(self) -> Dict[str, str]:
+        return self._compiled.rules
+
+    def reload_if_changed(self, force: bool = False) -> bool:
+        """Recompile if the pattern file changed; True if the rules were replaced"""
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        with self._lock:
+            self._next_check = now + self.reload_interval_s
+            try:
+                mtime = os.path.getmtime(self.path) if self.path else None
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+
+            try:
+                rules = {**self.base_rules, **(self._read_file() if mtime else {})}
+                compiled = _Compiled(rules)
+            except (OSError, ValueError, KeyError, TypeError, re.error) as e:
+                logger.error(f"Ignoring invalid guardrail file {self.path}: {e}")
+                self._mtime = mtime
+                return False
+
+            self._compiled = compiled
+            self._mtime = mtime
+        logger.info(f"🛡️ Guardrails loaded: {len(rules)} {self.scope} rules")
+        return True
+
+    def _read_file(self) -> Dict[str, str]:
+        with open(self.path) as f:
+            data = json.load(f)
+        # A rule's "scope" is "prompt" (the default), "output" or "both"
+        return {
+            rule["name"]: rule["pattern"] for rule in data.get("rules", [])
+            if rule.get("scope", "prompt") in (self.scope, "both")
+        }
+
+    def matches(self, text: str) -> List[Tuple[str, str]]:
+        """Every match of every rule as (rule name, matched text), in text order"""
+        self.reload_if_changed()
+        compiled = self._compiled
+        lowered = text.lower()
+        found = [
+            (m.start(), name, m.group())
+            for name in compiled.fired(text, lowered)
+            for m in compiled.regexes[name].finditer(lowered)
+        ]
+        return [(name, matched) for _, name, matched in sorted(found)]
+
+    def first_match(self, text: str) -> Optional[str]:
+        """Name of the rule matching earliest in the text, or None"""
+        self.reload_if_changed()
+        compiled = self._compiled
+        lowered = text.lower()
+        first = None
+        for name in compiled.fired(text, lowered):
+            m = compiled.regexes[name].search(lowered)
+            if m and (first is None or m.start() < first[0]):
+                first = (m.start(), name)
+        return first[1] if first else None
+
+    def scanner(self) -> StreamScanner:
+        """A scanner for text that arrives in chunks, bound to the current rules"""
+        self.reload_if_changed()
+        return StreamScanner(self._compiled)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "scope": self.scope,
+            "rules": len(self.rules),
+            "file": self.path if self._mtime else None,
+            "backend": self._compiled.backend
+        }
+
+# The single compiled rule set every sample of every model is scanned with
+output_guardrails = GuardrailMatcher(rules=OUTPUT_RULES, scope="output")
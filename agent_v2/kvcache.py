@@ -0,0 +1,70 @@
+import math
+import logging
+from typing import Dict, Any
+
+from .config import KV_CACHE_CONFIG, MAX_NEW_TOKENS, MAX_PROMPT_CHARS
+from .prompts import SYSTEM_PROMPTS
+
+logger = logging.getLogger(__name__)
+
+# KV cache element types: ggml type id and storage bytes per element
+# (q8_0 / q4_0 store blocks of 32 values in 34 / 18 bytes)
+KV_TYPES = {
+    "f16": {"ggml_type": 1, "bytes": 2.0},
+    "q8_0": {"ggml_type": 8, "bytes": 34 / 32},
+    "q4_0": {"ggml_type": 2, "bytes": 18 / 32},
+}
+
+# Wrapper text around the system prompt and user prompt in LocalLLM
+_TEMPLATE_OVERHEAD = "\n\nPrompt: \nOutput:"
+
+def kv_params(cache_type: str = KV_CACHE_CONFIG["type"]) -> Dict[str, Any]:
+    """llama.cpp parameters selecting the KV cache element type"""
+    if cache_type not in KV_TYPES:
+        raise ValueError(f"Unknown KV cache type: {cache_type} (use one of {', '.join(KV_TYPES)})")
+    if cache_type == "f16":
+        return {}
+    ggml_type = KV_TYPES[cache_type]["ggml_type"]
+    # llama.cpp only supports a quantized V cache with flash attention
+    return {"type_k": ggml_type, "type_v": ggml_type, "flash_attn": True}
+
+def required_context(model_path: str) -> int:
+    """
+    Smallest context that fits the longest system prompt, a maximum-length
+    user prompt and the full generation budget, rounded up to a multiple of
+    ``ctx_align``. Only the tokenizer is loaded (vocab_only), which is fast.
+    """
+    from llama_cpp import Llama
+
+    vocab = Llama(model_path=model_path, vocab_only=True, verbose=False)
+    try:
+        system_tokens = max(
+            len(vocab.tokenize((prompt + _TEMPLATE_OVERHEAD).encode("utf-8")))
+            for prompt in SYSTEM_PROMPTS.values()
+        )
+    finally:
+        vocab.close()
+
+    prompt_tokens = math.ceil(MAX_PROMPT_CHARS / KV_CACHE_CONFIG["prompt_chars_per_token"])
+    needed = system_tokens + prompt_tokens + MAX_NEW_TOKENS
+    align = KV_CACHE_CONFIG["ctx_align"]
+    return int(math.ceil(needed / align) * align)
+
+def kv_cache_bytes(metadata: Dict[str, str], n_ctx: int, cache_type: str) -> int:
+    """KV cache size from GGUF metadata: layers x context x (K + V width) x element size"""
+    arch = metadata.get("general.architecture")
+    if not arch:
+        return 0
+    try:
+        n_layer = int(metadata[f"{arch}.block_count"])
+        n_embd = int(metadata[f"{arch}.embedding_length"])
+        n_head = int(metadata[f"{arch}.attention.head_count"])
+        n_head_kv = int(metadata.get(f"{arch}.attention.head_count_kv", n_head))
+    except (KeyError, ValueError):
+        return 0
+
+    head_dim = n_embd // n_head
+    key_length = int(metadata.get(f"{arch}.attention.key_length", head_dim))
+    value_length = int(metadata.get(f"{arch}.attention.value_length", head_dim))
+    width = n_head_kv * (key_length + value_length)
+    return int(n_layer * n_ctx * width * KV_TYPES[cache_type]["bytes"])
@@ -1,24 +1,120 @@
 import os
+import time
+import queue
 import logging
+import threading
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, closing, ExitStack
+from typing import Dict, Any, List, Optional, Callable
 from llama_cpp import Llama
-from .config import MODEL_PATH, MODEL_PARAMS, NUM_SAMPLES, TEMPERATURES
+from .config import (
+    MODEL_PATH, MODEL_PARAMS, DEFAULT_N_CTX, NUM_SAMPLES, TEMPERATURES, IDLE_CONFIG,
+    PREFETCH_ON_LOAD, MAX_NEW_TOKENS, KV_CACHE_CONFIG, CONTEXT_POOL_CONFIG, GUARDRAILS_CONFIG
+)
+from .loading import start_progress, prefetch
+from .tuning import load_tuning_profile
+from .kvcache import kv_params, required_context, kv_cache_bytes
 from .prompts import SYSTEM_PROMPTS
+from .guardrails import output_guardrails
+from .sandbox import verification_pool
+from .validators import syntax_validator
+from .extract import CodeExtractor
+from .scoring import candidate_scorer, candidate_log
+from .dedup import CandidateClusters
 
 logger = logging.getLogger(__name__)
 
+def context_pool_size() -> int:
+    """Configured number of contexts, or one per ``threads_per_context`` cores"""
+    if CONTEXT_POOL_CONFIG["size"] > 0:
+        return CONTEXT_POOL_CONFIG["size"]
+    cpus = os.cpu_count() or 1
+    return max(1, cpus // max(1, CONTEXT_POOL_CONFIG["threads_per_context"]))
+
+def _context_over(base: Llama) -> Llama:
+    """
+    Another Llama over ``base``'s loaded model: its own KV context, batch and
+    token buffers, the same weights, vocabulary and metadata. Closing it frees
+    only what it owns; ``base`` keeps the model.
+    """
+    import numpy as np
+    from llama_cpp import _internals
+    llm = copy.copy(base)
+    llm._stack = ExitStack()
+    llm._ctx = llm._stack.enter_context(closing(
+        _internals.LlamaContext(model=base._model, params=base.context_params, verbose=base.verbose)
+    ))
+    llm._batch = llm._stack.enter_context(closing(
+        _internals.LlamaBatch(
+            n_tokens=base.n_batch, embd=0, n_seq_max=base.context_params.n_ctx, verbose=base.verbose
+        )
+    ))
+    llm._candidates = _internals.LlamaTokenDataArray(n_vocab=base._n_vocab)
+    llm.input_ids = np.empty_like(base.input_ids)
+    llm.scores = np.empty_like(base.scores)
+    llm.n_tokens = 0
+    llm.cache = None
+    return llm
+
 class LocalLLM:
     """Interface to Qwen2.5-Coder-7B with Self-Consistency"""
     
-    def __init__(self, model_path: str = MODEL_PATH):
+    def __init__(
+        self,
+        model_path: str = MODEL_PATH,
+        model_params: Optional[Dict[str, Any]] = None,
+        min_size_gb: float = 3.0,
+        idle_config: Optional[Dict[str, Any]] = None
+    ):
         """Initialize the local model"""
         logger.info(f" Checking model at {model_path}...")
+        self.model_path = model_path
+        tuned = load_tuning_profile(model_path)
+        if tuned:
+            logger.info(f" Applying tuning profile: {tuned}")
+        self.model_params = {**(model_params or MODEL_PARAMS), **tuned, "model_path": model_path}
+        self.idle_config = idle_config or IDLE_CONFIG
+        
+        # Residency: "ready", "idle" (context released), "unloaded" (weights
+        # released, reloads on demand) or "unavailable"
+        self.state = "unavailable"
+        self.last_used = time.time()
+        self._active = 0
+        self._lock = threading.RLock()
+        self._stop_idle = threading.Event()
+        
+        # Context pool: the model is loaded once and every further context is
+        # created over it, so weights live once and only KV memory is per
+        # context. self.llm is the first context (it owns the model), also
+        # used for tokenization.
+        self.num_contexts = context_pool_size()
+        self.contexts: List[Llama] = []
+        self._free_contexts: "queue.Queue[Llama]" = queue.Queue()
+        self.llm = None
+        if self.num_contexts > 1:
+            # Split the cores between contexts. A tuning profile measured one
+            # context with the whole host to itself, so its thread counts are
+            # split the same way rather than used by every context.
+            for key in ("n_threads", "n_threads_batch"):
+                total = tuned.get(key, os.cpu_count() or 1)
+                self.model_params[key] = max(1, total // self.num_contexts)
+                if key in tuned:
+                    logger.info(
+                        f" Context pool of {self.num_contexts}: tuned {key}={total} "
+                        f"split to {self.model_params[key]} per context"
+                    )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_contexts, thread_name_prefix="llm-sample"
+        )
+        # Moving average of one complete sample's decode time, for deadlines
+        self.sample_time_s: Optional[float] = None
         
         # Check if model file exists
         if not os.path.exists(model_path):
             logger.error(f"Model file not found at: {model_path}")
             logger.error(f"Please ensure the model file exists in the correct location")
             logger.info(f"Download from: https://huggingface.co/Qwen/Qwen2.5-Coder-7B-Instruct-GGUF")
-            self.llm = None
             self.is_available = False
             return
         
@@ -26,163 +122,603 @@ class LocalLLM:
         file_size_gb = os.path.getsize(model_path) / (1024**3)
         logger.info(f"Model file size: {file_size_gb:.2f} GB")
         
-        if file_size_gb < 3.0:
+        if file_size_gb < min_size_gb:
             logger.warning(f"  Model file seems too small ({file_size_gb:.2f} GB). It may be corrupted.")
         
-        try:
-            logger.info(" Loading model... This may take 1-2 minutes...")
-            self.llm = Llama(**MODEL_PARAMS)
-            self.is_available = True
+        # KV cache: element type and a context sized to actual needs
+        self.kv_cache_type = KV_CACHE_CONFIG["type"]
+        self.model_params.update(kv_params(self.kv_cache_type))
+        if KV_CACHE_CONFIG["auto_ctx"]:
+            try:
+                required = required_context(model_path)
+            except Exception as e:
+                logger.warning(f"  Could not size context automatically: {e}")
+            else:
+                # A tuned or explicitly configured n_ctx wins when it fits
+                configured, source = tuned.get("n_ctx"), "tuning profile"
+                explicit = (model_params or MODEL_PARAMS).get("n_ctx", DEFAULT_N_CTX)
+                if configured is None and explicit != DEFAULT_N_CTX:
+                    configured, source = explicit, "model params"
+                if configured is None:
+                    n_ctx, source = required, "auto"
+                elif configured >= required:
+                    n_ctx = configured
+                else:
+                    n_ctx, source = required, f"auto ({source} n_ctx={configured} is too small)"
+                self.model_params["n_ctx"] = n_ctx
+                logger.info(f" Context size {n_ctx} from {source} (needed: {required})")
+        
+        logger.info(" Loading model... This may take 1-2 minutes...")
+        self.is_available = self._load()
+        if self.is_available:
             logger.info(" Model loaded successfully!")
+            logger.info(
+                f" KV cache: n_ctx={self.model_params.get('n_ctx')}, type={self.kv_cache_type}, "
+                f"{self.kv_cache_bytes() / 1024**2:.0f} MB"
+            )
+            if self.idle_config["timeout_s"] > 0:
+                threading.Thread(
+                    target=self._idle_loop, name="llm-idle", daemon=True
+                ).start()
+    
+    def _load(self) -> bool:
+        """Create the llama.cpp model and context"""
+        progress = start_progress(self.model_path)
+        stop_prefetch = threading.Event()
+        if PREFETCH_ON_LOAD:
+            threading.Thread(
+                target=prefetch, args=(progress, stop_prefetch),
+                name="llm-prefetch", daemon=True
+            ).start()
+        
+        try:
+            base = Llama(**self.model_params)
+            self.contexts = [base]
+            self.contexts.extend(_context_over(base) for _ in range(self.num_contexts - 1))
+            self.llm = base
+            self._free_contexts = queue.Queue()
+            for llm in self.contexts:
+                self._free_contexts.put(llm)
+            self.state = "ready"
+            progress.phase = "ready"
+            progress.finished = time.time()
+            return True
         except Exception as e:
+            stop_prefetch.set()
+            progress.phase = "failed"
+            progress.error = str(e)
+            progress.finished = time.time()
             logger.error(f" Error loading model: {e}")
             logger.error("Possible issues:")
             logger.error("  1. Insufficient RAM (need ~8GB for 7B model)")
             logger.error("  2. Corrupted model file - try re-downloading")
             logger.error("  3. Incompatible model format")
-            self.llm = None
+            self._close_llm()
+            self.state = "unavailable"
+            return False
+    
+    def unload(self):
+        """Free the model weights and contexts"""
+        self._stop_idle.set()
+        with self._lock:
+            if self.contexts:
+                logger.info(f" Unloading model {self.model_path}")
+                self._close_llm()
             self.is_available = False
+            self.state = "unavailable"
+        self._executor.shutdown(wait=False)
+    
+    def _close_llm(self):
+        """Close the llama.cpp objects of every context; holds the lock"""
+        # The first context owns the model, so it goes last
+        for llm in reversed(self.contexts):
+            ctx = getattr(llm, "_ctx", None)
+            if ctx is not None and hasattr(ctx, "close"):
+                # A context recreated after an idle period is not owned by Llama
+                ctx.close()
+            if hasattr(llm, "close"):
+                llm.close()
+        self.contexts = []
+        self._free_contexts = queue.Queue()
+        self.llm = None
+    
+    def after_fork(self, num_cores: Optional[int] = None):
+        """
+        Re-create per-process state in a forked worker
+        
+        Threads, locks and the sample executor do not survive fork(). The KV
+        contexts are rebuilt so each worker owns private ones instead of
+        copy-on-write pages of the parent's; the mmapped weights stay shared.
+        """
+        self._lock = threading.RLock()
+        self._stop_idle = threading.Event()
+        self._active = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_contexts, thread_name_prefix="llm-sample"
+        )
+        
+        if num_cores:
+            threads = max(1, num_cores // self.num_contexts)
+            self.model_params.update(n_threads=threads, n_threads_batch=threads)
+            for llm in self.contexts:
+                if hasattr(llm, "context_params"):
+                    llm.context_params.n_threads = threads
+                    llm.context_params.n_threads_batch = threads
+                llm.n_threads = threads
+                llm.n_threads_batch = threads
+        
+        if self.state == "ready" and self._release_context():
+            self._restore_context()
+        
+        self._free_contexts = queue.Queue()
+        for llm in self.contexts:
+            self._free_contexts.put(llm)
+        
+        if self.is_available and self.idle_config["timeout_s"] > 0:
+            threading.Thread(target=self._idle_loop, name="llm-idle", daemon=True).start()
+    
+    @contextmanager
+    def _checkout(self):
+        """Borrow a free context for the duration of one sample"""
+        free_contexts = self._free_contexts
+        llm = free_contexts.get()
+        try:
+            yield llm
+        finally:
+            free_contexts.put(llm)
+    
+    def kv_cache_bytes(self) -> int:
+        """Bytes allocated for the KV caches of the live contexts (0 when released)"""
+        if not self.contexts or self.state != "ready":
+            return 0
+        return sum(
+            kv_cache_bytes(llm.metadata, llm.n_ctx(), self.kv_cache_type)
+            for llm in self.contexts
+        )
+    
+    # ------------------------------------------------------------------
+    # Idle policy
+    # ------------------------------------------------------------------
+    
+    @contextmanager
+    def _in_use(self):
+        """Mark a generation in flight, reloading the model if it went idle"""
+        with self._lock:
+            self._active += 1
+            try:
+                self._ensure_loaded()
+            except Exception:
+                self._active -= 1
+                raise
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self.last_used = time.time()
+    
+    def _ensure_loaded(self):
+        """Restore whatever the idle policy released; holds the lock"""
+        start = time.perf_counter()
+        if self.state == "idle":
+            try:
+                self._restore_context()
+                logger.info(f" Context restored after idle in {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                logger.warning(f" Context restore failed ({e}), reloading model")
+                self._close_llm()
+                self.state = "unloaded"
+        
+        if self.state == "unloaded":
+            if not self._load():
+                self.is_available = False
+                raise RuntimeError("Model reload after idle failed")
+            logger.info(f" Model reloaded after idle in {time.perf_counter() - start:.2f}s")
+    
+    def _idle_loop(self):
+        """Background check that releases memory after the idle timeout"""
+        while not self._stop_idle.wait(self.idle_config["check_interval_s"]):
+            self.release_if_idle()
+    
+    def release_if_idle(self) -> bool:
+        """Release the context (and optionally weights) if idle long enough"""
+        with self._lock:
+            idle_for = time.time() - self.last_used
+            if (self.state != "ready" or self._active
+                    or idle_for < self.idle_config["timeout_s"]):
+                return False
+            
+            if self.idle_config["unload_weights"] or not self._release_context():
+                # Weights are mmapped: the page cache keeps them warm for reload
+                self._close_llm()
+                self.state = "unloaded"
+            else:
+                self.state = "idle"
+        
+        logger.info(f"💤 Model idle for {idle_for:.0f}s - released memory (state: {self.state})")
+        return True
+    
+    def _release_context(self) -> bool:
+        """Free only the KV contexts, keeping weights mapped; False if unsupported"""
+        for llm in self.contexts:
+            ctx = getattr(llm, "_ctx", None)
+            if ctx is None or not hasattr(ctx, "close") or not hasattr(llm, "context_params"):
+                return False
+        for llm in self.contexts:
+            llm._ctx.close()
+        return True
+    
+    def _restore_context(self):
+        """Recreate the KV contexts over the still-loaded weights"""
+        from llama_cpp import _internals
+        for llm in self.contexts:
+            llm._ctx = _internals.LlamaContext(
+                model=llm._model,
+                params=llm.context_params,
+                verbose=llm.verbose
+            )
+            llm.n_tokens = 0
+        self.state = "ready"
+    
+    # ------------------------------------------------------------------
+    # Generation
+    # ------------------------------------------------------------------
+    
+    def warm_up(self, language: str = "python", max_tokens: int = 8) -> float:
+        """Run a tiny generation to fault in weights and caches; returns seconds taken"""
+        if not self.is_available:
+            return 0.0
+        
+        system_prompt = SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS["python"])
+        with self._in_use():
+            # Warm every context of the pool in parallel
+            def run(_):
+                with self._checkout() as llm:
+                    llm(
+                        f"{system_prompt}\n\nPrompt: add two numbers\nOutput:",
+                        max_tokens=max_tokens,
+                        temperature=0.0,
+                        echo=False
+                    )
+            
+            start = time.perf_counter()
+            list(self._executor.map(run, range(self.num_contexts)))
+            elapsed = time.perf_counter() - start
+        logger.info(f" Warm-up ({language}) took {elapsed:.2f}s")
+        return elapsed
     
     def generate_with_self_consistency(
         self, 
         prompt: str, 
         language: str,
-        num_samples: int = NUM_SAMPLES
+        num_samples: int = NUM_SAMPLES,
+        deadline: Optional[float] = None,
+        cancel: Optional[threading.Event] = None
     ) -> str:
         """Generate code using self-consistency prompting"""
+        return self.generate(prompt, language, num_samples, deadline, cancel)['code']
+    
+    def generate(
+        self,
+        prompt: str,
+        language: str,
+        num_samples: int = NUM_SAMPLES,
+        deadline: Optional[float] = None,
+        cancel: Optional[threading.Event] = None,
+        on_sample: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run self-consistency sampling and return the best candidate
+        
+        With a ``deadline`` (a time.time() timestamp), new samples start only
+        while the remaining time covers a typical sample, and running samples
+        stop at the deadline; the best candidate so far is returned with
+        ``partial`` set.
         
-        if not self.is_available or not self.llm:
+        Setting ``cancel`` (e.g. when the client disconnects) stops running
+        samples at the next token and skips those not yet started; the
+        discarded work is reported in the result. ``on_sample(done, total)``
+        is called as samples finish, for progress reporting.
+        
+        Returns:
+            Dictionary with the best code, its score, the number of samples
+            that survived extraction/syntax checks, whether the fallback
+            template was used, whether the result is partial or cancelled,
+            and the cancelled work (samples stopped/skipped, tokens discarded)
+        """
+        
+        if not self.is_available:
             logger.warning("  LLM not available, using fallback template")
-            return self._fallback_code(prompt, language)
+            return self._fallback_result(prompt, language, num_samples)
+        
+        try:
+            with self._in_use():
+                return self._generate(prompt, language, num_samples, deadline, cancel, on_sample)
+        except RuntimeError as e:
+            logger.error(f" {e}, using fallback template")
+            return self._fallback_result(prompt, language, num_samples)
+    
+    def _generate(self, prompt: str, language: str, num_samples: int,
+                  deadline: Optional[float] = None,
+                  cancel: Optional[threading.Event] = None,
+                  on_sample: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Self-consistency sampling loop; the model is loaded and marked in use"""
         
         logger.info(f"Generating {num_samples} {language} solutions...")
         
         solutions = []
         system_prompt = SYSTEM_PROMPTS.get(language, SYSTEM_PROMPTS["python"])
         
-        for i in range(num_samples):
-            temp = TEMPERATURES[i % len(TEMPERATURES)]
-            
-            full_prompt = f"""{system_prompt}
+        full_prompt = f"""{system_prompt}
 
 Prompt: {prompt}
 Output:"""
-            
+        
+        # Keep prompt + generation inside the (right-sized) context
+        prompt_tokens = len(self.llm.tokenize(full_prompt.encode("utf-8")))
+        max_tokens = min(MAX_NEW_TOKENS, self.llm.n_ctx() - prompt_tokens)
+        if max_tokens <= 0:
+            logger.warning(f"Prompt ({prompt_tokens} tokens) does not fit the context")
+            return self._fallback_result(prompt, language, num_samples)
+        
+        progress = {
+            "started": 0, "cut_short": False, "tokens": 0,
+            "samples_stopped": 0, "samples_skipped": 0, "tokens_discarded": 0,
+            "blocked_rules": []
+        }
+        progress_lock = threading.Lock()
+        # Near-duplicate clusters, filled in as samples finish
+        clusters = CandidateClusters()
+        
+        def cancelled() -> bool:
+            return cancel is not None and cancel.is_set()
+        
+        def may_start(claim: bool = True) -> bool:
+            """
+            Start a sample only if it can finish before the deadline; the first
+            always starts. Checked before waiting for a context, so a stopped
+            request's queued samples never hold one, and again, with ``claim``
+            recording the start, once a context is free
+            """
+            with progress_lock:
+                if cancelled():
+                    progress["samples_skipped"] += 1
+                    return False
+                if deadline is not None and progress["started"]:
+                    if deadline - time.time() < (self.sample_time_s or 0.0):
+                        progress["cut_short"] = True
+                        return False
+                if claim:
+                    progress["started"] += 1
+                return True
+        
+        def run_sample(i: int) -> Optional[Dict[str, Any]]:
             try:
-                response = self.llm(
-                    full_prompt,
-                    max_tokens=1500,
-                    temperature=temp,
-                    top_p=0.9,
-                    repeat_penalty=1.15,
-                    echo=False,
-                    stop=["Prompt:", "\n\n\n\n"]
-                )
+                if not may_start(claim=False):
+                    return None
+                with self._checkout() as llm:
+                    if not may_start():
+                        return None
+                    
+                    # Hotter than scheduled if the samples so far mostly repeat each other
+                    temp = clusters.steer_temperature(TEMPERATURES[i % len(TEMPERATURES)])
+                    start = time.time()
+                    chunks = []
+                    # Fences and the start of code are found line by line as
+                    # the sample streams, not by rescanning it at the end
+                    extractor = CodeExtractor(language)
+                    finished = True
+                    blocked = None
+                    # Output rules are checked token by token so an offending
+                    # sample stops decoding as soon as it matches
+                    scanner = output_guardrails.scanner() if GUARDRAILS_CONFIG["scan_output"] else None
+                    stream = llm(
+                        full_prompt,
+                        max_tokens=max_tokens,
+                        temperature=temp,
+                        top_p=0.9,
+                        repeat_penalty=1.15,
+                        echo=False,
+                        stop=["Prompt:", "\n\n\n\n"],
+                        stream=True
+                    )
+                    try:
+                        for chunk in stream:
+                            text = chunk['choices'][0]['text']
+                            chunks.append(text)
+                            extractor.feed(text)
+                            if scanner is not None and scanner.feed(text):
+                                break
+                            if cancelled():
+                                finished = False
+                                break
+                            if deadline is not None and time.time() >= deadline:
+                                finished = False
+                                break
+                    finally:
+                        stream.close()
+                        if scanner is not None:
+                            blocked = scanner.finish()
+                
+                # Stream chunks are single tokens
+                with progress_lock:
+                    progress["tokens"] += len(chunks)
                 
-                code = self._extract_code(response['choices'][0]['text'].strip(), language)
+                if cancelled():
+                    with progress_lock:
+                        progress["samples_stopped"] += 1
+                        progress["tokens_discarded"] += len(chunks)
+                    return None
+                
+                if blocked:
+                    with progress_lock:
+                        progress["blocked_rules"].append(blocked)
+                    logger.warning(
+                        f"🛡️ Sample {i+1}/{num_samples} dropped after {len(chunks)} tokens: "
+                        f"matched output rule '{blocked}'"
+                    )
+                    return None
+                
+                if finished:
+                    self._record_sample_time(time.time() - start)
+                else:
+                    with progress_lock:
+                        progress["cut_short"] = True
+                    logger.info(f"Sample {i+1}/{num_samples} stopped at the deadline")
+                
+                code = self._extract_code(extractor, language)
                 
                 if code:
-                    score = self._score_code(code, prompt, language)
-                    solutions.append({
+                    cluster, duplicate = clusters.add(code)
+                    # A near-duplicate takes its representative's verdict when
+                    # there is one already
+                    verdict = clusters.verdict(cluster) if duplicate else None
+                    if verdict is None:
+                        # Run complete samples' smoke tests; a sample cut short
+                        # at the deadline is ranked on its static score alone
+                        verdict = verification_pool.verify(code, language) if finished else {"status": "skipped"}
+                        if not duplicate:
+                            clusters.set_verdict(cluster, verdict)
+                    logger.info(
+                        f"Sample {i+1}/{num_samples} generated (temperature: {temp:.1f}, "
+                        f"cluster: {cluster}{', duplicate' if duplicate else ''}, "
+                        f"verification: {verdict['status']})"
+                    )
+                    return {
                         'code': code,
-                        'score': score,
-                        'sample': i + 1
-                    })
-                    logger.info(f"Sample {i+1}/{num_samples} generated (score: {score:.2f})")
+                        'sample': i + 1,
+                        'cluster': cluster,
+                        'verification': verdict["status"],
+                        'adjustment': verification_pool.score_adjustment(verdict)
+                    }
             
             except Exception as e:
                 logger.warning(f"Sample {i+1} failed: {e}")
-                continue
+            return None
+        
+        # Samples decode in parallel, one per free context of the pool
+        for done, solution in enumerate(self._executor.map(run_sample, range(num_samples)), 1):
+            if solution is not None:
+                solutions.append(solution)
+            if on_sample:
+                on_sample(done, num_samples)
+        
+        cancel_counts = {
+            key: progress[key] for key in ("samples_stopped", "samples_skipped", "tokens_discarded")
+        }
+        if cancelled():
+            logger.info(
+                f"Generation cancelled: {cancel_counts['samples_stopped']} samples stopped, "
+                f"{cancel_counts['samples_skipped']} skipped, "
+                f"{cancel_counts['tokens_discarded']} tokens discarded"
+            )
+            return {
+                **self._fallback_result(prompt, language, num_samples, completion_tokens=progress["tokens"]),
+                'cancelled': True,
+                **cancel_counts
+            }
+        
+        partial = progress["cut_short"]
+        if partial:
+            logger.info(f"Deadline reached after {progress['started']}/{num_samples} samples")
         
         if not solutions:
             logger.warning("All samples failed, using fallback template")
-            return self._fallback_code(prompt, language)
-        
-        best = max(solutions, key=lambda x: x['score'])
-        logger.info(f" Best solution: Sample {best['sample']} (score: {best['score']:.2f})")
+            return {
+                **self._fallback_result(prompt, language, num_samples, partial, progress["tokens"]),
+                'blocked_rules': progress["blocked_rules"]
+            }
         
-        return best['code']
-    
-    def _extract_code(self, response: str, language: str) -> str:
-        """Extract valid code from response"""
+        # One representative (the first to finish) per near-duplicate cluster
+        representatives: Dict[int, Dict[str, Any]] = {}
+        for solution in solutions:
+            representative = representatives.setdefault(solution['cluster'], solution)
+            representative['cluster_size'] = representative.get('cluster_size', 0) + 1
+        distinct = list(representatives.values())
         
-        if not response:
-            return ""
+        # Distinct candidates are scored together, with their cluster's share
+        # as the consensus feature; duplicates take their representative's score
+        rows = candidate_scorer.features(
+            [s['code'] for s in distinct], prompt, [s['cluster_size'] for s in distinct]
+        )
+        for representative, score in zip(distinct, candidate_scorer.apply(rows)):
+            representative['base_score'] = score
+        for solution in solutions:
+            representative = representatives[solution['cluster']]
+            solution['cluster_size'] = representative['cluster_size']
+            solution['score'] = max(0.0, representative['base_score'] + solution['adjustment'])
+        logger.info(
+            f"{len(solutions)} candidates in {len(distinct)} clusters; scores: "
+            + ", ".join(f"sample {s['sample']}: {s['score']:.2f}" for s in solutions)
+        )
         
-        # Remove markdown
-        for marker in ["```python", "```javascript", "```java", "```cpp", "```c", "```sql", "```"]:
-            if marker in response:
-                start = response.find(marker) + len(marker)
-                end = response.find("```", start)
-                if end != -1:
-                    response = response[start:end].strip()
-        
-        lines = response.split('\n')
-        code_lines = []
-        found_code = False
-        
-        for line in lines:
-            if not found_code:
-                if any(line.strip().startswith(kw) for kw in ['def ', 'class ', 'function', 'import ', 'from ', 'public ', '#include', 'SELECT', 'CREATE']):
-                    found_code = True
-                else:
-                    continue
-            code_lines.append(line)
+        # Ties go to the larger cluster
+        best = max(solutions, key=lambda x: (x['score'], x['cluster_size']))
+        logger.info(
+            f" Best solution: Sample {best['sample']} "
+            f"(score: {best['score']:.2f}, cluster of {best['cluster_size']})"
+        )
+        # Outcomes for training the ranker; the id ties user feedback to this ranking
+        generation_id = candidate_log.record(
+            language, os.path.basename(self.model_path), distinct, rows,
+            representatives[best['cluster']]['sample']
+        )
         
-        code = '\n'.join(code_lines).strip()
+        return {
+            'code': best['code'],
+            'score': best['score'],
+            'sample': best['sample'],
+            'valid_samples': len(solutions),
+            'num_samples': num_samples,
+            'fallback': False,
+            'partial': partial,
+            'cancelled': False,
+            'completion_tokens': progress["tokens"],
+            'blocked_rules': progress["blocked_rules"],
+            'verification': best['verification'],
+            'generation_id': generation_id,
+            # Near-duplicate cluster sizes, largest first
+            'clusters': sorted((s['cluster_size'] for s in distinct), reverse=True)
+        }
+    
+    def _record_sample_time(self, elapsed: float):
+        """Fold a complete sample's duration into the moving average"""
+        with self._lock:
+            if self.sample_time_s is None:
+                self.sample_time_s = elapsed
+            else:
+                self.sample_time_s = 0.8 * self.sample_time_s + 0.2 * elapsed
+    
+    def _fallback_result(self, prompt: str, language: str, num_samples: int,
+                         partial: bool = False, completion_tokens: int = 0) -> Dict[str, Any]:
+        """Wrap the fallback template in a generation result"""
+        return {
+            'code': self._fallback_code(prompt, language),
+            'score': 0.0,
+            'sample': None,
+            'valid_samples': 0,
+            'num_samples': num_samples,
+            'fallback': True,
+            'partial': partial,
+            'cancelled': False,
+            'completion_tokens': completion_tokens
+        }
+    
+    def _extract_code(self, extractor: CodeExtractor, language: str) -> str:
+        """Extract valid code from a sample streamed into ``extractor``"""
         
-        if not code or len(code) < 15:
+        code = extractor.finish()
+        if not code:
             return ""
         
-        bad_patterns = ['TODO', 'FIXME', 'placeholder', 'implement', 'pass  #']
-        if any(p.lower() in code.lower() for p in bad_patterns):
+        # Compiler/parser check for the language; invalid candidates never reach ranking
+        valid, message = syntax_validator.validate(code, language)
+        if not valid:
+            logger.debug(f"Candidate failed the {language} syntax check: {message}")
             return ""
         
-        if language == "python":
-            try:
-                import ast
-                ast.parse(code)
-                return code
-            except SyntaxError:
-                return ""
-        
         return code
     
-    def _score_code(self, code: str, prompt: str, language: str) -> float:
-        """Score code quality"""
-        
-        score = 0.0
-        length = len(code)
-        
-        if 50 < length < 1000:
-            score += 2.0
-        elif 30 < length < 1500:
-            score += 1.0
-        
-        if 'def ' in code or 'function' in code or 'class ' in code:
-            score += 3.0
-        
-        if 'return ' in code:
-            score += 2.0
-        
-        if '"""' in code or "'''" in code or '//' in code or '--' in code:
-            score += 1.0
-        
-        logic_keywords = ['if ', 'for ', 'while ', 'try:', 'with ', 'SELECT', 'WHERE']
-        if any(kw in code for kw in logic_keywords):
-            score += 2.0
-        
-        for pattern in ['TODO', 'FIXME', 'pass\n', '...']:
-            if pattern in code:
-                score -= 5.0
-        
-        prompt_words = [w for w in prompt.lower().split() if len(w) > 3]
-        code_lower = code.lower()
-        matches = sum(1 for word in prompt_words if word in code_lower)
-        score += matches * 0.5
-        
-        return max(0.0, score)
-    
     def _fallback_code(self, prompt: str, language: str) -> str:
         """Generate fallback code based on language templates"""
         
@@ -0,0 +1,150 @@
+import os
+import time
+import struct
+import logging
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+GGUF_MAGIC = b"GGUF"
+
+# GGUF metadata value types -> struct format (None: variable length)
+_GGUF_SCALARS = {
+    0: "<B", 1: "<b", 2: "<H", 3: "<h", 4: "<I", 5: "<i",
+    6: "<f", 7: "<?", 10: "<Q", 11: "<q", 12: "<d"
+}
+_GGUF_STRING = 8
+_GGUF_ARRAY = 9
+
+PREFETCH_CHUNK_BYTES = 64 * 1024 * 1024
+
+class LoadProgress:
+    """Progress of one model load, readable from other threads"""
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self.phase = "pending"
+        self.bytes_total = os.path.getsize(model_path) if os.path.exists(model_path) else 0
+        self.bytes_mapped = 0
+        self.layers_total = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def layers_loaded(self) -> int:
+        """Estimated from bytes paged in; layers are roughly equal in size"""
+        if self.phase == "ready":
+            return self.layers_total
+        if not self.bytes_total:
+            return 0
+        return int(self.layers_total * self.bytes_mapped / self.bytes_total)
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = None
+        if self.started is not None:
+            elapsed = round((self.finished or time.time()) - self.started, 1)
+        return {
+            "model_path": self.model_path,
+            "phase": self.phase,
+            "bytes_total": self.bytes_total,
+            "bytes_mapped": self.bytes_mapped,
+            "percent": round(100 * self.bytes_mapped / self.bytes_total, 1) if self.bytes_total else 0.0,
+            "layers_total": self.layers_total,
+            "layers_loaded": self.layers_loaded,
+            "elapsed_s": elapsed,
+            "error": self.error
+        }
+
+_progress: Dict[str, LoadProgress] = {}
+_progress_lock = threading.Lock()
+
+def start_progress(model_path: str) -> LoadProgress:
+    """Create (or reset) the progress record for a model load"""
+    progress = LoadProgress(model_path)
+    progress.started = time.time()
+    progress.phase = "loading"
+    try:
+        progress.layers_total = read_block_count(model_path) or 0
+    except Exception as e:
+        logger.debug(f"Could not read GGUF metadata from {model_path}: {e}")
+    with _progress_lock:
+        _progress[model_path] = progress
+    return progress
+
+def load_status() -> Dict[str, Any]:
+    """Progress of every model load seen by this process"""
+    with _progress_lock:
+        return {path: progress.to_dict() for path, progress in _progress.items()}
+
+def prefetch(progress: LoadProgress, stop: Optional[threading.Event] = None):
+    """
+    Read the model file sequentially to pull it into the page cache
+
+    Runs alongside ``Llama()`` so its mmap page faults hit warm pages instead
+    of random disk reads, and doubles as the bytes-mapped progress counter.
+    """
+    buffer = bytearray(PREFETCH_CHUNK_BYTES)
+    view = memoryview(buffer)
+    with open(progress.model_path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while stop is None or not stop.is_set():
+            n = f.readinto(view)
+            if not n:
+                break
+            progress.bytes_mapped += n
+
+def read_block_count(model_path: str) -> Optional[int]:
+    """Read ``<architecture>.block_count`` (the layer count) from a GGUF header"""
+    with open(model_path, "rb") as f:
+        if f.read(4) != GGUF_MAGIC:
+            return None
+        version, = struct.unpack("<I", f.read(4))
+        if version < 2:
+            return None
+        _tensor_count, kv_count = struct.unpack("<QQ", f.read(16))
+
+        architecture = None
+        block_counts = {}
+        for _ in range(kv_count):
+            key = _read_string(f)
+            value_type, = struct.unpack("<I", f.read(4))
+            wanted = key == "general.architecture" or key.endswith(".block_count")
+            value = _read_value(f, value_type, skip=not wanted)
+
+            if key == "general.architecture":
+                architecture = value
+            elif wanted:
+                block_counts[key] = value
+
+            if architecture and f"{architecture}.block_count" in block_counts:
+                return int(block_counts[f"{architecture}.block_count"])
+    return None
+
+def _read_string(f) -> str:
+    length, = struct.unpack("<Q", f.read(8))
+    return f.read(length).decode("utf-8", errors="replace")
+
+def _read_value(f, value_type: int, skip: bool = False):
+    """Read one metadata value, seeking past it when ``skip`` is set"""
+    if value_type in _GGUF_SCALARS:
+        fmt = _GGUF_SCALARS[value_type]
+        data = f.read(struct.calcsize(fmt))
+        return None if skip else struct.unpack(fmt, data)[0]
+    if value_type == _GGUF_STRING:
+        if skip:
+            length, = struct.unpack("<Q", f.read(8))
+            f.seek(length, os.SEEK_CUR)
+            return None
+        return _read_string(f)
+    if value_type == _GGUF_ARRAY:
+        item_type, count = struct.unpack("<IQ", f.read(12))
+        if item_type in _GGUF_SCALARS:
+            f.seek(count * struct.calcsize(_GGUF_SCALARS[item_type]), os.SEEK_CUR)
+        else:
+            for _ in range(count):
+                _read_value(f, item_type, skip=True)
+        return None
+    raise ValueError(f"Unknown GGUF value type: {value_type}")
@@ -0,0 +1,368 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+from .config import (
+    MODEL_REGISTRY, DEFAULT_MODEL, LANGUAGE_MODELS,
+    MODEL_MEMORY_BUDGET_GB, MODEL_OVERHEAD_GB, MODEL_LOAD_WAIT_S
+)
+from .llm import LocalLLM
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+class _ResidentModel:
+    """A loaded model and its bookkeeping"""
+    
+    def __init__(self, name: str, llm: LocalLLM, size_bytes: int):
+        self.name = name
+        self.llm = llm
+        self.size_bytes = size_bytes
+        self.refs = 0
+        self.last_used = time.time()
+
+class ModelRegistry:
+    """
+    Loads GGUF models on demand and keeps them within a RAM budget
+    
+    Callers ``acquire`` a model by name (or ``lease`` it as a context manager)
+    and ``release`` it when done. Models with no outstanding references are
+    evicted least-recently-used first whenever a load would exceed the budget.
+    """
+    
+    def __init__(
+        self,
+        models: Optional[Dict[str, Dict[str, Any]]] = None,
+        budget_gb: float = MODEL_MEMORY_BUDGET_GB
+    ):
+        self.models = dict(models if models is not None else MODEL_REGISTRY)
+        self.budget_bytes = int(budget_gb * GB)
+        self._cond = threading.Condition()
+        self._resident: "OrderedDict[str, _ResidentModel]" = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        # Models replaced by a hot swap, still serving in-flight requests
+        self._retired: List[_ResidentModel] = []
+        self.swaps: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"loads": 0, "failed_loads": 0, "evictions": 0, "hits": 0, "swaps": 0}
+    
+    # ------------------------------------------------------------------
+    # Selection
+    # ------------------------------------------------------------------
+    
+    def has_model(self, name: str) -> bool:
+        """Whether a model is registered and its file is present"""
+        spec = self.models.get(name)
+        return spec is not None and os.path.exists(spec["model_path"])
+    
+    def select(self, language: str, model: Optional[str] = None) -> str:
+        """Pick the model for a request: explicit name, language default, global default"""
+        if model:
+            if model not in self.models:
+                raise ValueError(f"Unknown model: {model}")
+            return model
+        return LANGUAGE_MODELS.get(language, DEFAULT_MODEL)
+    
+    # ------------------------------------------------------------------
+    # Reference counting
+    # ------------------------------------------------------------------
+    
+    def acquire(self, name: str) -> LocalLLM:
+        """Return a loaded model, loading (and evicting) as needed; +1 reference"""
+        if name not in self.models:
+            raise ValueError(f"Unknown model: {name}")
+        
+        with self._cond:
+            while True:
+                entry = self._resident.get(name)
+                if entry is not None:
+                    entry.refs += 1
+                    entry.last_used = time.time()
+                    self._resident.move_to_end(name)
+                    self.stats["hits"] += 1
+                    return entry.llm
+                
+                pending = self._loading.get(name)
+                if pending is None:
+                    break
+                # Another thread is loading this model - wait for it
+                self._cond.wait()
+            
+            # Claimed before making room: _make_room may wait on the condition,
+            # and a concurrent acquire must wait for this load, not start its own
+            self._loading[name] = threading.Event()
+            try:
+                size_bytes = self._estimate_bytes(name)
+                self._make_room(size_bytes)
+            except BaseException:
+                self._loading.pop(name).set()
+                self._cond.notify_all()
+                raise
+        
+        llm = None
+        try:
+            spec = self.models[name]
+            llm = LocalLLM(
+                spec["model_path"],
+                spec.get("params"),
+                min_size_gb=spec.get("min_size_gb", 3.0)
+            )
+        finally:
+            with self._cond:
+                self._loading.pop(name).set()
+                if llm is not None and not llm.is_available:
+                    # Not kept resident: the caller falls back to templates and
+                    # the next acquire tries loading again
+                    logger.warning(f"Model {name} failed to load - will retry on next use")
+                    self.stats["failed_loads"] += 1
+                    llm.unload()
+                elif llm is not None:
+                    # Replace the overhead estimate with the real KV cache size
+                    kv_bytes = llm.kv_cache_bytes()
+                    if kv_bytes:
+                        size_bytes = size_bytes - int(MODEL_OVERHEAD_GB * GB) + kv_bytes
+                    entry = _ResidentModel(name, llm, size_bytes)
+                    entry.refs = 1
+                    self._resident[name] = entry
+                    self.stats["loads"] += 1
+                self._cond.notify_all()
+        
+        return llm
+    
+    def release(self, llm: LocalLLM):
+        """Drop one reference to a model acquired earlier"""
+        drained = None
+        with self._cond:
+            entry = self._find_entry(llm)
+            if entry is None:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            entry.last_used = time.time()
+            if entry.refs == 0 and entry in self._retired:
+                self._retired.remove(entry)
+                drained = entry
+            self._cond.notify_all()
+        
+        if drained is not None:
+            self._free_retired(drained)
+    
+    def _find_entry(self, llm: LocalLLM) -> Optional[_ResidentModel]:
+        """Locate the resident or retired entry owning ``llm``; holds the lock"""
+        for entry in list(self._resident.values()) + self._retired:
+            if entry.llm is llm:
+                return entry
+        return None
+    
+    @contextmanager
+    def lease(self, name: str):
+        """Context manager around acquire/release"""
+        llm = self.acquire(name)
+        try:
+            yield llm
+        finally:
+            self.release(llm)
+    
+    def preload(self, name: str) -> LocalLLM:
+        """Load a model so it is resident, without holding a reference"""
+        with self.lease(name) as llm:
+            return llm
+    
+    # ------------------------------------------------------------------
+    # Hot swap
+    # ------------------------------------------------------------------
+    
+    def begin_swap(self, name: str, model_path: str) -> Dict[str, Any]:
+        """
+        Record a new swap of ``name`` and return its progress record
+        
+        Checking for a running swap and recording the new one happen under
+        the lock, so concurrent callers cannot both start a swap. Raises
+        RuntimeError while another swap of the model is loading or warming.
+        """
+        if name not in self.models:
+            raise ValueError(f"Unknown model: {name}")
+        
+        with self._cond:
+            current = self.swaps.get(name)
+            if current and current["state"] in ("loading", "warming"):
+                raise RuntimeError(f"A swap of {name} is already in progress")
+            state = {"state": "loading", "model_path": model_path, "started": time.time()}
+            self.swaps[name] = state
+        return state
+    
+    def swap(self, name: str, model_path: str, params: Optional[Dict[str, Any]] = None,
+             state: Optional[Dict[str, Any]] = None):
+        """
+        Replace a registered model without downtime
+        
+        The new model is loaded and warmed up while the old one keeps serving.
+        New requests are then switched to it atomically; the old model is
+        freed once its in-flight requests have drained. Blocks until the
+        switch; progress is recorded in ``self.swaps[name]``. ``state`` is the
+        record from an earlier ``begin_swap``; without it the swap begins here.
+        """
+        if state is None:
+            state = self.begin_swap(name, model_path)
+        
+        spec = {**self.models[name], "model_path": model_path}
+        if params is not None:
+            spec["params"] = params
+        
+        llm = None
+        try:
+            if not os.path.exists(model_path):
+                raise FileNotFoundError(f"Model file not found: {model_path}")
+            
+            with self._cond:
+                size_bytes = os.path.getsize(model_path) + int(MODEL_OVERHEAD_GB * GB)
+                # The model being replaced keeps serving until the switch
+                self._make_room(size_bytes, keep=name)
+            
+            llm = LocalLLM(model_path, spec.get("params"), min_size_gb=spec.get("min_size_gb", 3.0))
+            if not llm.is_available:
+                raise RuntimeError(f"Failed to load {model_path}")
+            
+            state["state"] = "warming"
+            llm.warm_up()
+        except Exception as e:
+            logger.error(f"❌ Hot swap of {name} failed: {e}")
+            if llm is not None:
+                llm.unload()
+            state.update(state="failed", error=str(e), finished=time.time())
+            raise
+        
+        drained = None
+        with self._cond:
+            old = self._resident.pop(name, None)
+            entry = _ResidentModel(name, llm, size_bytes)
+            self._resident[name] = entry
+            self.models[name] = spec
+            self.stats["swaps"] += 1
+            
+            if old is not None:
+                if old.refs == 0:
+                    drained = old
+                else:
+                    self._retired.append(old)
+            if drained is None and old is not None:
+                state["state"] = "draining"
+            else:
+                state.update(state="done", finished=time.time())
+            self._cond.notify_all()
+        
+        logger.info(f"🔁 Model {name} switched to {model_path}")
+        if drained is not None:
+            self._free_retired(drained)
+    
+    def _free_retired(self, entry: _ResidentModel):
+        """Unload a swapped-out model once its last request finished"""
+        logger.info(f"♻️  Freeing swapped-out model {entry.name}")
+        entry.llm.unload()
+        state = self.swaps.get(entry.name)
+        if state is not None and state["state"] == "draining":
+            state.update(state="done", finished=time.time())
+    
+    # ------------------------------------------------------------------
+    # Memory budget
+    # ------------------------------------------------------------------
+    
+    def _estimate_bytes(self, name: str) -> int:
+        """Weights (file size, mmapped) plus estimated context overhead"""
+        path = self.models[name]["model_path"]
+        weights = os.path.getsize(path) if os.path.exists(path) else 0
+        return weights + int(MODEL_OVERHEAD_GB * GB)
+    
+    def resident_bytes(self) -> int:
+        """Estimated memory held by resident and draining models"""
+        entries = list(self._resident.values()) + self._retired
+        return sum(entry.size_bytes for entry in entries)
+    
+    def _make_room(self, needed: int, keep: Optional[str] = None):
+        """Evict idle models (LRU first) until ``needed`` bytes fit; holds the lock"""
+        deadline = time.time() + MODEL_LOAD_WAIT_S
+        
+        while self._resident and self.resident_bytes() + needed > self.budget_bytes:
+            victim = next(
+                (entry for entry in self._resident.values()
+                 if entry.refs == 0 and entry.name != keep),
+                None
+            )
+            if victim is not None:
+                self._evict(victim)
+                continue
+            
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise RuntimeError(
+                    "Model memory budget exhausted: all resident models are in use"
+                )
+            self._cond.wait(timeout=remaining)
+        
+        if needed > self.budget_bytes:
+            logger.warning(
+                f"Model needs {needed / GB:.2f} GB, more than the whole "
+                f"budget of {self.budget_bytes / GB:.2f} GB - loading anyway"
+            )
+    
+    def _evict(self, entry: _ResidentModel):
+        """Unload an idle model; holds the lock"""
+        logger.info(f"♻️  Evicting model {entry.name} (LRU, {entry.size_bytes / GB:.2f} GB)")
+        del self._resident[entry.name]
+        entry.llm.unload()
+        self.stats["evictions"] += 1
+    
+    def evict(self, name: str) -> bool:
+        """Unload a model now if nothing is using it"""
+        with self._cond:
+            entry = self._resident.get(name)
+            if entry is None or entry.refs > 0:
+                return False
+            self._evict(entry)
+            return True
+    
+    def model_state(self, name: str) -> str:
+        """Residency of a model: ready, idle, unloaded (loads on demand) or unavailable"""
+        if not self.has_model(name):
+            return "unavailable"
+        with self._cond:
+            entry = self._resident.get(name)
+            return entry.llm.state if entry is not None else "unloaded"
+    
+    def after_fork(self, num_cores: Optional[int] = None):
+        """Reset locks and per-process model state in a forked worker"""
+        self._cond = threading.Condition()
+        self._loading = {}
+        for entry in self._resident.values():
+            entry.refs = 0
+            entry.llm.after_fork(num_cores)
+    
+    def status(self) -> Dict[str, Any]:
+        """Registered and resident models with memory usage"""
+        with self._cond:
+            resident = {
+                name: {
+                    "refs": entry.refs,
+                    "state": entry.llm.state,
+                    "size_gb": round(entry.size_bytes / GB, 2),
+                    "kv_cache_mb": round(entry.llm.kv_cache_bytes() / 1024 ** 2, 1),
+                    "contexts": entry.llm.num_contexts,
+                    "idle_s": round(time.time() - entry.last_used, 1)
+                }
+                for name, entry in self._resident.items()
+            }
+            return {
+                "registered": sorted(self.models),
+                "default": DEFAULT_MODEL,
+                "resident": resident,
+                "draining": [
+                    {"name": entry.name, "refs": entry.refs} for entry in self._retired
+                ],
+                "swaps": {name: dict(state) for name, state in self.swaps.items()},
+                "resident_gb": round(self.resident_bytes() / GB, 2),
+                "budget_gb": round(self.budget_bytes / GB, 2),
+                "stats": dict(self.stats)
+            }
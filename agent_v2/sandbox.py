@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import time
+import queue
+import select
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Dict, Any, List, Optional
+
+from .config import VERIFICATION_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# SANDBOXED CANDIDATE VERIFICATION
+# ============================================================================
+#
+# Candidates run in a pool of long-lived worker processes (sandbox_worker.py,
+# started with ``python -I`` in their own session, empty environment and a
+# scratch directory). Before it runs anything a worker confines itself: its
+# own mount, network, PID, IPC and UTS namespaces, a read-only root with a
+# small tmpfs /tmp, the "nobody" user without capabilities, and resource
+# limits. It then serves as a zygote: each candidate runs in a fresh child
+# forked from it, under a wall-clock alarm and a CPU-time limit and unable to
+# start processes, and reports on a pipe of its own, so nothing a candidate
+# does carries over to the next one. Workers are started ahead of time and
+# replaced in the background when one hangs, dies or reaches
+# ``max_tasks_per_child``, so no candidate waits for an interpreter to start.
+#
+# Where a worker cannot confine itself (no Linux namespaces, or a container
+# that forbids them) it refuses to start, and with no workers the pool turns
+# verification off rather than run candidates unconfined. Samples matching the
+# output guardrails are dropped before they get here.
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_worker.py")
+
+# Verdicts: "passed" and "failed" adjust the score; the rest leave it alone
+PASSED, FAILED, INCONCLUSIVE, SKIPPED, ERROR = "passed", "failed", "inconclusive", "skipped", "error"
+
+WORKER_START_TIMEOUT_S = 30.0
+
+def _verdict(status: str, passed: int = 0, total: int = 0, detail: str = "") -> Dict[str, Any]:
+    return {"status": status, "passed": passed, "tests": total, "detail": detail}
+
+class _Worker:
+    """One worker process and its request/response pipes"""
+
+    def __init__(self, memory_mb: int):
+        self.directory = tempfile.TemporaryDirectory(prefix="verify-")
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", WORKER_SCRIPT, str(memory_mb)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            cwd=self.directory.name,
+            env={},
+            start_new_session=True,
+            text=True
+        )
+        self.tasks = 0
+        ready = self._read(WORKER_START_TIMEOUT_S)
+        if ready is None or "error" in ready:
+            self.kill()
+            if ready is None:
+                raise RuntimeError("verification worker did not start")
+            raise RuntimeError(f"verification worker could not sandbox itself: {ready['error']}")
+
+    def _read(self, timeout_s: float) -> Optional[Dict[str, Any]]:
+        """Next response line, or None on timeout or exit"""
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout_s)
+        if not ready:
+            return None
+        line = self.process.stdout.readline()
+        return json.loads(line) if line else None
+
+    def call(self, request: Dict[str, Any], timeout_s: float) -> Optional[Dict[str, Any]]:
+        self.tasks += 1
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+            return self._read(timeout_s)
+        except (OSError, ValueError):
+            return None
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        for pipe in (self.process.stdin, self.process.stdout):
+            try:
+                pipe.close()
+            except OSError:
+                pass
+        self.directory.cleanup()
+
+class VerificationPool:
+    """
+    Warm pool of sandboxed worker processes that run Python and SQL candidates
+
+    Started once (eagerly by the agent, or on first use) and shared by every
+    model. ``verify`` blocks the calling sample thread only, never a model
+    context.
+    """
+
+    def __init__(self, config: Dict[str, Any] = VERIFICATION_CONFIG):
+        self.config = config
+        # Workers sandbox themselves with Linux namespaces
+        self.enabled = config["enabled"] and sys.platform.startswith("linux")
+        self.languages = tuple(config["languages"])
+        self.timeout_s = config["timeout_s"]
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers: List[_Worker] = []
+        self._started = False
+        self._closed = False
+        self._lock = threading.Lock()
+        self.stats = {status: 0 for status in (PASSED, FAILED, INCONCLUSIVE, ERROR)}
+        self.stats.update({"replaced": 0, "total_ms": 0.0})
+
+    def start(self):
+        """Start every worker and wait until each is ready"""
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+            self._closed = False
+        start = time.perf_counter()
+        threads = [
+            threading.Thread(target=self._spawn, name=f"verify-start-{i}", daemon=True)
+            for i in range(self.config["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if not self._idle.qsize():
+            self.enabled = False
+            logger.error("❌ No verification worker started - candidate verification disabled")
+            return
+        logger.info(
+            f"🧪 Verification pool ready: {self._idle.qsize()} workers "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+
+    def _spawn(self):
+        try:
+            worker = _Worker(self.config["memory_mb"])
+        except (OSError, RuntimeError) as e:
+            logger.error(f"❌ Could not start verification worker: {e}")
+            return
+        with self._lock:
+            if self._closed:
+                worker.kill()
+                return
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker: _Worker):
+        """Retire a worker and start its successor off the request path"""
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self.stats["replaced"] += 1
+        worker.kill()
+        if not self._closed:
+            threading.Thread(target=self._spawn, name="verify-replace", daemon=True).start()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._started = False
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.kill()
+        self._idle = queue.Queue()
+
+    def verify(self, code: str, language: str) -> Dict[str, Any]:
+        """Run a candidate's smoke tests; the verdict's "status" is one of the module constants"""
+        if not self.enabled or language not in self.languages:
+            return _verdict(SKIPPED)
+        if not self._started:
+            self.start()
+            if not self.enabled:
+                return _verdict(SKIPPED)
+
+        try:
+            # Wait at most about one other candidate's run for a free worker
+            worker = self._idle.get(timeout=self.timeout_s + 1.0)
+        except queue.Empty:
+            return self._record(_verdict(ERROR, detail="no free verification worker"))
+
+        result = worker.call(
+            {"code": code, "language": language, "timeout_s": self.timeout_s},
+            self.timeout_s + 1.0
+        )
+        if result is None:
+            # The worker's own alarm should have answered first: it is stuck or dead
+            logger.warning("🧪 Verification worker did not answer - replacing it")
+            self._replace(worker)
+            result = _verdict(FAILED, 0, 1, f"no answer within {self.timeout_s}s")
+        elif worker.tasks >= self.config["max_tasks_per_child"]:
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        return self._record(result)
+
+    def _record(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self.stats[result["status"]] += 1
+            self.stats["total_ms"] += result.get("elapsed_ms", 0.0)
+        return result
+
+    def score_adjustment(self, verdict: Dict[str, Any]) -> float:
+        """Ranking bonus for passing candidates, penalty for failing ones"""
+        if verdict["status"] == PASSED:
+            return self.config["pass_bonus"]
+        if verdict["status"] == FAILED:
+            return -self.config["fail_penalty"]
+        return 0.0
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            workers = len(self._workers)
+        checked = sum(stats[status] for status in (PASSED, FAILED, INCONCLUSIVE))
+        return {
+            "enabled": self.enabled,
+            "workers": workers,
+            "idle_workers": self._idle.qsize(),
+            "languages": list(self.languages),
+            "timeout_s": self.timeout_s,
+            "checked": checked,
+            "passed": stats[PASSED],
+            "failed": stats[FAILED],
+            "inconclusive": stats[INCONCLUSIVE],
+            "errors": stats[ERROR],
+            "workers_replaced": stats["replaced"],
+            "avg_ms": round(stats["total_ms"] / checked, 1) if checked else None
+        }
+
+verification_pool = VerificationPool()
@@ -0,0 +1,474 @@
+"""
+Verification worker: runs Python and SQL candidates with smoke tests
+
+Started by ``agent_v2.sandbox.VerificationPool`` as ``python -I <this file>
+<memory_mb>`` in a fresh temporary directory, it confines itself before
+running anything (see ``_isolate``), then reads one JSON request per line on
+stdin ({"code", "language", "timeout_s"}) and writes one JSON verdict per line
+on stdout. If it cannot confine itself it reports {"error": ...} instead of
+becoming ready. It imports only the standard library, so it starts quickly and
+never loads the server's modules.
+
+The worker itself never runs a candidate: it is a zygote that forks a fresh
+child per candidate (see ``_run_forked``). The child cannot see the protocol
+descriptors, and whatever the candidate changes (builtins, sys.modules, open
+files, /tmp) goes away with it, so one candidate cannot alter another's
+verdict; at most it can misreport its own. The candidate's own stdin, stdout
+and stderr are /dev/null.
+"""
+
+import io
+import os
+import re
+import ast
+import sys
+import json
+import time
+import signal
+import shutil
+import select
+import sqlite3
+import ctypes
+import builtins
+import contextlib
+from typing import Dict, Any, List, Optional
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+# Verdicts: "passed" and "failed" adjust the score; the rest leave it alone
+PASSED, FAILED, INCONCLUSIVE, SKIPPED, ERROR = "passed", "failed", "inconclusive", "skipped", "error"
+
+# Exceptions that show the candidate itself is broken, whatever its inputs
+_BROKEN = (NameError, ImportError, AttributeError, RecursionError, SyntaxError, AssertionError, MemoryError)
+
+# Arguments for smoke-test calls, by annotation (as written) and parameter name
+_SAMPLE_BY_ANNOTATION = {
+    "int": 7, "float": 2.5, "str": "hello world", "bool": True, "bytes": b"hello",
+    "list": [3, 1, 2], "List": [3, 1, 2], "list[int]": [3, 1, 2], "List[int]": [3, 1, 2],
+    "list[str]": ["b", "a", "c"], "List[str]": ["b", "a", "c"],
+    "list[float]": [3.0, 1.5, 2.0], "List[float]": [3.0, 1.5, 2.0],
+    "dict": {"a": 1, "b": 2}, "Dict": {"a": 1, "b": 2}, "dict[str, int]": {"a": 1, "b": 2},
+    "Dict[str, int]": {"a": 1, "b": 2}, "set": {1, 2, 3}, "tuple": (1, 2),
+}
+_SAMPLE_BY_NAME = {
+    ("n", "k", "num", "number", "count", "size", "limit", "x", "y", "a", "b"): 7,
+    ("s", "text", "string", "word", "name", "sentence", "line"): "hello world",
+    ("nums", "numbers", "arr", "array", "items", "values", "lst", "data", "elements"): [3, 1, 2],
+}
+_RETURN_TYPES = {"int": int, "float": (int, float), "str": str, "bool": bool, "list": list, "dict": dict}
+
+_SQL_SYNTAX_ERRORS = ("syntax error", "incomplete input", "unrecognized token")
+_SQL_STUB_ROUNDS = 20
+
+# Linux flags from <sched.h>, <sys/mount.h> and <sys/prctl.h>
+_CLONE_NEWNS, _CLONE_NEWUTS, _CLONE_NEWIPC = 0x00020000, 0x04000000, 0x08000000
+_CLONE_NEWUSER, _CLONE_NEWPID, _CLONE_NEWNET = 0x10000000, 0x20000000, 0x40000000
+_MS_RDONLY, _MS_NOSUID, _MS_NODEV, _MS_NOEXEC = 0x1, 0x2, 0x4, 0x8
+_MS_NOATIME, _MS_NODIRATIME, _MS_REMOUNT = 0x400, 0x800, 0x20
+_MS_BIND, _MS_REC, _MS_PRIVATE, _MS_RELATIME = 0x1000, 0x4000, 0x40000, 0x200000
+_PR_SET_PDEATHSIG, _PR_SET_DUMPABLE, _PR_SET_NO_NEW_PRIVS = 1, 4, 38
+_LINUX_CAPABILITY_VERSION_3 = 0x20080522
+
+# Candidates run as "nobody"
+_UNPRIVILEGED_ID = 65534
+# Read-only in the worker's root, besides the interpreter's own prefixes
+_SYSTEM_PATHS = ("/usr", "/bin", "/sbin", "/lib", "/lib32", "/lib64")
+_DEVICES = ("null", "zero", "random", "urandom")
+_SCRATCH_MB = 16
+# How long past its own time limit a candidate's child may take to answer
+_CHILD_GRACE_S = 0.5
+_MAX_RESULT_BYTES = 1 << 16
+
+class _CapHeader(ctypes.Structure):
+    _fields_ = [("version", ctypes.c_uint32), ("pid", ctypes.c_int)]
+
+class _CapData(ctypes.Structure):
+    _fields_ = [("effective", ctypes.c_uint32), ("permitted", ctypes.c_uint32),
+                ("inheritable", ctypes.c_uint32)]
+
+class _Timeout(BaseException):
+    """Raised in a worker when a candidate overruns; not caught by ``except Exception``"""
+
+def _limit_resources(memory_mb: int):
+    """Lower this worker's limits once; its candidates' children inherit them"""
+    if resource is None:
+        return
+    limits = [(resource.RLIMIT_FSIZE, 1 << 20), (resource.RLIMIT_CORE, 0), (resource.RLIMIT_NOFILE, 64)]
+    try:
+        with open("/proc/self/statm") as f:
+            size = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        limits.append((resource.RLIMIT_AS, size + memory_mb * (1 << 20)))
+    except (OSError, ValueError):
+        pass
+    for limit, value in limits:
+        try:
+            resource.setrlimit(limit, (value, value))
+        except (ValueError, OSError):
+            pass
+
+def _libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p, ctypes.c_ulong, ctypes.c_char_p]
+    libc.unshare.argtypes = [ctypes.c_int]
+    libc.prctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong, ctypes.c_ulong]
+    return libc
+
+def _check(result: int, what: str):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{what}: {os.strerror(errno)}")
+
+def _mount(libc, source: Optional[str], target: str, fstype: Optional[str], flags: int, data: Optional[str] = None):
+    encode = lambda value: value.encode() if value is not None else None
+    _check(libc.mount(encode(source), encode(target), encode(fstype), flags, encode(data)), f"mount {target}")
+
+def _write(path: str, text: str):
+    with open(path, "w") as f:
+        f.write(text)
+
+def _bind_read_only(libc, path: str, target: str):
+    _mount(libc, path, target, None, _MS_BIND | _MS_REC)
+    # A remount inside a user namespace must keep the flags the source is locked with
+    flags = os.statvfs(path).f_flag
+    kept = flags & (_MS_NOEXEC | _MS_NOATIME | _MS_NODIRATIME) | (_MS_RELATIME if flags & os.ST_RELATIME else 0)
+    _mount(libc, None, target, None, _MS_BIND | _MS_REMOUNT | _MS_RDONLY | _MS_NOSUID | _MS_NODEV | kept)
+
+def _build_root(libc, root: str):
+    """
+    A tmpfs root holding read-only binds of the system and interpreter
+    directories, a few devices and a writable /tmp; then chroot into it
+    """
+    _mount(libc, None, "/", None, _MS_REC | _MS_PRIVATE)
+    _mount(libc, "tmpfs", root, "tmpfs", _MS_NOSUID | _MS_NODEV, "size=1m,mode=0755")
+    prefixes = {os.path.realpath(path) for path in (sys.base_prefix, sys.prefix)}
+    paths = list(_SYSTEM_PATHS) + sorted(prefixes)
+    bound: List[str] = []
+    for path in paths:
+        if not os.path.lexists(path) or any(path.startswith(parent + "/") for parent in bound):
+            continue
+        target = root + path
+        if os.path.islink(path):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.symlink(os.readlink(path), target)
+            continue
+        os.makedirs(target, exist_ok=True)
+        _bind_read_only(libc, path, target)
+        bound.append(path)
+
+    os.makedirs(root + "/dev")
+    for device in _DEVICES:
+        if os.path.exists("/dev/" + device):
+            open(f"{root}/dev/{device}", "w").close()
+            _mount(libc, "/dev/" + device, f"{root}/dev/{device}", None, _MS_BIND)
+    os.makedirs(root + "/tmp")
+    _mount(libc, "tmpfs", root + "/tmp", "tmpfs", _MS_NOSUID | _MS_NODEV, f"size={_SCRATCH_MB}m,mode=1777")
+
+    os.chdir(root)
+    os.chroot(".")
+    _mount(libc, None, "/", None, _MS_BIND | _MS_REMOUNT | _MS_RDONLY | _MS_NOSUID | _MS_NODEV)
+    os.chdir("/tmp")
+
+def _drop_privileges(libc, as_root: bool):
+    """Become "nobody" with no capabilities and no way to gain any back"""
+    if as_root:
+        os.setgroups([])
+        os.setresgid(_UNPRIVILEGED_ID, _UNPRIVILEGED_ID, _UNPRIVILEGED_ID)
+        os.setresuid(_UNPRIVILEGED_ID, _UNPRIVILEGED_ID, _UNPRIVILEGED_ID)
+    else:
+        # Already "nobody" in the user namespace; shed the capabilities it came with
+        header = _CapHeader(_LINUX_CAPABILITY_VERSION_3, 0)
+        _check(libc.capset(ctypes.byref(header), (_CapData * 2)()), "capset")
+    _check(libc.prctl(_PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "no_new_privs")
+    # Not ptrace-able by its candidates' children, which share its uid
+    _check(libc.prctl(_PR_SET_DUMPABLE, 0, 0, 0, 0), "dumpable")
+    # Credential changes reset this, so set it last
+    _check(libc.prctl(_PR_SET_PDEATHSIG, int(signal.SIGKILL), 0, 0, 0), "pdeathsig")
+
+def _isolate(memory_mb: int):
+    """
+    Confine this worker before it runs any candidate: new mount, network
+    (no interfaces up), PID, IPC and UTS namespaces, a read-only root with a
+    small tmpfs /tmp, the "nobody" user with no capabilities, and resource
+    limits (candidates' children also may not start processes). A server not
+    running as root gets the same through a user namespace mapping its own
+    uid to "nobody".
+
+    The new PID namespace only applies to children, so this forks: the
+    parent stays outside, waits and exits with the child, whose death it
+    passes on (the child is killed when the parent is).
+    """
+    if not sys.platform.startswith("linux"):
+        raise OSError("verification sandbox needs Linux namespaces")
+    libc = _libc()
+    as_root = os.geteuid() == 0
+    uid, gid = os.geteuid(), os.getegid()
+    flags = _CLONE_NEWNS | _CLONE_NEWNET | _CLONE_NEWPID | _CLONE_NEWIPC | _CLONE_NEWUTS
+    _check(libc.unshare(flags if as_root else flags | _CLONE_NEWUSER), "unshare")
+    if not as_root:
+        _write("/proc/self/setgroups", "deny")
+        _write("/proc/self/uid_map", f"{_UNPRIVILEGED_ID} {uid} 1")
+        _write("/proc/self/gid_map", f"{_UNPRIVILEGED_ID} {gid} 1")
+
+    pid = os.fork()
+    if pid:
+        _, status = os.waitpid(pid, 0)
+        os._exit(os.waitstatus_to_exitcode(status) & 0xFF)
+    _limit_resources(memory_mb)
+    _build_root(libc, os.getcwd())
+    _drop_privileges(libc, as_root)
+
+@contextlib.contextmanager
+def _time_limit(timeout_s: float):
+    """Wall-clock alarm plus a CPU-time limit (SIGXCPU) for code that swallows the alarm"""
+    def on_alarm(signum, frame):
+        raise _Timeout()
+
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout_s)
+    if resource is not None:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = int(used.ru_utime + used.ru_stime + timeout_s) + 2
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, hard))
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def _verdict(status: str, passed: int = 0, total: int = 0, detail: str = "") -> Dict[str, Any]:
+    return {"status": status, "passed": passed, "tests": total, "detail": detail[:200]}
+
+def _sample_args(node: ast.FunctionDef) -> Optional[List[Any]]:
+    """Arguments for a smoke-test call, or None if a parameter cannot be guessed"""
+    args = node.args
+    if any(default is None for default in args.kw_defaults):
+        return None
+    positional = args.posonlyargs + args.args
+    required = positional[:len(positional) - len(args.defaults)]
+    values = []
+    for arg in required:
+        if arg.arg in ("self", "cls"):
+            return None
+        if arg.annotation is not None:
+            annotation = ast.unparse(arg.annotation).replace("typing.", "")
+            if annotation not in _SAMPLE_BY_ANNOTATION:
+                return None
+            values.append(_SAMPLE_BY_ANNOTATION[annotation])
+            continue
+        for names, value in _SAMPLE_BY_NAME.items():
+            if arg.arg in names:
+                values.append(value)
+                break
+        else:
+            return None
+    return values
+
+def _check_python(code: str, timeout_s: float) -> Dict[str, Any]:
+    """
+    Smoke tests: the module runs, and every public top-level function whose
+    arguments can be guessed from annotations or names returns without a
+    "broken code" error and with its annotated return type
+    """
+    tree = ast.parse(code)
+    functions = [
+        node for node in tree.body
+        if isinstance(node, ast.FunctionDef) and not node.name.startswith("_")
+    ]
+    namespace = {"__name__": "__candidate__", "__builtins__": builtins}
+    passed, total = 0, 1
+    sink = io.StringIO()
+    stdin = sys.stdin
+    try:
+        sys.stdin = io.StringIO()
+        with contextlib.redirect_stdout(sink), contextlib.redirect_stderr(sink), _time_limit(timeout_s):
+            try:
+                exec(compile(tree, "<candidate>", "exec"), namespace)
+            except _BROKEN as e:
+                return _verdict(FAILED, 0, total, f"module: {type(e).__name__}: {e}")
+            except Exception as e:
+                return _verdict(INCONCLUSIVE, 0, total, f"module: {type(e).__name__}: {e}")
+            passed += 1
+
+            for node in functions:
+                args = _sample_args(node)
+                if args is None:
+                    continue
+                total += 1
+                try:
+                    result = namespace[node.name](*args)
+                except _BROKEN as e:
+                    return _verdict(FAILED, passed, total, f"{node.name}: {type(e).__name__}: {e}")
+                except Exception:
+                    # Likely a poor guess at the arguments
+                    total -= 1
+                    continue
+                expected = _RETURN_TYPES.get(ast.unparse(node.returns)) if node.returns else None
+                if expected is not None and not isinstance(result, expected):
+                    return _verdict(
+                        FAILED, passed, total,
+                        f"{node.name}: returned {type(result).__name__}, annotated {ast.unparse(node.returns)}"
+                    )
+                passed += 1
+    except _Timeout:
+        return _verdict(FAILED, passed, total, f"timed out after {timeout_s}s")
+    finally:
+        sys.stdin = stdin
+    return _verdict(PASSED, passed, total)
+
+def _check_sql(code: str, timeout_s: float) -> Dict[str, Any]:
+    """
+    Run the script against an in-memory database. Tables and columns it uses
+    without creating are stubbed in, and the script re-run from scratch.
+    """
+    stubs: Dict[str, List[str]] = {}
+    deadline = time.monotonic() + timeout_s
+    for _ in range(_SQL_STUB_ROUNDS):
+        db = sqlite3.connect(":memory:")
+        # Checked every 10k VM instructions: stop long-running queries
+        db.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        try:
+            for table, columns in stubs.items():
+                quoted = ", ".join(f'"{column}"' for column in columns)
+                db.execute(f'CREATE TABLE "{table}" ({quoted})')
+            db.executescript(code)
+            return _verdict(PASSED, 1, 1)
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if message == "interrupted":
+                return _verdict(FAILED, 0, 1, f"timed out after {timeout_s}s")
+            if any(error in message for error in _SQL_SYNTAX_ERRORS):
+                return _verdict(FAILED, 0, 1, message)
+            table = re.match(r"no such table: (?:\w+\.)?(\w+)", message)
+            column = re.match(r"no such column: (?:(\w+)\.)?(\w+)", message)
+            if table and table.group(1) not in stubs:
+                stubs[table.group(1)] = ["id"]
+            elif column and stubs:
+                owner = column.group(1)
+                for name in ([owner] if owner in stubs else stubs):
+                    if column.group(2) not in stubs[name]:
+                        stubs[name].append(column.group(2))
+            else:
+                return _verdict(INCONCLUSIVE, 0, 1, message)
+        except sqlite3.Error as e:
+            return _verdict(INCONCLUSIVE, 0, 1, str(e))
+        finally:
+            db.close()
+    return _verdict(INCONCLUSIVE, 0, 1, "too many missing tables or columns")
+
+def run_candidate(code: str, language: str, timeout_s: float) -> Dict[str, Any]:
+    """Check one candidate; never lets the candidate take the worker down"""
+    start = time.perf_counter()
+    try:
+        if language == "python":
+            result = _check_python(code, timeout_s)
+        else:
+            result = _check_sql(code, timeout_s)
+    except SyntaxError as e:
+        result = _verdict(FAILED, 0, 1, f"SyntaxError: {e}")
+    except (MemoryError, _Timeout) as e:
+        result = _verdict(FAILED, 0, 1, type(e).__name__)
+    except BaseException as e:  # SystemExit, KeyboardInterrupt from the candidate
+        result = _verdict(INCONCLUSIVE, 0, 1, f"{type(e).__name__}: {e}")
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+def _run_forked(request: Dict[str, Any], protocol: List[int]) -> Dict[str, Any]:
+    """
+    Check one candidate in a child forked from this worker, which reads the
+    verdict from a pipe of its own; a child that overruns is killed
+    """
+    timeout_s = request["timeout_s"]
+    start = time.perf_counter()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            for fd in protocol + [read_fd]:
+                os.close(fd)
+            if resource is not None:
+                resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+            result = run_candidate(request["code"], request["language"], timeout_s)
+            os.write(write_fd, (json.dumps(result) + "\n").encode())
+            status = 0
+        finally:
+            os._exit(status)
+
+    os.close(write_fd)
+    output = b""
+    deadline = time.monotonic() + timeout_s + _CHILD_GRACE_S
+    try:
+        while len(output) < _MAX_RESULT_BYTES:
+            ready, _, _ = select.select([read_fd], [], [], max(0.0, deadline - time.monotonic()))
+            chunk = os.read(read_fd, 4096) if ready else b""
+            if not chunk:
+                break
+            output += chunk
+    finally:
+        os.close(read_fd)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        _, wait_status = os.waitpid(pid, 0)
+        _clear_scratch()
+
+    elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+    lines = output.decode("utf-8", "replace").splitlines()
+    try:
+        result = json.loads(lines[-1])
+        if result.get("status") in (PASSED, FAILED, INCONCLUSIVE):
+            return result
+    except (IndexError, ValueError, AttributeError):
+        pass
+    code = os.waitstatus_to_exitcode(wait_status)
+    if time.monotonic() >= deadline or code == -signal.SIGXCPU:
+        result = _verdict(FAILED, 0, 1, f"timed out after {timeout_s}s")
+    elif code < 0:
+        result = _verdict(FAILED, 0, 1, f"killed by {signal.Signals(-code).name}")
+    else:
+        result = _verdict(INCONCLUSIVE, 0, 1, f"exited with status {code} without a verdict")
+    result["elapsed_ms"] = elapsed_ms
+    return result
+
+def _clear_scratch():
+    """Empty /tmp, so no candidate sees files left by the one before"""
+    for entry in os.scandir("."):
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+def main():
+    memory_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    # Keep the protocol on private descriptors so nothing the candidate
+    # prints can corrupt it
+    requests = os.fdopen(os.dup(0), "r")
+    responses = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    try:
+        _isolate(memory_mb)
+    except OSError as e:
+        responses.write(json.dumps({"error": str(e)}) + "\n")
+        responses.flush()
+        return
+
+    responses.write(json.dumps({"ready": os.getpid()}) + "\n")
+    responses.flush()
+    protocol = [requests.fileno(), responses.fileno()]
+    for line in requests:
+        result = _run_forked(json.loads(line), protocol)
+        responses.write(json.dumps(result) + "\n")
+        responses.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+from .config import SCORING_CONFIG
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# CANDIDATE SCORING
+# ============================================================================
+#
+# All candidates of a request are scored together: the prompt's words are
+# counted once, each candidate becomes one row of a feature matrix, and the
+# scores are the matrix times a weight vector (with NumPy when installed).
+# Weights default to the original hand-set heuristic and can be replaced by a
+# JSON weights file, re-read when it changes:
+#
+#     {"bias": 0.0, "weights": {"definition": 3.0, "unfinished": -5.0, ...}}
+#
+# Each request's candidates, their features and outcomes are appended to a
+# candidate log, together with users' feedback on the answers; train_ranker
+# fits new weights from it.
+
+# Substring features: (name, substrings, count). A feature is 1 when any of
+# its substrings occurs in the candidate, or with count the number that occur.
+PATTERN_FEATURES: Tuple[Tuple[str, Tuple[str, ...], bool], ...] = (
+    ("definition", ("def ", "function", "class "), False),
+    ("return", ("return ",), False),
+    ("comment", ('"""', "'''", "//", "--"), False),
+    ("logic", ("if ", "for ", "while ", "try:", "with ", "SELECT", "WHERE"), False),
+    ("unfinished", ("TODO", "FIXME", "pass\n", "..."), True),
+)
+
+# Matrix columns, in order
+FEATURES: Tuple[str, ...] = (
+    "length_50_1000",   # 50 < len(code) < 1000
+    "length_30_1500",   # otherwise 30 < len(code) < 1500
+    *(name for name, _, _ in PATTERN_FEATURES),
+    "prompt_words",     # prompt words (longer than 3 letters) found in the code
+    "consensus",        # share of the request's candidates in this one's near-duplicate cluster
+)
+
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "length_50_1000": 2.0,
+    "length_30_1500": 1.0,
+    "definition": 3.0,
+    "return": 2.0,
+    "comment": 1.0,
+    "logic": 2.0,
+    "unfinished": -5.0,
+    "prompt_words": 0.5,
+    "consensus": 2.0,
+}
+
+# Every distinct substring is tested once per candidate; each pattern
+# feature reads its substrings' results by index
+_PATTERNS: Tuple[str, ...] = tuple(dict.fromkeys(p for _, patterns, _ in PATTERN_FEATURES for p in patterns))
+_PATTERN_COLUMNS = tuple(
+    (tuple(_PATTERNS.index(p) for p in patterns), count) for _, patterns, count in PATTERN_FEATURES
+)
+
+def prompt_features(prompt: str) -> Counter:
+    """Words of the prompt matched against candidates, with their repeat counts"""
+    return Counter(word for word in prompt.lower().split() if len(word) > 3)
+
+def candidate_features(code: str, prompt_words: Counter) -> List[float]:
+    """A candidate's own features, in FEATURES order (all but consensus)"""
+    length = len(code)
+    mid = 50 < length < 1000
+    row = [float(mid), float(not mid and 30 < length < 1500)]
+    present = [pattern in code for pattern in _PATTERNS]
+    for indices, count in _PATTERN_COLUMNS:
+        hits = sum(present[i] for i in indices)
+        row.append(float(hits if count else hits > 0))
+    lowered = code.lower()
+    row.append(float(sum(n for word, n in prompt_words.items() if word in lowered)))
+    return row
+
+class CandidateScorer:
+    """Linear scoring of a request's candidates over FEATURES"""
+
+    def __init__(self, path: Optional[str] = SCORING_CONFIG["weights_file"]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self.source = "default"
+        self.bias = 0.0
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self._vector = self._as_vector(self.weights)
+        self.reload_if_changed()
+
+    @staticmethod
+    def _as_vector(weights: Dict[str, float]):
+        values = [float(weights[name]) for name in FEATURES]
+        return np.array(values) if np is not None else values
+
+    def reload_if_changed(self) -> bool:
+        """Re-read the weights file if it changed; True if the weights were replaced"""
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path) if self.path else None
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+
+            if mtime is None:
+                weights, bias, source = dict(DEFAULT_WEIGHTS), 0.0, "default"
+            else:
+                try:
+                    with open(self.path) as f:
+                        data = json.load(f)
+                    unknown = set(data.get("weights", {})) - set(FEATURES)
+                    if unknown:
+                        logger.warning(f"Ignoring unknown scoring features in {self.path}: {sorted(unknown)}")
+                    # Features the file leaves out keep their default weight
+                    weights = {
+                        **DEFAULT_WEIGHTS,
+                        **{k: float(v) for k, v in data.get("weights", {}).items() if k in FEATURES}
+                    }
+                    bias, source = float(data.get("bias", 0.0)), self.path
+                except (OSError, ValueError, TypeError, AttributeError) as e:
+                    logger.error(f"Ignoring invalid scoring weights file {self.path}: {e}")
+                    return False
+
+            self.weights, self.bias, self.source = weights, bias, source
+            self._vector = self._as_vector(weights)
+        logger.info(f"📐 Scoring weights loaded from {source}")
+        return True
+
+    def features(self, codes: List[str], prompt: str,
+                 cluster_sizes: Optional[List[int]] = None) -> List[List[float]]:
+        """
+        Feature rows for distinct candidates; ``cluster_sizes`` counts each
+        one's near-duplicates (itself included), 1 each if not given
+        """
+        words = prompt_features(prompt)
+        sizes = cluster_sizes or [1] * len(codes)
+        total = sum(sizes)
+        return [candidate_features(code, words) + [size / total] for code, size in zip(codes, sizes)]
+
+    def score(self, codes: List[str], prompt: str,
+              cluster_sizes: Optional[List[int]] = None) -> List[float]:
+        """Non-negative score per candidate, in order"""
+        return self.apply(self.features(codes, prompt, cluster_sizes))
+
+    def apply(self, rows: List[List[float]]) -> List[float]:
+        """Scores of feature rows from features()"""
+        if not rows:
+            return []
+        self.reload_if_changed()
+        vector, bias = self._vector, self.bias
+        if np is not None:
+            return np.maximum(np.asarray(rows) @ vector + bias, 0.0).tolist()
+        return [max(0.0, sum(x * w for x, w in zip(row, vector)) + bias) for row in rows]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "source": self.source,
+            "backend": "numpy" if np is not None else "python",
+            "bias": self.bias,
+            "weights": dict(self.weights)
+        }
+
+FEEDBACK_SIGNALS = ("accept", "regenerate")
+
+class CandidateLog:
+    """
+    Append-only JSON-lines log of ranked candidates and answer feedback
+
+    A "generation" record holds one request's distinct candidates (feature
+    rows, score, verification status, near-duplicate count, whether it was
+    chosen) under a generation id returned with the answer; a "feedback" record attaches a user signal
+    to that id. Each record is one write to a file opened for appending, so
+    several worker processes can share the log.
+    """
+
+    def __init__(self, path: Optional[str] = SCORING_CONFIG["candidate_log"],
+                 enabled: bool = SCORING_CONFIG["log_candidates"]):
+        self.path = path
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self.stats = {"generations": 0, "feedback": 0, "errors": 0}
+
+    def _append(self, record: Dict[str, Any], kind: str) -> bool:
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a") as f:
+                    f.write(line)
+            except OSError as e:
+                self.stats["errors"] += 1
+                logger.warning(f"Could not write candidate log {self.path}: {e}")
+                return False
+            self.stats[kind] += 1
+        return True
+
+    def record(self, language: str, model: str, candidates: List[Dict[str, Any]],
+               rows: List[List[float]], chosen: int) -> Optional[str]:
+        """Log a request's candidates; returns the generation id, or None if not logged"""
+        if not self.enabled:
+            return None
+        generation_id = uuid.uuid4().hex
+        written = self._append({
+            "type": "generation",
+            "id": generation_id,
+            "time": time.time(),
+            "language": language,
+            "model": model,
+            "features": FEATURES,
+            "candidates": [
+                {
+                    "sample": candidate["sample"],
+                    "x": row,
+                    "score": round(candidate["score"], 4),
+                    "verification": candidate["verification"],
+                    "cluster_size": candidate.get("cluster_size", 1),
+                    "chosen": candidate["sample"] == chosen
+                }
+                for candidate, row in zip(candidates, rows)
+            ]
+        }, "generations")
+        return generation_id if written else None
+
+    def feedback(self, generation_id: str, signal: str) -> bool:
+        if signal not in FEEDBACK_SIGNALS:
+            raise ValueError(f"Unknown feedback signal: {signal}")
+        if not self.enabled:
+            return False
+        return self._append(
+            {"type": "feedback", "id": generation_id, "signal": signal, "time": time.time()},
+            "feedback"
+        )
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return {"enabled": self.enabled, "file": self.path, **stats}
+
+candidate_scorer = CandidateScorer()
+candidate_log = CandidateLog()
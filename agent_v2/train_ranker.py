@@ -0,0 +1,173 @@
+"""
+Offline training of the candidate ranker
+
+Reads the candidate log written by LocalLLM (every request's candidates with
+their feature rows) and the feedback attached to answers, labels candidates,
+fits an L2-regularized logistic regression over the scoring FEATURES, and
+writes the scoring weights file that CandidateScorer re-reads at runtime.
+
+Labels: an answer the user accepted is a positive and one they regenerated a
+negative; otherwise a candidate that passed verification is a positive and
+one that failed a negative. Other candidates are not used.
+
+The fitted logit is rescaled to the range of the built-in scores (same mean
+and spread on the training candidates), so CASCADE_MIN_SCORE and the
+verification bonus keep their meaning; the ranking is the logit's.
+
+Usage:
+    python -m agent_v2.train_ranker [--log PATH] [--output PATH] [--l2 0.01]
+"""
+
+import os
+import json
+import time
+import zlib
+import argparse
+import logging
+from typing import Dict, Any, List, Tuple
+
+from .config import SCORING_CONFIG
+from .scoring import FEATURES, DEFAULT_WEIGHTS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+VERIFICATION_LABELS = {"passed": 1.0, "failed": 0.0}
+FEEDBACK_LABELS = {"accept": 1.0, "regenerate": 0.0}
+
+def load_examples(path: str) -> Tuple[List[List[float]], List[float], List[str]]:
+    """Feature rows, labels and generation ids of the labelled candidates in the log"""
+    generations, feedback = [], {}
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping unreadable line {number} of {path}")
+                continue
+            if record.get("type") == "generation":
+                generations.append(record)
+            elif record.get("type") == "feedback":
+                # The latest signal for an answer wins
+                feedback[record["id"]] = record["signal"]
+
+    rows, labels, groups = [], [], []
+    for record in generations:
+        # Rows are mapped by feature name, so logs from older feature sets still load
+        columns = {name: i for i, name in enumerate(record["features"])}
+        signal = feedback.get(record["id"])
+        for candidate in record["candidates"]:
+            if candidate["chosen"] and signal in FEEDBACK_LABELS:
+                label = FEEDBACK_LABELS[signal]
+            elif candidate["verification"] in VERIFICATION_LABELS:
+                label = VERIFICATION_LABELS[candidate["verification"]]
+            else:
+                continue
+            x = candidate["x"]
+            rows.append([float(x[columns[name]]) if name in columns else 0.0 for name in FEATURES])
+            labels.append(label)
+            groups.append(record["id"])
+    return rows, labels, groups
+
+def fit_logistic(X, y, l2: float, iterations: int, learning_rate: float):
+    """Weights and bias of an L2-regularized logistic regression, by gradient descent"""
+    # Standardized columns keep one learning rate right for every feature
+    mean, std = X.mean(axis=0), X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = (X - mean) / std
+    w, b = np.zeros(Z.shape[1]), 0.0
+    for _ in range(iterations):
+        p = 1.0 / (1.0 + np.exp(-(Z @ w + b)))
+        error = p - y
+        w -= learning_rate * (Z.T @ error / len(y) + l2 * w)
+        b -= learning_rate * error.mean()
+    return w / std, b - float((w * mean / std).sum())
+
+def auc(scores, y) -> float:
+    """Probability that a positive outranks a negative (ties count half)"""
+    positives = int(y.sum())
+    negatives = len(y) - positives
+    if not positives or not negatives:
+        return float("nan")
+    # Mann-Whitney U from the positives' average ranks
+    _, inverse, counts = np.unique(scores, return_inverse=True, return_counts=True)
+    ranks = (np.cumsum(counts) - (counts - 1) / 2.0)[inverse]
+    return float((ranks[y == 1].sum() - positives * (positives + 1) / 2.0) / (positives * negatives))
+
+def calibrate(X, w, b) -> Tuple[Any, float]:
+    """Rescale (w, b) so its scores match the built-in weights' mean and spread on X"""
+    learned = X @ w + b
+    builtin = X @ np.array([DEFAULT_WEIGHTS[name] for name in FEATURES])
+    scale = builtin.std() / learned.std() if learned.std() > 0 else 1.0
+    return w * scale, float(b * scale + builtin.mean() - scale * learned.mean())
+
+def train(rows: List[List[float]], labels: List[float], groups: List[str], l2: float,
+          iterations: int, learning_rate: float, holdout: float) -> Dict[str, Any]:
+    X, y = np.array(rows), np.array(labels)
+    builtin = np.array([DEFAULT_WEIGHTS[name] for name in FEATURES])
+
+    # Held out by generation, so one request's candidates fall on one side
+    test = np.array([zlib.crc32(g.encode()) % 1000 < holdout * 1000 for g in groups])
+    metrics = {}
+    if test.any() and (~test).any():
+        w, b = fit_logistic(X[~test], y[~test], l2, iterations, learning_rate)
+        metrics = {
+            "holdout_examples": int(test.sum()),
+            "holdout_auc_builtin": round(auc(X[test] @ builtin, y[test]), 4),
+            "holdout_auc_learned": round(auc(X[test] @ w + b, y[test]), 4),
+        }
+
+    w, b = fit_logistic(X, y, l2, iterations, learning_rate)
+    w, b = calibrate(X, w, b)
+    return {
+        "bias": round(b, 6),
+        "weights": {name: round(float(v), 6) for name, v in zip(FEATURES, w)},
+        "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "examples": len(labels),
+        "positives": int(y.sum()),
+        "metrics": metrics
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit candidate ranking weights from the candidate log")
+    parser.add_argument("--log", default=SCORING_CONFIG["candidate_log"], help="Candidate log to read")
+    parser.add_argument("--output", default=SCORING_CONFIG["weights_file"], help="Weights file to write")
+    parser.add_argument("--l2", type=float, default=0.01, help="L2 regularization strength")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--learning-rate", type=float, default=0.5)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of requests held out for evaluation")
+    parser.add_argument("--min-examples", type=int, default=50, help="Write nothing with fewer labelled candidates")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    if np is None:
+        raise SystemExit("train_ranker needs numpy (pip install numpy)")
+
+    rows, labels, groups = load_examples(args.log)
+    positives = int(sum(labels))
+    logger.info(f"{len(labels)} labelled candidates ({positives} positive) from {len(set(groups))} requests")
+    if len(labels) < args.min_examples or positives in (0, len(labels)):
+        raise SystemExit("Not enough labelled candidates of both kinds - nothing written")
+
+    result = train(rows, labels, groups, args.l2, args.iterations, args.learning_rate, args.holdout)
+    if result["metrics"]:
+        logger.info(
+            f"Held-out AUC: built-in {result['metrics']['holdout_auc_builtin']}, "
+            f"learned {result['metrics']['holdout_auc_learned']}"
+        )
+
+    # Replaced in one step: the running service re-reads this file when it changes
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    temporary = args.output + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(result, f, indent=2)
+    os.replace(temporary, args.output)
+    logger.info(f"Weights written to {args.output}: {result['weights']} (bias {result['bias']})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+CPU tuning sweep for llama.cpp parameters
+
+Sweeps n_threads, n_threads_batch, n_batch and n_ctx on the current host with
+a fixed benchmark prompt set built from SYSTEM_PROMPTS, measures prompt-eval
+and decode tokens/s, and writes the fastest settings to the tuning profile
+that LocalLLM applies at startup. Profiles are keyed by host shape (CPU
+architecture and core count), so one file can serve a mixed fleet. Thread
+counts are measured for one context with the host to itself; a context pool
+of K divides them by K.
+
+Usage:
+    python -m agent_v2.tuning [--model NAME] [--output PATH]
+"""
+
+import os
+import json
+import time
+import argparse
+import logging
+import platform
+from typing import Dict, Any, List, Optional
+
+from .config import (
+    MODEL_REGISTRY, MODEL_PARAMS, DEFAULT_MODEL, TUNING_PROFILE_PATH, MAX_NEW_TOKENS
+)
+from .prompts import SYSTEM_PROMPTS
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_TASKS = [
+    "check if a number is prime",
+    "reverse a linked list",
+    "group records by category and count them",
+]
+
+# Parameters a tuning profile may set
+TUNED_PARAMS = ("n_threads", "n_threads_batch", "n_batch", "n_ctx")
+
+def host_key() -> str:
+    """Identify the host shape a profile applies to"""
+    return f"{platform.machine()}-{os.cpu_count()}cpu"
+
+def load_tuning_profile(model_path: str, path: str = TUNING_PROFILE_PATH) -> Dict[str, Any]:
+    """Tuned llama.cpp parameters for this host and model, or {} if none recorded"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable tuning profile {path}: {e}")
+        return {}
+
+    entry = profile.get("hosts", {}).get(host_key(), {}).get(os.path.basename(model_path))
+    if not entry:
+        return {}
+    return {k: v for k, v in entry["params"].items() if k in TUNED_PARAMS}
+
+def save_tuning_profile(model_path: str, params: Dict[str, Any], results: List[Dict[str, Any]],
+                        path: str = TUNING_PROFILE_PATH):
+    """Merge this host's result into the profile file"""
+    profile = {"hosts": {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            profile = json.load(f)
+
+    profile.setdefault("hosts", {}).setdefault(host_key(), {})[os.path.basename(model_path)] = {
+        "params": params,
+        "results": results,
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+def benchmark_prompts(languages: Optional[List[str]] = None) -> List[str]:
+    """Fixed prompt set: every benchmark task under each language's system prompt"""
+    languages = languages or list(SYSTEM_PROMPTS)
+    return [
+        f"{SYSTEM_PROMPTS[language]}\n\nPrompt: {task}\nOutput:"
+        for language in languages
+        for task in BENCHMARK_TASKS
+    ]
+
+def measure(params: Dict[str, Any], prompts: List[str], decode_tokens: int) -> Dict[str, float]:
+    """Load the model with ``params`` and time prompt evaluation and greedy decoding"""
+    from llama_cpp import Llama
+
+    llm = Llama(**params)
+    try:
+        prompt_tokens = decode_count = 0
+        prompt_s = decode_s = 0.0
+
+        for prompt in prompts:
+            tokens = llm.tokenize(prompt.encode("utf-8"))
+            if len(tokens) + decode_tokens > params["n_ctx"]:
+                raise ValueError(f"n_ctx={params['n_ctx']} too small for the benchmark prompts")
+
+            llm.reset()
+            start = time.perf_counter()
+            llm.eval(tokens)
+            prompt_s += time.perf_counter() - start
+            prompt_tokens += len(tokens)
+
+            start = time.perf_counter()
+            for _ in range(decode_tokens):
+                token = llm.sample(temp=0.0)
+                if token == llm.token_eos():
+                    break
+                llm.eval([token])
+                decode_count += 1
+            decode_s += time.perf_counter() - start
+    finally:
+        llm.close()
+
+    prompt_tps = prompt_tokens / prompt_s if prompt_s else 0.0
+    decode_tps = decode_count / decode_s if decode_s else 0.0
+    avg_prompt = prompt_tokens / len(prompts)
+
+    # Objective: latency of one typical sample (average prompt + full budget)
+    sample_s = avg_prompt / prompt_tps + MAX_NEW_TOKENS / decode_tps if prompt_tps and decode_tps else float("inf")
+
+    return {
+        "prompt_tokens_per_s": round(prompt_tps, 2),
+        "decode_tokens_per_s": round(decode_tps, 2),
+        "est_sample_s": round(sample_s, 3)
+    }
+
+def default_grid() -> Dict[str, List[int]]:
+    """Candidate values scaled to this host's core count"""
+    cpus = os.cpu_count() or 8
+    threads = sorted({max(1, cpus * k // 8) for k in (2, 4, 6, 8)})
+    return {
+        "n_threads": threads,
+        "n_threads_batch": threads,
+        "n_batch": [128, 512, 2048],
+        "n_ctx": [2048, 4096],
+    }
+
+def sweep(model_path: str, grid: Dict[str, List[int]], decode_tokens: int = 64,
+          languages: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Coordinate-descent sweep: tune one parameter at a time, keeping the best
+    value found so far for the others. A full grid would need a model reload
+    per combination; one pass per axis gets within noise of it.
+    """
+    prompts = benchmark_prompts(languages)
+    best = {**MODEL_PARAMS, "model_path": model_path, "verbose": False}
+    results = []
+    best_time = float("inf")
+
+    for name in TUNED_PARAMS:
+        for value in grid.get(name, []):
+            params = {**best, name: value}
+            try:
+                metrics = measure(params, prompts, decode_tokens)
+            except Exception as e:
+                logger.warning(f"{name}={value} failed: {e}")
+                continue
+
+            record = {k: params.get(k) for k in TUNED_PARAMS}
+            record.update(metrics)
+            results.append(record)
+            logger.info(f"{record}")
+
+            if metrics["est_sample_s"] < best_time:
+                best_time = metrics["est_sample_s"]
+                best = params
+
+    return {
+        "params": {k: best.get(k) for k in TUNED_PARAMS if best.get(k) is not None},
+        "results": results
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune llama.cpp CPU parameters for this host")
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="Registered model name")
+    parser.add_argument("--output", default=TUNING_PROFILE_PATH, help="Tuning profile to update")
+    parser.add_argument("--decode-tokens", type=int, default=64, help="Tokens decoded per prompt")
+    parser.add_argument("--languages", nargs="*", help="Limit benchmark prompts to these languages")
+    for name in TUNED_PARAMS:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, nargs="*",
+                            help=f"Candidate {name} values")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+
+    if args.model not in MODEL_REGISTRY:
+        parser.error(f"Unknown model: {args.model}")
+    model_path = MODEL_REGISTRY[args.model]["model_path"]
+
+    grid = default_grid()
+    for name in TUNED_PARAMS:
+        values = getattr(args, name)
+        if values:
+            grid[name] = values
+
+    logger.info(f"Tuning {model_path} on {host_key()} with grid {grid}")
+    tuned = sweep(model_path, grid, args.decode_tokens, args.languages)
+    if not tuned["results"]:
+        raise SystemExit("No configuration completed - nothing written")
+
+    save_tuning_profile(model_path, tuned["params"], tuned["results"], args.output)
+    logger.info(f"Best parameters {tuned['params']} written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import os
+import re
+import ast
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+from .config import LANGUAGE_CONFIGS, VALIDATION_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# SYNTAX VALIDATORS
+# ============================================================================
+#
+# Each language's ``syntax_check`` in LANGUAGE_CONFIGS names a validator
+# registered here. A validator returns (valid, message) for a candidate, or
+# None when it cannot decide (e.g. its compiler is not installed), in which
+# case the candidate is accepted as before. External front-ends run in at
+# most ``max_concurrency`` subprocesses at once; verdicts are cached by a hash
+# of the language and code, so repeated candidates are checked once.
+
+# validator(code) -> (valid, message), or None if undecided
+Validator = Callable[[str], Optional[Tuple[bool, str]]]
+
+_registry: Dict[str, Validator] = {}
+
+def register(name: str, tools: Tuple[str, ...] = (), pure: bool = False):
+    """
+    Register a validator; it is only used if every tool in ``tools`` is on
+    PATH. A ``pure`` validator always gives the same code the same verdict,
+    so even its undecided verdicts are cached.
+    """
+    def decorator(fn: Validator) -> Validator:
+        fn.tools = tools
+        fn.pure = pure
+        _registry[name] = fn
+        return fn
+    return decorator
+
+def available(name: str) -> bool:
+    fn = _registry.get(name)
+    return fn is not None and all(shutil.which(tool) for tool in fn.tools)
+
+_SQL_SYNTAX_ERRORS = ("syntax error", "incomplete input", "unrecognized token")
+# A statement of nothing but whitespace and comments
+_SQL_BLANK = re.compile(r"(?:\s|;|--[^\n]*|/\*.*?\*/)*", re.DOTALL)
+# Postgres, MySQL and T-SQL constructs SQLite cannot parse; a statement using
+# one is not failed on SQLite's syntax error
+_SQL_DIALECT_CONSTRUCTS = re.compile(r"""
+    ::                                              # Postgres cast
+  | \$\w*\$                                         # dollar quoting
+  | (?:^|\s)\#                                      # MySQL comment
+  | \b(?:I|R)LIKE\b | \bSIMILAR\s+TO\b
+  | \bTOP\s*\(?\s*\d
+  | ^(?:SHOW|DESCRIBE|DESC|USE|START|LOCK|UNLOCK|TRUNCATE|SET|DECLARE|GO|EXEC|EXECUTE
+      |MERGE|GRANT|REVOKE|COPY|COMMENT|CALL|PRINT|DELIMITER)\b
+  | (?m:^\s*GO\s*$)                                 # T-SQL batch separator
+  | \bCREATE\s+(?:OR\s+REPLACE\b|(?:TEMP\w*\s+)?(?:FUNCTION|PROCEDURE|SEQUENCE|SCHEMA
+      |DATABASE|EXTENSION|TYPE|USER|ROLE)\b|(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\b)
+  | \bALTER\s+TABLE\b[^;]*?\b(?:MODIFY|CHANGE|ALTER|(?:ADD|DROP)\s+CONSTRAINT)\b
+  | \b(?:ENGINE|CHARSET|AUTO_INCREMENT)\s*=
+  | \bFETCH\s+(?:FIRST|NEXT)\b | \bOFFSET\s+\d+\s+ROWS?\b
+  | \bFOR\s+(?:UPDATE|SHARE)\b | \bEXECUTE\s+(?:FUNCTION|PROCEDURE)\b | \bLATERAL\b | \bDISTINCT\s+ON\b | \bARRAY\s*\[
+  | \bON\s+DUPLICATE\s+KEY\b | \bWITH\s*\(\s*NOLOCK\b | \bWITH\s+ROLLUP\b
+  | \bPARTITION\s+BY\s+(?:RANGE|LIST|HASH)\b | \bTABLESAMPLE\b | \bBEGIN\s+TRAN\b
+  | \bSELECT\b[^;]*?\bINTO\s+\w+\s+FROM\b | \bEXTRACT\s*\(\s*\w+\s+FROM\b
+  | \bVACUUM\s+(?:ANALYZE|FULL|VERBOSE)\b | \bINTERVAL\s+'
+""", re.IGNORECASE | re.VERBOSE | re.DOTALL)
+
+_subprocesses = threading.BoundedSemaphore(VALIDATION_CONFIG["max_concurrency"])
+
+def _run_front_end(command: List[str], filename: str, code: str) -> Optional[Tuple[bool, str]]:
+    """Write ``code`` to ``filename`` in a scratch directory and run ``command`` on it"""
+    with _subprocesses, tempfile.TemporaryDirectory(prefix="syntax-") as directory:
+        path = os.path.join(directory, filename)
+        with open(path, "w") as f:
+            f.write(code)
+        try:
+            completed = subprocess.run(
+                command + [path],
+                cwd=directory,
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=VALIDATION_CONFIG["timeout_s"]
+            )
+        except subprocess.TimeoutExpired:
+            return None
+        except OSError as e:
+            logger.warning(f"⚠️ Syntax check {command[0]} failed to run: {e}")
+            return None
+    message = (completed.stderr or completed.stdout).strip().replace(path, filename)
+    return completed.returncode == 0, message[:500]
+
+@register("ast")
+def _python(code: str) -> Optional[Tuple[bool, str]]:
+    try:
+        ast.parse(code)
+        return True, ""
+    except (SyntaxError, ValueError) as e:
+        return False, str(e)
+
+@register("sqlite", pure=True)
+def _sql(code: str) -> Optional[Tuple[bool, str]]:
+    """
+    Compile every statement with EXPLAIN against an empty in-memory database;
+    only syntax errors count (unknown tables and columns are expected). Unless
+    the configured dialect is SQLite, a statement using a known Postgres,
+    MySQL or T-SQL construct (``::``, ``ILIKE``, ``TOP n``, ...) that SQLite
+    rejects leaves the verdict undecided, unless it also stops short or
+    leaves a quote open, which no dialect accepts.
+    """
+    statements, statement = [], ""
+    for piece in code.split(";"):
+        statement += piece + ";"
+        if sqlite3.complete_statement(statement):
+            statements.append(statement)
+            statement = ""
+    # Whatever never completed: trailing comments, an open quote, a trigger without END
+    statements.append(statement)
+
+    strict = VALIDATION_CONFIG["sql_dialect"] == "sqlite"
+    db = sqlite3.connect(":memory:")
+    try:
+        undecided = False
+        for statement in statements:
+            if _SQL_BLANK.fullmatch(statement):
+                continue
+            try:
+                db.execute("EXPLAIN " + statement)
+            except sqlite3.Warning:
+                pass
+            except sqlite3.Error as e:
+                message = str(e)
+                if not any(error in message for error in _SQL_SYNTAX_ERRORS):
+                    continue
+                if strict or _sql_error_is_portable(statement, message) or not _sql_dialect_construct(statement):
+                    return False, message
+                undecided = True
+        return None if undecided else (True, "")
+    finally:
+        db.close()
+
+def _sql_error_is_portable(statement: str, message: str) -> bool:
+    """
+    Whether SQLite's syntax error would be one in any dialect: the statement
+    stops short of its closing ";" (e.g. a truncated sample), or leaves a
+    string or quoted name open
+    """
+    if message.startswith('near ";"'):
+        return True
+    # MySQL escapes quotes with a backslash, which SQLite reads as a closing quote
+    return re.match(r"""unrecognized token: "['"]""", message) is not None and "\\" not in statement
+
+def _sql_dialect_construct(statement: str) -> bool:
+    """Whether the statement uses a construct of another SQL dialect"""
+    body = statement[_SQL_BLANK.match(statement).end():]
+    return _SQL_DIALECT_CONSTRUCTS.search(body) is not None
+
+@register("node", tools=("node",))
+def _javascript(code: str) -> Optional[Tuple[bool, str]]:
+    # ES module syntax is only accepted in .mjs files
+    module = re.search(r"^\s*(import|export)\s", code, re.MULTILINE) is not None
+    return _run_front_end(["node", "--check"], "candidate.mjs" if module else "candidate.js", code)
+
+@register("javac", tools=("javac",))
+def _java(code: str) -> Optional[Tuple[bool, str]]:
+    # A public class must live in a file of the same name
+    match = re.search(r"\bpublic\s+(?:(?:final|abstract)\s+)*(?:class|interface|enum|record)\s+(\w+)", code)
+    filename = f"{match.group(1) if match else 'Main'}.java"
+    return _run_front_end(["javac", "-proc:none", "-Xlint:none", "-d", "."], filename, code)
+
+@register("g++", tools=("g++",))
+def _cpp(code: str) -> Optional[Tuple[bool, str]]:
+    return _run_front_end(["g++", "-fsyntax-only", "-std=c++17", "-x", "c++"], "candidate.cpp", code)
+
+@register("gcc", tools=("gcc",))
+def _c(code: str) -> Optional[Tuple[bool, str]]:
+    return _run_front_end(["gcc", "-fsyntax-only", "-std=c11", "-x", "c"], "candidate.c", code)
+
+class SyntaxValidator:
+    """Runs each language's registered validator, with an LRU cache of verdicts"""
+
+    def __init__(self, cache_size: int = VALIDATION_CONFIG["cache_size"]):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Tuple[bool, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"checked": 0, "rejected": 0, "undecided": 0, "cache_hits": 0}
+        self._available: Dict[str, bool] = {}
+
+    def _validator(self, language: str) -> Optional[Validator]:
+        name = LANGUAGE_CONFIGS.get(language, {}).get("syntax_check")
+        if name not in self._available:
+            self._available[name] = available(name)
+            if name in _registry and not self._available[name]:
+                logger.warning(f"⚠️ Syntax check '{name}' for {language} unavailable - {_registry[name].tools[0]} not found")
+        return _registry[name] if self._available[name] else None
+
+    def validate(self, code: str, language: str) -> Tuple[bool, str]:
+        """(valid, message); candidates no validator can judge are valid"""
+        validator = self._validator(language)
+        if validator is None:
+            return True, ""
+
+        key = hashlib.sha256(f"{language}\0{code}".encode("utf-8", "surrogatepass")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return cached
+
+        verdict = validator(code)
+        with self._lock:
+            self.stats["checked"] += 1
+            if verdict is None:
+                self.stats["undecided"] += 1
+                if not validator.pure:
+                    # Timed out or could not run: accept, but do not remember
+                    return True, ""
+                verdict = (True, "")
+            if not verdict[0]:
+                self.stats["rejected"] += 1
+            self._cache[key] = verdict
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return verdict
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            cached = len(self._cache)
+        return {
+            "validators": {
+                language: {
+                    "check": config["syntax_check"],
+                    "available": available(config["syntax_check"])
+                }
+                for language, config in LANGUAGE_CONFIGS.items()
+            },
+            "max_concurrency": VALIDATION_CONFIG["max_concurrency"],
+            "cached": cached,
+            **stats
+        }
+
+syntax_validator = SyntaxValidator()
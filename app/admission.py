@@ -0,0 +1,429 @@
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import deque, OrderedDict
+from typing import Dict, Any, List, Callable, Optional
+
+from agent_v2.config import NUM_SAMPLES
+
+from .config import ADMISSION_CONFIG, ADMISSION_LANES, DEFAULT_LANE, ADAPTIVE_SAMPLES_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Recent requests kept per lane for latency percentiles
+LATENCY_WINDOW = 200
+
+# ============================================================================
+# ADMISSION CONTROL
+# ============================================================================
+
+class Overloaded(Exception):
+    """Request rejected by admission control; maps to an HTTP error with Retry-After"""
+
+    def __init__(self, detail: str, retry_after: float, status_code: int = 503):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status_code = status_code
+
+class Ticket:
+    """
+    A request's place in the generation queue; use as a context manager to run
+
+    The controller grants tickets itself as slots free up. ``with ticket``
+    blocks the calling thread until the grant; ``async with ticket`` waits on
+    the event loop, so a queued request holds no worker thread.
+    """
+
+    def __init__(self, controller: "AdmissionController", lane: str, client: str):
+        self.controller = controller
+        self.lane = lane
+        self.client = client
+        self.enqueued = time.time()
+        self.started: Optional[float] = None
+        self.granted = False
+        self.cancelled = False
+        # Set (with the callbacks run) when the ticket is granted or cancelled
+        self._woken = threading.Event()
+        self._on_wake: List[Callable[[], None]] = []
+
+    def __enter__(self) -> "Ticket":
+        self.controller._wait_turn(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.controller._finish(self)
+        return False
+
+    async def __aenter__(self) -> "Ticket":
+        await self.controller._wait_turn_async(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.controller._finish(self)
+        return False
+
+    def _wake(self):
+        """Signal the waiter; called with the controller's lock held"""
+        self._woken.set()
+        for callback in self._on_wake:
+            callback()
+        self._on_wake = []
+
+    def cancel(self):
+        """Give up the place in the queue (e.g. the client went away)"""
+        self.controller._cancel(self)
+
+class FairQueue:
+    """Waiting tickets of one lane: FIFO per client, round-robin across clients"""
+
+    def __init__(self):
+        self._clients: "OrderedDict[str, deque[Ticket]]" = OrderedDict()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, ticket: Ticket) -> bool:
+        return ticket in self._clients.get(ticket.client, ())
+
+    def append(self, ticket: Ticket):
+        self._clients.setdefault(ticket.client, deque()).append(ticket)
+        self._size += 1
+
+    def head(self) -> Optional[Ticket]:
+        """Next ticket in round-robin order"""
+        for tickets in self._clients.values():
+            return tickets[0]
+        return None
+
+    def oldest(self) -> Optional[Ticket]:
+        return min((tickets[0] for tickets in self._clients.values()),
+                   key=lambda t: t.enqueued, default=None)
+
+    def remove(self, ticket: Ticket):
+        tickets = self._clients[ticket.client]
+        tickets.remove(ticket)
+        self._size -= 1
+        if not tickets:
+            del self._clients[ticket.client]
+
+    def pop(self, ticket: Ticket):
+        """Remove a ticket being served; its client goes to the back of the rotation"""
+        self.remove(ticket)
+        if ticket.client in self._clients:
+            self._clients.move_to_end(ticket.client)
+
+    def clients(self) -> int:
+        return len(self._clients)
+
+class Lane:
+    """One priority class: its queue, share weight and metrics"""
+
+    def __init__(self, name: str, weight: float, max_queue: int, max_wait_s: float):
+        self.name = name
+        self.weight = weight
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.queue = FairQueue()
+        # Stride scheduling: virtual time advances by 1/weight per grant
+        self.vtime = 0.0
+        self.active = 0
+        self.stats = {"admitted": 0, "rejected": 0, "completed": 0, "cancelled": 0,
+                      "timed_out": 0, "aged": 0}
+        # Recent queue waits and end-to-end latencies (queue + generation)
+        self.waits: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+        self.latencies: "deque[float]" = deque(maxlen=LATENCY_WINDOW)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "weight": self.weight,
+            "depth": len(self.queue),
+            "max_depth": self.max_queue,
+            "clients": self.queue.clients(),
+            "active": self.active,
+            "queue_wait_s": _percentiles(self.waits),
+            "latency_s": _percentiles(self.latencies),
+            "stats": dict(self.stats)
+        }
+
+def _percentiles(values) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
+    return {"p50": pick(0.5), "p95": pick(0.95)}
+
+class AdmissionController:
+    """
+    Bounded, multi-lane queue in front of generation
+
+    At most ``concurrency`` generations run at once. Waiting requests sit in
+    per-lane queues (e.g. interactive and bulk), served round-robin across
+    clients so one client cannot crowd out the others. A free slot goes to
+    the lane with the least weighted service so far (stride scheduling), so
+    lanes share capacity in proportion to their weights. A request that has waited
+    longer than ``aging_s`` goes first regardless of lane, so a low-weight
+    lane is never starved. Requests are rejected immediately, with a
+    Retry-After estimated from recent service times, when their lane is full
+    or its expected wait exceeds the lane's ``max_wait_s``.
+
+    Slots are handed out by the controller whenever one frees up (admission,
+    completion, cancellation), not claimed by polling waiters, so the order
+    of grants never depends on which waiters happen to hold a thread.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = ADMISSION_CONFIG["concurrency"],
+        lanes: Dict[str, Dict[str, Any]] = ADMISSION_LANES,
+        initial_service_s: float = ADMISSION_CONFIG["initial_service_s"],
+        aging_s: float = ADMISSION_CONFIG["aging_s"]
+    ):
+        self.concurrency = concurrency
+        self.aging_s = aging_s
+        self.lanes = {name: Lane(name, **spec) for name, spec in lanes.items()}
+        self._lock = threading.Lock()
+        self._vtime = 0.0
+        self.active = 0
+        # Exponentially weighted moving average of generation time
+        self.service_time_s = initial_service_s
+
+    @property
+    def depth(self) -> int:
+        return sum(len(lane.queue) for lane in self.lanes.values())
+
+    @property
+    def max_queue(self) -> int:
+        return sum(lane.max_queue for lane in self.lanes.values())
+
+    def saturation(self) -> float:
+        """Fill level (0-1) of the fullest lane queue"""
+        return max(len(lane.queue) / max(1, lane.max_queue) for lane in self.lanes.values())
+
+    def backlog(self) -> float:
+        """Queued requests per slot: 0 while a slot is free, 1 once a full round waits"""
+        return self.depth / max(1, self.concurrency)
+
+    def estimated_wait(self, lane_name: str = DEFAULT_LANE) -> float:
+        """Expected queueing delay for a new request in ``lane_name``"""
+        lane = self.lanes[lane_name]
+        if self.active < self.concurrency and self.depth == 0:
+            return 0.0
+        # Grants before ours: our lane's queue, plus each other lane's
+        # weighted share of the same period
+        mine = len(lane.queue) + 1
+        ahead = len(lane.queue) + sum(
+            min(len(other.queue), mine * other.weight / lane.weight)
+            for other in self.lanes.values() if other is not lane
+        )
+        # Each "round" of `concurrency` requests takes about one service time
+        return (int(ahead) // self.concurrency + 1) * self.service_time_s
+
+    def admit(self, lane_name: str = DEFAULT_LANE, client: str = "anonymous") -> Ticket:
+        """Reserve a place in the lane's queue or raise Overloaded; never blocks"""
+        if lane_name not in self.lanes:
+            raise ValueError(f"Unknown lane: {lane_name} (use one of {', '.join(self.lanes)})")
+        lane = self.lanes[lane_name]
+
+        with self._lock:
+            if len(lane.queue) >= lane.max_queue:
+                lane.stats["rejected"] += 1
+                raise Overloaded(
+                    "Server is at capacity, please retry later",
+                    self.estimated_wait(lane_name)
+                )
+
+            wait = self.estimated_wait(lane_name)
+            if wait > lane.max_wait_s:
+                lane.stats["rejected"] += 1
+                raise Overloaded(
+                    f"Estimated queue wait {wait:.0f}s exceeds the limit",
+                    wait
+                )
+
+            if not lane.queue:
+                # A lane returning from idle does not get credit for the idle time
+                lane.vtime = max(lane.vtime, self._vtime)
+            ticket = Ticket(self, lane_name, client)
+            lane.queue.append(ticket)
+            lane.stats["admitted"] += 1
+            self._dispatch()
+            return ticket
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        """The ticket that gets the next free slot"""
+        lanes = [lane for lane in self.lanes.values() if lane.queue]
+        if not lanes:
+            return None
+        oldest = min((lane.queue.oldest() for lane in lanes), key=lambda t: t.enqueued)
+        if time.time() - oldest.enqueued >= self.aging_s:
+            return oldest
+        lane = min(lanes, key=lambda lane: (lane.vtime, lane.queue.head().enqueued))
+        return lane.queue.head()
+
+    def _dispatch(self):
+        """Grant free slots to the tickets scheduled next; holds the lock"""
+        while self.active < self.concurrency:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            lane = self.lanes[ticket.lane]
+            if time.time() - ticket.enqueued >= self.aging_s:
+                lane.stats["aged"] += 1
+            lane.queue.pop(ticket)
+            self._vtime = max(self._vtime, lane.vtime)
+            lane.vtime += 1.0 / lane.weight
+            self.active += 1
+            lane.active += 1
+            ticket.granted = True
+            ticket.started = time.time()
+            lane.waits.append(ticket.started - ticket.enqueued)
+            ticket._wake()
+
+    def _remaining(self, ticket: Ticket) -> float:
+        """Seconds the ticket may still wait in its lane's queue"""
+        return max(0.0, ticket.enqueued + self.lanes[ticket.lane].max_wait_s - time.time())
+
+    def _wait_turn(self, ticket: Ticket):
+        """Block the calling thread until the ticket is granted"""
+        ticket._woken.wait(self._remaining(ticket))
+        self._claim(ticket)
+
+    async def _wait_turn_async(self, ticket: Ticket):
+        """Wait on the event loop until the ticket is granted"""
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        with self._lock:
+            if ticket._woken.is_set():
+                woken.set()
+            else:
+                ticket._on_wake.append(lambda: loop.call_soon_threadsafe(woken.set))
+        try:
+            await asyncio.wait_for(woken.wait(), self._remaining(ticket))
+        except asyncio.TimeoutError:
+            pass
+        except BaseException:
+            # The request itself was cancelled: give up the place or the slot
+            self._cancel(ticket)
+            with self._lock:
+                self._free_slot(ticket)
+            raise
+        self._claim(ticket)
+
+    def _claim(self, ticket: Ticket):
+        """After waiting: return if granted, else leave the queue and raise Overloaded"""
+        with self._lock:
+            if ticket.cancelled:
+                self._free_slot(ticket)
+                raise Overloaded("Request cancelled while queued", 1)
+            if ticket.granted:
+                return
+            lane = self.lanes[ticket.lane]
+            lane.queue.remove(ticket)
+            lane.stats["timed_out"] += 1
+            raise Overloaded("Timed out waiting in the queue", self.estimated_wait(ticket.lane))
+
+    def _free_slot(self, ticket: Ticket) -> bool:
+        """Return a granted ticket's slot and grant it onwards; holds the lock"""
+        if not ticket.granted:
+            return False
+        lane = self.lanes[ticket.lane]
+        self.active -= 1
+        lane.active -= 1
+        ticket.granted = False
+        self._dispatch()
+        return True
+
+    def _finish(self, ticket: Ticket):
+        """Free the slot and fold the service time into the estimate"""
+        with self._lock:
+            if ticket.granted:
+                lane = self.lanes[ticket.lane]
+                now = time.time()
+                alpha = ADMISSION_CONFIG["ewma_alpha"]
+                self.service_time_s = (1 - alpha) * self.service_time_s + alpha * (now - ticket.started)
+                lane.latencies.append(now - ticket.enqueued)
+                lane.stats["completed"] += 1
+                self._free_slot(ticket)
+
+    def _cancel(self, ticket: Ticket):
+        with self._lock:
+            lane = self.lanes[ticket.lane]
+            if not ticket.cancelled:
+                ticket.cancelled = True
+                lane.stats["cancelled"] += 1
+            if ticket in lane.queue:
+                lane.queue.remove(ticket)
+            ticket._wake()
+
+    def status(self) -> Dict[str, Any]:
+        """Queue depth, running generations, wait estimates and per-lane metrics for /health"""
+        with self._lock:
+            lanes = {name: lane.status() for name, lane in self.lanes.items()}
+            for name in lanes:
+                lanes[name]["estimated_wait_s"] = round(self.estimated_wait(name), 1)
+            return {
+                "depth": self.depth,
+                "max_depth": self.max_queue,
+                "active": self.active,
+                "concurrency": self.concurrency,
+                "service_time_s": round(self.service_time_s, 2),
+                "estimated_wait_s": round(self.estimated_wait(), 1),
+                "stats": {
+                    key: sum(lane.stats[key] for lane in self.lanes.values())
+                    for key in ("admitted", "rejected", "completed", "cancelled", "timed_out")
+                },
+                "lanes": lanes
+            }
+
+class AdaptiveSamplePolicy:
+    """
+    Lowers the self-consistency sample count under load
+
+    Pressure is the larger of queue saturation (fullest lane) and backlog
+    (queued requests per slot, capped at 1), smoothed with an EWMA. Both come
+    from the admission controller, never from host CPU load: the server's own
+    decoding keeps every core busy, so load average would read as pressure
+    with a single request in flight. Below ``low_pressure`` requests get the
+    full NUM_SAMPLES, above ``high_pressure`` they get ``min_samples``,
+    linearly in between.
+    """
+
+    def __init__(self, controller: AdmissionController, config: Dict[str, Any] = ADAPTIVE_SAMPLES_CONFIG):
+        self.controller = controller
+        self.config = config
+        self.pressure = 0.0
+        self._lock = threading.Lock()
+
+    def _current_pressure(self) -> float:
+        return min(1.0, max(self.controller.saturation(), self.controller.backlog()))
+
+    def sample_count(self) -> int:
+        """Samples to use for the next request"""
+        if not self.config["enabled"]:
+            return NUM_SAMPLES
+
+        alpha = self.config["ewma_alpha"]
+        with self._lock:
+            self.pressure = (1 - alpha) * self.pressure + alpha * self._current_pressure()
+            pressure = self.pressure
+        return self._samples_for(pressure)
+
+    def _samples_for(self, pressure: float) -> int:
+        low, high = self.config["low_pressure"], self.config["high_pressure"]
+        floor = min(self.config["min_samples"], NUM_SAMPLES)
+        fraction = min(1.0, max(0.0, (pressure - low) / max(1e-6, high - low)))
+        return max(floor, round(NUM_SAMPLES - fraction * (NUM_SAMPLES - floor)))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config["enabled"],
+            "pressure": round(self.pressure, 2),
+            "samples": self._samples_for(self.pressure) if self.config["enabled"] else NUM_SAMPLES
+        }
+
+admission = AdmissionController()
+sample_policy = AdaptiveSamplePolicy(admission)
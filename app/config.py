@@ -1,8 +1,11 @@
 import logging
 import os
+import json
 from datetime import datetime
 from pathlib import Path
 
+from agent_v2.config import MAX_PROMPT_CHARS
+
 # ============================================================================
 # LOGGING CONFIGURATION
 # ============================================================================
@@ -70,5 +73,88 @@ BOT_NAMES = {
 
 SUPPORTED_LANGUAGES = list(BOT_NAMES.keys())
 
+# Admission control in front of generation: concurrent generations shared by
+# all priority lanes
+ADMISSION_CONFIG = {
+    "concurrency": int(os.getenv("ADMISSION_CONCURRENCY", "2")),
+    # Service-time estimate before any request has completed, and EWMA weight
+    "initial_service_s": float(os.getenv("ADMISSION_INITIAL_SERVICE_S", "30")),
+    "ewma_alpha": 0.2,
+    # A request queued longer than this is served next whatever its lane
+    "aging_s": float(os.getenv("ADMISSION_AGING_S", "30")),
+}
+
+# Priority lanes: free slots are shared in proportion to weight among lanes
+# with waiting requests. Each lane has its own queue bound and longest
+# accepted queue wait before shedding load.
+ADMISSION_LANES = {
+    "interactive": {
+        "weight": 4,
+        "max_queue": int(os.getenv("ADMISSION_MAX_QUEUE", "16")),
+        "max_wait_s": float(os.getenv("ADMISSION_MAX_WAIT_S", "120")),
+    },
+    "bulk": {
+        "weight": 1,
+        "max_queue": int(os.getenv("ADMISSION_BULK_MAX_QUEUE", "64")),
+        "max_wait_s": float(os.getenv("ADMISSION_BULK_MAX_WAIT_S", "900")),
+    },
+}
+DEFAULT_LANE = "interactive"
+# Lane used by /api/jobs when the request does not name one
+JOBS_LANE = "bulk"
+
+# API keys (X-API-Key header) mapped to their default lane, as JSON,
+# e.g. API_KEY_LANES='{"nightly-pregen": "bulk"}'
+API_KEY_LANES = json.loads(os.getenv("API_KEY_LANES", "{}"))
+
+# Per-client rate limits (client = X-API-Key, else IP address): token buckets
+# in requests and in generated tokens. Set RATE_LIMIT_DB to share the buckets
+# between worker processes on one host through a SQLite file.
+RATE_LIMIT_CONFIG = {
+    "enabled": os.getenv("RATE_LIMIT", "true").lower() == "true",
+    "requests_per_min": float(os.getenv("RATE_LIMIT_REQUESTS_PER_MIN", "30")),
+    "request_burst": float(os.getenv("RATE_LIMIT_REQUEST_BURST", "10")),
+    "tokens_per_min": float(os.getenv("RATE_LIMIT_TOKENS_PER_MIN", "30000")),
+    "token_burst": float(os.getenv("RATE_LIMIT_TOKEN_BURST", "60000")),
+    "shared_db_path": os.getenv("RATE_LIMIT_DB"),
+    # Clients idle this long are forgotten (their buckets would be full anyway)
+    "idle_ttl_s": 3600,
+}
+
+# How often an in-flight /api/generate request checks whether its client is
+# still connected; generation is cancelled when it has gone
+DISCONNECT_POLL_S = float(os.getenv("DISCONNECT_POLL_S", "0.05"))
+
+# Load-adaptive self-consistency: the number of samples per request falls from
+# NUM_SAMPLES towards min_samples as the admission queue grows (fill level, or
+# queued requests per slot) between the low and high pressure marks (0 = no
+# request waiting, 1 = saturated), and recovers with it
+ADAPTIVE_SAMPLES_CONFIG = {
+    "enabled": os.getenv("ADAPTIVE_SAMPLES", "true").lower() == "true",
+    "min_samples": int(os.getenv("ADAPTIVE_MIN_SAMPLES", "3")),
+    "low_pressure": float(os.getenv("ADAPTIVE_LOW_PRESSURE", "0.25")),
+    "high_pressure": float(os.getenv("ADAPTIVE_HIGH_PRESSURE", "0.75")),
+    # Smoothing of the pressure signal so the sample count does not flap
+    "ewma_alpha": 0.3,
+}
+
+# Asynchronous jobs (/api/jobs): SQLite queue shared by every worker process.
+# A worker holds a job's lease while generating and renews it; a job whose
+# lease expires (e.g. the process died) is picked up again.
+JOBS_CONFIG = {
+    "db_path": os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3"),
+    "workers": int(os.getenv("JOBS_WORKERS", "1")),
+    "lease_s": float(os.getenv("JOBS_LEASE_S", "60")),
+    "max_attempts": int(os.getenv("JOBS_MAX_ATTEMPTS", "3")),
+    # Finished jobs (and their results) are deleted after this long
+    "ttl_s": float(os.getenv("JOBS_TTL_S", str(24 * 3600))),
+    "poll_interval_s": 1.0,
+    "cleanup_interval_s": 300,
+}
+
+# Token required in the X-Admin-Token header for /api/admin endpoints.
+# Admin endpoints are disabled when unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
 # Application startup time
 startup_time = datetime.now()
@@ -1,21 +1,63 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from datetime import datetime
+import asyncio
 import logging
 
+from agent_v2.sandbox import verification_pool
+
 from .config import SUPPORTED_LANGUAGES, startup_time
-from .utils import SECURITY_PATTERNS
-from .routes import router, agent
+from .utils import prompt_guardrails
+from . import routes
+from .routes import router
 
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start model loading in the background, log startup and shutdown"""
+    
+    # Load (and warm up) the model off the event loop so static, info and
+    # health endpoints answer immediately
+    app.state.agent_loader = asyncio.create_task(asyncio.to_thread(routes.load_agent))
+    
+    # Job workers lease from the persistent queue once the agent is ready
+    routes.start_jobs()
+    
+    # Candidate verification workers start in every serving process (never
+    # in a pre-fork parent, whose children would share their pipes)
+    app.state.verification_starter = asyncio.create_task(asyncio.to_thread(verification_pool.start))
+    
+    logger.info("✨ " + "=" * 76 + " ✨")
+    logger.info("✨ CODE WIZARD API - ACCEPTING REQUESTS")
+    logger.info("✨ " + "=" * 76 + " ✨")
+    logger.info(f"🌐 Supported Languages: {', '.join(SUPPORTED_LANGUAGES)}")
+    logger.info(f"🤖 Agent Status: {'✅ Ready' if routes.agent else '⏳ Loading in background'}")
+    logger.info(f"🔐 Security Patterns: {len(prompt_guardrails.rules)} rules loaded")
+    logger.info(f"📍 API Documentation: http://localhost:8000/docs")
+    logger.info("✨ " + "=" * 76 + " ✨")
+    
+    yield
+    
+    await asyncio.to_thread(routes.stop_jobs)
+    await asyncio.to_thread(verification_pool.close)
+    
+    logger.info("=" * 80)
+    logger.info("👋 CODE WIZARD API - SHUTTING DOWN")
+    logger.info("=" * 80)
+    uptime = datetime.now() - startup_time
+    logger.info(f"⏱️ Session Duration: {uptime}")
+    logger.info("=" * 80)
+
 def create_app() -> FastAPI:
     """Create and configure the FastAPI application"""
     
     app = FastAPI(
         title="Code Wizard API",
         description="Multi-Language Code Generator with AI",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     logger.info("✅ FastAPI application initialized")
@@ -34,29 +76,6 @@ def create_app() -> FastAPI:
     # Include routes
     app.include_router(router)
     
-    # Register events
-    @app.on_event("startup")
-    async def startup_event():
-        """Run on application startup"""
-        logger.info("✨ " + "=" * 76 + " ✨")
-        logger.info("✨ CODE WIZARD API - FULLY OPERATIONAL")
-        logger.info("✨ " + "=" * 76 + " ✨")
-        logger.info(f"🌐 Supported Languages: {', '.join(SUPPORTED_LANGUAGES)}")
-        logger.info(f"🤖 Agent Status: {'✅ Ready' if agent else '❌ Failed'}")
-        logger.info(f"🔐 Security Patterns: {len(SECURITY_PATTERNS)} rules loaded")
-        logger.info(f"📍 API Documentation: http://localhost:8000/docs")
-        logger.info("✨ " + "=" * 76 + " ✨")
-
-    @app.on_event("shutdown")
-    async def shutdown_event():
-        """Run on application shutdown"""
-        logger.info("=" * 80)
-        logger.info("👋 CODE WIZARD API - SHUTTING DOWN")
-        logger.info("=" * 80)
-        uptime = datetime.now() - startup_time
-        logger.info(f"⏱️ Session Duration: {uptime}")
-        logger.info("=" * 80)
-
     # Exception handlers
     @app.exception_handler(ValueError)
     async def value_error_handler(request, exc):
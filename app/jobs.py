@@ -0,0 +1,312 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, List
+
+from .config import JOBS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# PERSISTENT JOB QUEUE
+# ============================================================================
+#
+# Jobs live in SQLite so they outlive the request that created them and the
+# process that runs them. Every worker (thread or pre-forked process) leases
+# jobs from the same file; a lease is renewed while the job runs, and a job
+# whose lease lapses is handed to the next worker that asks.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished);
+"""
+
+class JobStore:
+    """SQLite-backed job queue with worker leases and TTL-based cleanup"""
+
+    def __init__(
+        self,
+        path: str = JOBS_CONFIG["db_path"],
+        lease_s: float = JOBS_CONFIG["lease_s"],
+        max_attempts: int = JOBS_CONFIG["max_attempts"],
+        ttl_s: float = JOBS_CONFIG["ttl_s"]
+    ):
+        self.path = path
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        self.ttl_s = ttl_s
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived autocommit connection per operation: safe across
+        # threads and fork()
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def submit(self, request: Dict[str, Any]) -> str:
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO jobs (id, status, request, created, updated) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(request), now, now)
+            )
+        return job_id
+
+    def lease(self, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        Claim the oldest runnable job: queued, or running under a lapsed lease
+        (its worker died). Jobs that lapse ``max_attempts`` times are failed.
+        """
+        with self._connect() as db:
+            while True:
+                now = time.time()
+                db.execute("BEGIN IMMEDIATE")
+                try:
+                    row = db.execute(
+                        "SELECT id, request, attempts FROM jobs "
+                        "WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?) "
+                        "ORDER BY created LIMIT 1",
+                        (now,)
+                    ).fetchone()
+                    if row is None:
+                        return None
+
+                    if row["attempts"] >= self.max_attempts:
+                        db.execute(
+                            "UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, "
+                            "updated = ?, finished = ? WHERE id = ?",
+                            (f"Gave up after {row['attempts']} attempts", now, now, row["id"])
+                        )
+                        continue
+
+                    db.execute(
+                        "UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                        "attempts = attempts + 1, progress = 0, updated = ? WHERE id = ?",
+                        (owner, now + self.lease_s, now, row["id"])
+                    )
+                    return {"id": row["id"], "request": json.loads(row["request"]), "attempt": row["attempts"] + 1}
+                except BaseException:
+                    db.execute("ROLLBACK")
+                    raise
+                finally:
+                    if db.in_transaction:
+                        db.execute("COMMIT")
+
+    def renew(self, job_id: str, owner: str, progress: Optional[float] = None) -> bool:
+        """Extend the lease (and record progress); False if the lease was lost"""
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + self.lease_s, progress, now, job_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, owner: str, result: Dict[str, Any]) -> bool:
+        return self._finish(job_id, owner, "done", result=json.dumps(result))
+
+    def fail(self, job_id: str, owner: str, error: str) -> bool:
+        """Record a failed attempt; the job is retried until ``max_attempts``"""
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, lease_owner = NULL, updated = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running' AND attempts < ?",
+                (error, now, job_id, owner, self.max_attempts)
+            )
+            if cursor.rowcount:
+                return True
+        return self._finish(job_id, owner, "failed", error=error)
+
+    def release(self, job_id: str, owner: str):
+        """Hand a job back to the queue without counting the attempt (e.g. on shutdown)"""
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'queued', lease_owner = NULL, attempts = attempts - 1, "
+                "progress = 0, updated = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (time.time(), job_id, owner)
+            )
+
+    def _finish(self, job_id: str, owner: str, status: str,
+                result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        now = time.time()
+        with self._connect() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, progress = 1, "
+                "lease_owner = NULL, updated = ?, finished = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (status, result, error, now, now, job_id, owner)
+            )
+            return cursor.rowcount == 1
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status, progress and result; None if unknown or expired"""
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "progress": round(row["progress"], 3),
+            "attempts": row["attempts"],
+            "created": row["created"],
+            "updated": row["updated"],
+            "expires": row["finished"] + self.ttl_s if row["finished"] else None,
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"]
+        }
+
+    def cleanup(self) -> int:
+        """Delete finished jobs older than the TTL"""
+        with self._connect() as db:
+            cursor = db.execute(
+                "DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?",
+                (time.time() - self.ttl_s,)
+            )
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, int]:
+        """Job counts by status"""
+        with self._connect() as db:
+            rows = db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({row["status"]: row["n"] for row in rows})
+        return counts
+
+# ============================================================================
+# JOB WORKERS
+# ============================================================================
+
+# runner(request, on_progress, cancel) -> result; raises on failure
+JobRunner = Callable[[Dict[str, Any], Callable[[float], None], threading.Event], Dict[str, Any]]
+
+class JobWorker:
+    """
+    Background threads that lease jobs and run them
+
+    ``ready()`` gates leasing (e.g. until the model has loaded). On stop, a
+    running job is cancelled and handed back to the queue for another worker.
+    """
+
+    def __init__(self, store: JobStore, runner: JobRunner, ready: Callable[[], bool],
+                 workers: int = JOBS_CONFIG["workers"],
+                 poll_interval_s: float = JOBS_CONFIG["poll_interval_s"],
+                 cleanup_interval_s: float = JOBS_CONFIG["cleanup_interval_s"]):
+        self.store = store
+        self.runner = runner
+        self.ready = ready
+        self.workers = workers
+        self.poll_interval_s = poll_interval_s
+        self.cleanup_interval_s = cleanup_interval_s
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"🗂️ Started {self.workers} job worker(s) on {self.store.path}")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _loop(self):
+        owner = f"{socket.gethostname()}-{os.getpid()}-{threading.current_thread().name}"
+        next_cleanup = 0.0
+        while not self._stop.is_set():
+            try:
+                if time.time() >= next_cleanup:
+                    removed = self.store.cleanup()
+                    if removed:
+                        logger.info(f"🧹 Removed {removed} expired job(s)")
+                    next_cleanup = time.time() + self.cleanup_interval_s
+
+                job = self.store.lease(owner) if self.ready() else None
+            except Exception as e:
+                logger.error(f"❌ Job queue error: {e}")
+                job = None
+
+            if job is None:
+                self._stop.wait(self.poll_interval_s)
+                continue
+            self._run(job, owner)
+
+    def _run(self, job: Dict[str, Any], owner: str):
+        job_id = job["id"]
+        logger.info(f"🗂️ Running job {job_id} (attempt {job['attempt']})")
+        cancel = threading.Event()
+        done = threading.Event()
+
+        def heartbeat():
+            # Renew the lease well before it lapses; stop work on shutdown or
+            # if the lease was lost
+            next_renew = time.time() + self.store.lease_s / 3
+            while not done.wait(self.poll_interval_s):
+                if self._stop.is_set():
+                    cancel.set()
+                if time.time() >= next_renew:
+                    if not self.store.renew(job_id, owner):
+                        logger.warning(f"⚠️ Lost lease on job {job_id} - cancelling")
+                        cancel.set()
+                        return
+                    next_renew = time.time() + self.store.lease_s / 3
+
+        threading.Thread(target=heartbeat, name=f"job-lease-{job_id[:8]}", daemon=True).start()
+        try:
+            result = self.runner(
+                job["request"],
+                lambda progress: self.store.renew(job_id, owner, progress),
+                cancel
+            )
+            if cancel.is_set():
+                self.store.release(job_id, owner)
+                logger.info(f"↩️ Job {job_id} handed back to the queue")
+            else:
+                self.store.complete(job_id, owner, result)
+                logger.info(f"✅ Job {job_id} done")
+        except Exception as e:
+            if cancel.is_set():
+                self.store.release(job_id, owner)
+            else:
+                logger.error(f"❌ Job {job_id} failed: {e}")
+                self.store.fail(job_id, owner, str(e))
+        finally:
+            done.set()
@@ -0,0 +1,141 @@
+import os
+import time
+import signal
+import socket
+import logging
+from typing import Dict, List
+
+import uvicorn
+
+from . import routes
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# PRE-FORK LAUNCHER
+# ============================================================================
+#
+# The parent loads the model once and forks the HTTP workers. The GGUF weights
+# are a read-only file mapping, so every worker shares the same physical pages;
+# each worker gets its own llama contexts (KV cache) and a pinned core slice.
+#
+# Nothing may decode in the parent before forking: llama.cpp's OpenMP and
+# thread pools do not survive fork(), so warm-up runs in each worker.
+
+RSS_REPORT_INTERVAL_S = 60
+
+def core_slices(workers: int) -> List[List[int]]:
+    """Split the cores this process may use into one contiguous slice per worker"""
+    cores = sorted(os.sched_getaffinity(0))
+    size = max(1, len(cores) // workers)
+    slices = [cores[i * size:(i + 1) * size] for i in range(workers)]
+    # Hand leftover cores to the last worker; reuse cores if there are too few
+    slices[-1] = cores[(workers - 1) * size:] or cores[-size:]
+    return [s or cores for s in slices]
+
+def memory_usage(pid: int) -> Dict[str, int]:
+    """Shared and private resident memory of a process, in kB, from smaps_rollup"""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    usage[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    return {
+        "rss_kb": usage.get("Rss", 0),
+        "pss_kb": usage.get("Pss", 0),
+        "shared_kb": usage.get("Shared_Clean", 0) + usage.get("Shared_Dirty", 0),
+        "private_kb": usage.get("Private_Clean", 0) + usage.get("Private_Dirty", 0),
+    }
+
+def log_memory(workers: Dict[int, List[int]]):
+    """Report shared versus private RSS for every worker"""
+    for pid, cores in workers.items():
+        usage = memory_usage(pid)
+        if not usage:
+            continue
+        logger.info(
+            f"📊 Worker {pid} (cores {cores[0]}-{cores[-1]}): "
+            f"shared {usage['shared_kb'] / 1024:.0f} MB, "
+            f"private {usage['private_kb'] / 1024:.0f} MB, "
+            f"PSS {usage['pss_kb'] / 1024:.0f} MB"
+        )
+
+def _run_worker(sock: socket.socket, cores: List[int], log_level: str):
+    """Child process: pin to its cores, give the model private contexts, serve"""
+    os.sched_setaffinity(0, cores)
+    if routes.agent:
+        routes.agent.after_fork(len(cores))
+
+    from .core import app
+    config = uvicorn.Config(app, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+def _spawn(sock: socket.socket, cores: List[int], log_level: str) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(sock, cores, log_level)
+        except BaseException:
+            logger.exception("❌ Worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    logger.info(f"👷 Started worker {pid} on cores {cores}")
+    return pid
+
+def run_prefork(workers: int, host: str = "0.0.0.0", port: int = 8000, log_level: str = "info"):
+    """Preload the model, then fork ``workers`` uvicorn workers sharing it"""
+    logger.info(f"🚀 Pre-fork launcher: loading model once for {workers} workers...")
+    routes.load_agent(warm_up=False)
+    if not routes.agent:
+        logger.warning("⚠️ Agent failed to load - workers will serve in degraded mode")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    slices = core_slices(workers)
+    children = {_spawn(sock, cores, log_level): cores for cores in slices}
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    next_report = time.time() + RSS_REPORT_INTERVAL_S
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+
+        if pid:
+            cores = children.pop(pid)
+            if not stopping:
+                logger.warning(f"⚠️ Worker {pid} exited ({status}) - restarting")
+                children[_spawn(sock, cores, log_level)] = cores
+            continue
+
+        if time.time() >= next_report:
+            log_memory(children)
+            next_report = time.time() + RSS_REPORT_INTERVAL_S
+        time.sleep(0.5)
+
+    sock.close()
+    logger.info("👋 All workers stopped")
@@ -1,10 +1,16 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, Any
 
 class CodeGenerationRequest(BaseModel):
     """Request model for code generation"""
     prompt: str
     language: str
+    model: Optional[str] = None
+    # Seconds from receipt to answer; the best result so far is returned
+    # (marked partial) when sampling cannot finish in time
+    deadline_s: Optional[float] = None
+    # Priority lane ("interactive" or "bulk"); defaults from the API key
+    lane: Optional[str] = None
     
     class Config:
         example = {
@@ -21,6 +27,19 @@ class CodeGenerationResponse(BaseModel):
     bot_name: str
     status: str
     generation_time: float
+    tier: Optional[str] = None
+    model: Optional[str] = None
+    num_samples: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    partial: bool = False
+    # Pass to /api/feedback to rate this answer
+    generation_id: Optional[str] = None
+
+class FeedbackRequest(BaseModel):
+    """User signal on a generated answer, for training the candidate ranker"""
+    generation_id: str
+    # "accept" (the answer was used) or "regenerate" (the user asked again)
+    signal: str
 
 class HealthResponse(BaseModel):
     """Health check response"""
@@ -28,3 +47,30 @@ class HealthResponse(BaseModel):
     service: str
     timestamp: str
     uptime: str
+    model_state: Optional[str] = None
+    loading: Optional[Dict[str, Any]] = None
+    queue: Optional[Dict[str, Any]] = None
+    guardrails: Optional[Dict[str, str]] = None
+
+class ModelSwapRequest(BaseModel):
+    """Admin request to hot-swap a registered model"""
+    model_path: str
+    params: Optional[Dict[str, Any]] = None
+
+class JobSubmitResponse(BaseModel):
+    """Response for a queued generation job"""
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    """Status, progress and result of a generation job"""
+    job_id: str
+    status: str
+    progress: float
+    attempts: int
+    created: float
+    updated: float
+    expires: Optional[float] = None
+    result: Optional[CodeGenerationResponse] = None
+    error: Optional[str] = None
@@ -0,0 +1,166 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Tuple
+
+from .config import RATE_LIMIT_CONFIG
+from .admission import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# PER-CLIENT RATE LIMITING
+# ============================================================================
+#
+# Two token buckets per client (API key, else IP address): one in requests,
+# one in generated tokens. A request needs a whole request token and a
+# non-negative token balance; its generated tokens are charged once it
+# finishes, so the token bucket can go into debt and the client then waits
+# for it to refill. State is kept in process memory, or in a SQLite file when
+# several worker processes on the host must share it.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    client TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (client, kind)
+);
+CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated);
+"""
+
+# Bucket state: (tokens, last refill time)
+Bucket = Tuple[float, float]
+
+class RateLimiter:
+    """Per-client request and generated-token buckets"""
+
+    def __init__(self, config: Dict[str, Any] = RATE_LIMIT_CONFIG):
+        self.config = config
+        self.enabled = config["enabled"]
+        self.limits = {
+            "requests": (config["request_burst"], config["requests_per_min"] / 60),
+            "tokens": (config["token_burst"], config["tokens_per_min"] / 60),
+        }
+        self.path = config["shared_db_path"]
+        self.stats = {"allowed": 0, "rejected_requests": 0, "rejected_tokens": 0}
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[str, str], Bucket] = {}
+        self._next_prune = time.time() + config["idle_ttl_s"]
+
+        if self.path:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with self._connect() as db:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def _refill(self, kind: str, bucket: Optional[Bucket], now: float) -> float:
+        capacity, rate = self.limits[kind]
+        if bucket is None:
+            return capacity
+        tokens, updated = bucket
+        return min(capacity, tokens + (now - updated) * rate)
+
+    @contextmanager
+    def _buckets_of(self, client: str):
+        """
+        Atomically read and write a client's buckets: yields a dict of refilled
+        balances by kind; whatever it holds on exit is stored
+        """
+        now = time.time()
+        if not self.path:
+            with self._lock:
+                balances = {
+                    kind: self._refill(kind, self._buckets.get((client, kind)), now)
+                    for kind in self.limits
+                }
+                yield balances
+                for kind, tokens in balances.items():
+                    self._buckets[(client, kind)] = (tokens, now)
+                self._prune(now)
+            return
+
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = dict(
+                    (kind, (tokens, updated)) for kind, tokens, updated in db.execute(
+                        "SELECT kind, tokens, updated FROM buckets WHERE client = ?", (client,)
+                    )
+                )
+                balances = {kind: self._refill(kind, rows.get(kind), now) for kind in self.limits}
+                yield balances
+                db.executemany(
+                    "INSERT OR REPLACE INTO buckets (client, kind, tokens, updated) VALUES (?, ?, ?, ?)",
+                    [(client, kind, tokens, now) for kind, tokens in balances.items()]
+                )
+                if now >= self._next_prune:
+                    db.execute("DELETE FROM buckets WHERE updated < ?", (now - self.config["idle_ttl_s"],))
+                    self._next_prune = now + self.config["idle_ttl_s"]
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+
+    def _prune(self, now: float):
+        """Forget clients idle long enough that their buckets are full again"""
+        if now < self._next_prune:
+            return
+        cutoff = now - self.config["idle_ttl_s"]
+        for key in [key for key, (_, updated) in self._buckets.items() if updated < cutoff]:
+            del self._buckets[key]
+        self._next_prune = now + self.config["idle_ttl_s"]
+
+    def check(self, client: str):
+        """Take one request token, or raise Overloaded (429) with a Retry-After"""
+        if not self.enabled:
+            return
+        with self._buckets_of(client) as balances:
+            if balances["requests"] < 1:
+                retry_after = (1 - balances["requests"]) / self.limits["requests"][1]
+                rejected = "requests"
+            elif balances["tokens"] < 0:
+                retry_after = -balances["tokens"] / self.limits["tokens"][1]
+                rejected = "tokens"
+            else:
+                balances["requests"] -= 1
+                rejected = None
+
+        with self._lock:
+            self.stats["rejected_" + rejected if rejected else "allowed"] += 1
+        if rejected:
+            logger.warning(f"🚦 Rate limit ({rejected}) for {client}")
+            raise Overloaded(f"Rate limit exceeded ({rejected})", retry_after, status_code=429)
+
+    def charge(self, client: str, tokens: int):
+        """Deduct generated tokens once a request has finished"""
+        if not self.enabled or not tokens:
+            return
+        with self._buckets_of(client) as balances:
+            balances["tokens"] -= tokens
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        return {
+            "enabled": self.enabled,
+            "backend": "sqlite" if self.path else "memory",
+            "requests_per_min": self.config["requests_per_min"],
+            "tokens_per_min": self.config["tokens_per_min"],
+            "stats": stats
+        }
+
+rate_limiter = RateLimiter()
@@ -1,14 +1,36 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import FileResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
 from pathlib import Path
+from typing import Optional, Dict, Any
+import re
+import time
+import asyncio
+import hashlib
+import threading
 import logging
 
 from agent_v2 import CodeGeneratorAgent
+from agent_v2.config import DEFAULT_MODEL, MODEL_REGISTRY
+from agent_v2.loading import load_status
+from agent_v2.guardrails import output_guardrails
+from agent_v2.sandbox import verification_pool
+from agent_v2.validators import syntax_validator
+from agent_v2.scoring import candidate_scorer, candidate_log, FEEDBACK_SIGNALS
 
-from .config import BOT_NAMES, SUPPORTED_LANGUAGES, startup_time
-from .models import CodeGenerationRequest, CodeGenerationResponse, HealthResponse
-from .utils import validate_prompt, validate_language, SECURITY_PATTERNS
+from .config import (
+    BOT_NAMES, SUPPORTED_LANGUAGES, ADMIN_TOKEN, MAX_PROMPT_CHARS, DISCONNECT_POLL_S,
+    ADMISSION_LANES, DEFAULT_LANE, JOBS_LANE, API_KEY_LANES, startup_time
+)
+from .models import (
+    CodeGenerationRequest, CodeGenerationResponse, HealthResponse, ModelSwapRequest,
+    JobSubmitResponse, JobStatusResponse, FeedbackRequest
+)
+from .utils import validate_prompt, validate_language, prompt_guardrails
+from .admission import admission, sample_policy, Overloaded
+from .jobs import JobStore, JobWorker
+from .ratelimit import rate_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -18,13 +40,204 @@ router = APIRouter()
 # AGENT INITIALIZATION
 # ============================================================================
 
-try:
-    logger.info("🔄 Initializing Code Generator Agent...")
-    agent = CodeGeneratorAgent()
-    logger.info("✅ Agent initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize agent: {e}", exc_info=True)
-    agent = None
+# The agent is built by load_agent() in a background task started from the
+# app lifespan, so HTTP is served while the model loads.
+agent = None
+agent_status = "pending"
+
+def load_agent(warm_up: bool = True):
+    """Build the agent (loads the model), then warm it up; runs off the event loop"""
+    global agent, agent_status
+    
+    if agent is None:
+        agent_status = "loading"
+        try:
+            logger.info("🔄 Initializing Code Generator Agent...")
+            agent = CodeGeneratorAgent()
+            logger.info("✅ Agent initialized successfully")
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize agent: {e}", exc_info=True)
+            agent_status = "failed"
+            return
+    
+    agent_status = "ready"
+    # /health/ready reports 503 until warm-up is done
+    if warm_up:
+        agent.warm_up()
+
+def overloaded_error(e: Overloaded) -> HTTPException:
+    """Shed load with a Retry-After hint"""
+    logger.warning(f"🚦 Load shed: {e.detail} (retry after {e.retry_after}s)")
+    return HTTPException(
+        status_code=e.status_code,
+        detail=e.detail,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def validate_generation_request(request: CodeGenerationRequest, require_agent: bool = True):
+    """Reject invalid generation requests with 400 (503 if the agent is required but not loaded)"""
+    
+    # Validate language
+    if not validate_language(request.language):
+        logger.error(f"❌ Invalid language: {request.language}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported language. Supported: {', '.join(SUPPORTED_LANGUAGES)}"
+        )
+    
+    # Validate prompt
+    validation = validate_prompt(request.prompt)
+    if not validation['valid']:
+        logger.warning(f"⚠️ Validation failed: {validation['message']}")
+        raise HTTPException(
+            status_code=400,
+            detail=validation['message']
+        )
+    
+    # Validate deadline
+    if request.deadline_s is not None and request.deadline_s <= 0:
+        raise HTTPException(
+            status_code=400,
+            detail="deadline_s must be a positive number of seconds"
+        )
+    
+    # Check if agent is initialized
+    if require_agent and not agent:
+        logger.error(f"❌ Agent not available ({agent_status}) - service unavailable")
+        raise unavailable_error()
+    
+    # Validate requested model
+    models = agent.registry.models if agent else MODEL_REGISTRY
+    if request.model and request.model not in models:
+        logger.error(f"❌ Unknown model: {request.model}")
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown model. Available: {', '.join(sorted(models))}"
+        )
+
+def resolve_lane(request: CodeGenerationRequest, api_key: Optional[str],
+                 default: str = DEFAULT_LANE) -> str:
+    """Priority lane: the request's choice, else the API key's lane, else ``default``"""
+    lane = request.lane or API_KEY_LANES.get(api_key or "", default)
+    if lane not in ADMISSION_LANES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown lane. Available: {', '.join(ADMISSION_LANES)}"
+        )
+    return lane
+
+def client_id(http_request: Request, api_key: Optional[str]) -> str:
+    """Identity used for rate limits and fair queuing: API key (hashed), else IP"""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return "ip:" + (http_request.client.host if http_request.client else "unknown")
+
+def build_response(request: CodeGenerationRequest, result: Dict[str, Any],
+                   generation_time: float) -> Dict[str, Any]:
+    """CodeGenerationResponse body for a generation result"""
+    return {
+        "code": result['code'],
+        "language": request.language,
+        "prompt": request.prompt,
+        "timestamp": datetime.now().isoformat(),
+        "bot_name": BOT_NAMES.get(request.language, "CodeWizard"),
+        "status": "success",
+        "generation_time": generation_time,
+        "tier": result.get('tier'),
+        "model": result.get('model'),
+        "num_samples": result.get('num_samples'),
+        "completion_tokens": result.get('completion_tokens'),
+        "partial": result.get('partial', False),
+        "generation_id": result.get('generation_id')
+    }
+
+async def watch_disconnect(http_request: Request, cancel: threading.Event, ticket):
+    """Cancel the generation (queued or running) as soon as the client goes away"""
+    while not cancel.is_set():
+        if await http_request.is_disconnected():
+            logger.warning("🔌 Client disconnected - cancelling generation")
+            cancel.set()
+            ticket.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_S)
+
+def unavailable_error() -> HTTPException:
+    """503 for requests arriving before the agent is loaded"""
+    if agent_status in ("pending", "loading"):
+        return HTTPException(
+            status_code=503,
+            detail="Model is still loading, please retry shortly",
+            headers={"Retry-After": "10"}
+        )
+    return HTTPException(
+        status_code=503,
+        detail="Code generation service is currently unavailable"
+    )
+
+# ============================================================================
+# JOBS
+# ============================================================================
+
+# Created by start_jobs() from the app lifespan; every worker process leases
+# jobs from the same SQLite file
+job_store = None
+job_worker = None
+
+def run_job(payload: Dict[str, Any], on_progress, cancel: threading.Event) -> Dict[str, Any]:
+    """JobWorker runner: generate through the same admission queue as /api/generate"""
+    client = payload.pop("client", "anonymous")
+    request = CodeGenerationRequest(**payload)
+    start_time = datetime.now()
+    
+    while not cancel.is_set():
+        # Jobs wait out overload instead of being rejected
+        try:
+            ticket = admission.admit(request.lane or JOBS_LANE, client)
+            with ticket:
+                num_samples = sample_policy.sample_count()
+                deadline = time.time() + request.deadline_s if request.deadline_s else None
+                result = agent.generate_code(
+                    prompt=request.prompt,
+                    language=request.language,
+                    model=request.model,
+                    num_samples=num_samples,
+                    deadline=deadline,
+                    cancel=cancel,
+                    on_sample=lambda done, total: on_progress(done / total)
+                )
+            rate_limiter.charge(client, result["completion_tokens"])
+            break
+        except Overloaded as e:
+            cancel.wait(e.retry_after)
+    else:
+        return {}
+    
+    generation_time = (datetime.now() - start_time).total_seconds()
+    return build_response(request, result, generation_time)
+
+def start_jobs():
+    """Open the job store and start this process's job workers"""
+    global job_store, job_worker
+    job_store = JobStore()
+    job_worker = JobWorker(job_store, run_job, ready=lambda: agent is not None)
+    job_worker.start()
+
+def stop_jobs():
+    """Stop job workers; running jobs go back to the queue"""
+    if job_worker:
+        job_worker.stop()
+
+# ============================================================================
+# DEPENDENCIES
+# ============================================================================
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Guard admin endpoints with the ADMIN_TOKEN shared secret"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API is disabled")
+    if x_admin_token != ADMIN_TOKEN:
+        logger.warning("🔒 Rejected admin request with invalid token")
+        raise HTTPException(status_code=401, detail="Invalid admin token")
 
 # ============================================================================
 # ROUTES
@@ -44,20 +257,56 @@ async def health_check():
     uptime_str = f"{uptime.seconds // 3600}h {(uptime.seconds % 3600) // 60}m"
     
     logger.info("💚 Health check requested")
+    if agent:
+        status = "healthy" if agent.is_warm else "warming"
+    else:
+        status = "loading" if agent_status in ("pending", "loading") else "degraded"
     return {
-        "status": "healthy" if agent else "degraded",
+        "status": status,
         "service": "Code Wizard API",
         "timestamp": datetime.now().isoformat(),
-        "uptime": uptime_str
+        "uptime": uptime_str,
+        "model_state": agent.registry.model_state(DEFAULT_MODEL) if agent else None,
+        "loading": load_status(),
+        "queue": {**admission.status(), "samples": sample_policy.status()},
+        "guardrails": {
+            "prompt": prompt_guardrails.status()["backend"],
+            "output": output_guardrails.status()["backend"]
+        }
     }
 
+@router.get("/health/live", tags=["Health"])
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@router.get("/health/ready", tags=["Health"])
+async def readiness():
+    """Readiness probe: 503 until the model is loaded and warmed up"""
+    if not agent or not agent.is_warm:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "not_ready",
+                "agent": agent_status,
+                "warmup": agent.warmup["state"] if agent else None,
+                "loading": load_status()
+            }
+        )
+    if agent.warmup["state"] == "failed":
+        # Ready but cold: first requests pay the warm-up cost
+        return {"status": "ready", "warmup": "failed", "warning": agent.warmup.get("error")}
+    return {"status": "ready", "warmup": agent.warmup["state"]}
+
 @router.post("/api/generate", response_model=CodeGenerationResponse, tags=["Generation"])
-async def generate_code(request: CodeGenerationRequest):
+async def generate_code(request: CodeGenerationRequest, http_request: Request,
+                        x_api_key: Optional[str] = Header(None)):
     """
     Generate code based on prompt and language
     """
     
     start_time = datetime.now()
+    deadline = time.time() + request.deadline_s if request.deadline_s else None
     logger.info("=" * 80)
     logger.info("📥 NEW CODE GENERATION REQUEST")
     logger.info("=" * 80)
@@ -67,38 +316,54 @@ async def generate_code(request: CodeGenerationRequest):
         logger.info(f"🔤 Language: {request.language}")
         logger.info(f"📝 Prompt: {request.prompt[:100]}...")
         
-        # Validate language
-        if not validate_language(request.language):
-            logger.error(f"❌ Invalid language: {request.language}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported language. Supported: {', '.join(SUPPORTED_LANGUAGES)}"
-            )
+        validate_generation_request(request)
+        lane = resolve_lane(request, x_api_key)
+        client = client_id(http_request, x_api_key)
         
-        # Validate prompt
-        validation = validate_prompt(request.prompt)
-        if not validation['valid']:
-            logger.warning(f"⚠️ Validation failed: {validation['message']}")
-            raise HTTPException(
-                status_code=400,
-                detail=validation['message']
-            )
+        # Per-client rate limits, then admission control: fail fast instead
+        # of queueing without bound
+        try:
+            await run_in_threadpool(rate_limiter.check, client)
+            ticket = admission.admit(lane, client)
+        except Overloaded as e:
+            raise overloaded_error(e)
         
-        # Check if agent is initialized
-        if not agent:
-            logger.error("❌ Agent not initialized - service unavailable")
-            raise HTTPException(
-                status_code=503,
-                detail="Code generation service is currently unavailable"
+        def run_generation():
+            # Decided once the request runs, from the load at that moment
+            num_samples = sample_policy.sample_count()
+            logger.info(
+                f"🚀 Starting code generation for {request.language} "
+                f"({num_samples} samples, {lane} lane)..."
+            )
+            result = agent.generate_code(
+                prompt=request.prompt,
+                language=request.language,
+                model=request.model,
+                num_samples=num_samples,
+                deadline=deadline,
+                cancel=cancel
             )
+            rate_limiter.charge(client, result["completion_tokens"])
+            return result
         
-        logger.info(f"🚀 Starting code generation for {request.language}...")
+        # Wait for a slot on the event loop, then generate off it while
+        # watching for the client to disconnect. A threadpool thread is taken
+        # only once admitted, so queued requests cannot exhaust the pool.
+        cancel = threading.Event()
+        watcher = asyncio.create_task(watch_disconnect(http_request, cancel, ticket))
+        try:
+            async with ticket:
+                result = await run_in_threadpool(run_generation)
+        except Overloaded as e:
+            if cancel.is_set():
+                raise HTTPException(status_code=499, detail="Client closed request")
+            raise overloaded_error(e)
+        finally:
+            watcher.cancel()
         
-        # Generate code using agent
-        result = agent.generate_code(
-            prompt=request.prompt,
-            language=request.language
-        )
+        if result.get('cancelled'):
+            logger.info("🔌 Generation cancelled - no response sent")
+            raise HTTPException(status_code=499, detail="Client closed request")
         
         generation_time = (datetime.now() - start_time).total_seconds()
         
@@ -106,15 +371,7 @@ async def generate_code(request: CodeGenerationRequest):
         logger.info(f"📊 Generated code length: {len(result['code'])} characters")
         logger.info("=" * 80)
         
-        return {
-            "code": result['code'],
-            "language": request.language,
-            "prompt": request.prompt,
-            "timestamp": datetime.now().isoformat(),
-            "bot_name": BOT_NAMES.get(request.language, "CodeWizard"),
-            "status": "success",
-            "generation_time": generation_time
-        }
+        return build_response(request, result, generation_time)
     
     except HTTPException:
         raise
@@ -126,6 +383,56 @@ async def generate_code(request: CodeGenerationRequest):
             detail="An error occurred during code generation. Please try again."
         )
 
+@router.post("/api/jobs", response_model=JobSubmitResponse, status_code=202, tags=["Generation"])
+async def submit_job(request: CodeGenerationRequest, http_request: Request,
+                     x_api_key: Optional[str] = Header(None)):
+    """
+    Queue a generation job and return its id immediately; poll GET /api/jobs/{job_id}
+    """
+    validate_generation_request(request, require_agent=False)
+    request.lane = resolve_lane(request, x_api_key, default=JOBS_LANE)
+    if not job_store:
+        raise HTTPException(status_code=503, detail="Job queue not available")
+    
+    client = client_id(http_request, x_api_key)
+    try:
+        await run_in_threadpool(rate_limiter.check, client)
+    except Overloaded as e:
+        raise overloaded_error(e)
+    
+    job_id = await run_in_threadpool(job_store.submit, {**request.dict(), "client": client})
+    logger.info(f"🗂️ Queued job {job_id} ({request.language})")
+    return {"job_id": job_id, "status": "queued", "status_url": f"/api/jobs/{job_id}"}
+
+@router.get("/api/jobs/{job_id}", response_model=JobStatusResponse, tags=["Generation"])
+async def get_job(job_id: str):
+    """
+    Get a job's status, progress (0-1) and, once done, its result
+    """
+    if not job_store:
+        raise HTTPException(status_code=503, detail="Job queue not available")
+    job = await run_in_threadpool(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@router.post("/api/feedback", status_code=202, tags=["Generation"])
+async def submit_feedback(feedback: FeedbackRequest):
+    """
+    Record whether the user kept an answer ("accept") or asked again
+    ("regenerate"); train_ranker learns candidate weights from these
+    """
+    if feedback.signal not in FEEDBACK_SIGNALS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"signal must be one of: {', '.join(FEEDBACK_SIGNALS)}"
+        )
+    if not re.fullmatch(r"[0-9a-f]{32}", feedback.generation_id):
+        raise HTTPException(status_code=400, detail="Unknown generation_id")
+    recorded = await run_in_threadpool(candidate_log.feedback, feedback.generation_id, feedback.signal)
+    logger.info(f"👍 Feedback {feedback.signal} for {feedback.generation_id} ({'recorded' if recorded else 'not logged'})")
+    return {"status": "recorded" if recorded else "ignored"}
+
 @router.get("/api/languages", tags=["Info"])
 async def get_languages():
     """Get list of supported languages and their bot names"""
@@ -136,6 +443,33 @@ async def get_languages():
         "count": len(SUPPORTED_LANGUAGES)
     }
 
+@router.get("/api/stats", tags=["Info"])
+async def get_stats():
+    """Get generation statistics (cascade tier hit rates, cancelled and blocked work, lane metrics)"""
+    logger.info("📈 Stats endpoint accessed")
+    if not agent:
+        raise unavailable_error()
+    return {
+        "cascade": agent.cascade_stats(),
+        "cancellation": agent.cancellation_stats(),
+        "output_guardrails": agent.output_guardrail_stats(),
+        "verification": verification_pool.status(),
+        "syntax_validation": syntax_validator.status(),
+        "scoring": candidate_scorer.status(),
+        "candidate_log": candidate_log.status(),
+        "lanes": admission.status()["lanes"],
+        "rate_limits": rate_limiter.status(),
+        "jobs": await run_in_threadpool(job_store.stats) if job_store else None
+    }
+
+@router.get("/api/models", tags=["Info"])
+async def get_models():
+    """Get registered and resident models with memory usage"""
+    logger.info("🧠 Models endpoint accessed")
+    if not agent:
+        raise unavailable_error()
+    return agent.registry.status()
+
 @router.get("/api/guardrails", tags=["Info"])
 async def get_guardrails():
     """Get list of applied security guardrails"""
@@ -150,8 +484,10 @@ async def get_guardrails():
             "No privilege escalation",
             "No command chaining"
         ],
-        "max_prompt_length": 1000,
-        "security_patterns_count": len(SECURITY_PATTERNS)
+        "max_prompt_length": MAX_PROMPT_CHARS,
+        "security_patterns_count": len(prompt_guardrails.rules),
+        "rules": sorted(prompt_guardrails.rules),
+        "output_rules": sorted(output_guardrails.rules)
     }
 
 @router.get("/api/logs", tags=["Info"])
@@ -168,3 +504,50 @@ async def get_recent_logs():
         "logs": [f.name for f in log_files],
         "total": len(list(log_dir.glob("*.log")))
     }
+
+# ============================================================================
+# ADMIN
+# ============================================================================
+
+@router.post("/api/admin/models/{name}/swap", status_code=202, tags=["Admin"],
+             dependencies=[Depends(require_admin)])
+async def swap_model(name: str, request: ModelSwapRequest):
+    """
+    Hot-swap a model: load and warm up the new weights in the background,
+    switch new requests over, then free the old model once drained
+    """
+    if not agent:
+        raise unavailable_error()
+    if name not in agent.registry.models:
+        raise HTTPException(status_code=404, detail=f"Unknown model: {name}")
+    
+    try:
+        state = agent.registry.begin_swap(name, request.model_path)
+    except RuntimeError:
+        raise HTTPException(status_code=409, detail="A swap for this model is already in progress")
+    
+    def run_swap():
+        try:
+            agent.registry.swap(name, request.model_path, request.params, state=state)
+        except Exception as e:
+            logger.error(f"❌ Model swap failed: {e}")
+    
+    logger.info(f"🔁 Hot swap requested: {name} -> {request.model_path}")
+    threading.Thread(target=run_swap, name=f"swap-{name}", daemon=True).start()
+    
+    return {
+        "status": "accepted",
+        "model": name,
+        "model_path": request.model_path
+    }
+
+@router.get("/api/admin/models/{name}/swap", tags=["Admin"],
+            dependencies=[Depends(require_admin)])
+async def get_swap_status(name: str):
+    """Get the progress of the latest hot swap for a model"""
+    if not agent:
+        raise unavailable_error()
+    state = agent.registry.swaps.get(name)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"No swap recorded for model: {name}")
+    return {"model": name, **state}
@@ -1,6 +1,8 @@
-import re
 import logging
-from .config import SUPPORTED_LANGUAGES
+
+from agent_v2.guardrails import GuardrailMatcher
+
+from .config import SUPPORTED_LANGUAGES, MAX_PROMPT_CHARS
 
 logger = logging.getLogger(__name__)
 
@@ -8,26 +10,9 @@ logger = logging.getLogger(__name__)
 # GUARDRAILS & VALIDATION
 # ============================================================================
 
-SECURITY_PATTERNS = [
-    r'drop\s+table',
-    r'delete\s+from',
-    r'truncate\s+table',
-    r'exec\s*\(',
-    r'eval\s*\(',
-    r'system\s*\(',
-    r'os\.system',
-    r'subprocess',
-    r'__import__',
-    r'base64\s*decode',
-    r'password\s*=',
-    r'api[_-]?key',
-    r'secret\s*=',
-    r'rm\s+-rf',
-    r'chmod\s+777',
-    r'sudo',
-    r'curl.*exec',
-    r'wget.*exec',
-]
+# Built-in rules plus the hot-reloaded pattern file: one hyperscan database
+# scan when hyperscan is installed, otherwise one precompiled regex per rule
+prompt_guardrails = GuardrailMatcher()
 
 def validate_prompt(prompt: str) -> dict:
     """
@@ -42,22 +27,22 @@ def validate_prompt(prompt: str) -> dict:
             'message': 'Prompt cannot be empty'
         }
     
-    if len(prompt) > 1000:
+    if len(prompt) > MAX_PROMPT_CHARS:
         logger.warning(f"⚠️ Prompt exceeds max length: {len(prompt)} chars")
         return {
             'valid': False,
-            'message': 'Prompt exceeds maximum length of 1000 characters'
+            'message': f'Prompt exceeds maximum length of {MAX_PROMPT_CHARS} characters'
         }
     
-    prompt_lower = prompt.lower()
-    
-    for pattern in SECURITY_PATTERNS:
-        if re.search(pattern, prompt_lower):
-            logger.warning(f"🛡️ SECURITY: Restricted pattern detected: {pattern}")
-            return {
-                'valid': False,
-                'message': '⚠️ Request contains restricted patterns. Please modify your request.'
-            }
+    matches = prompt_guardrails.matches(prompt)
+    if matches:
+        rules = sorted({rule for rule, _ in matches})
+        logger.warning(f"🛡️ SECURITY: Restricted patterns detected: {', '.join(rules)}")
+        return {
+            'valid': False,
+            'message': '⚠️ Request contains restricted patterns. Please modify your request.',
+            'rules': rules
+        }
     
     logger.info("✅ Prompt validation passed")
     return {'valid': True, 'message': 'Validation passed'}
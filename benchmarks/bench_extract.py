@@ -0,0 +1,149 @@
+"""
+Regression check and micro-benchmark for code extraction
+
+Runs every response in benchmarks/extract_corpus.py through the single-pass
+extractor, both whole and streamed a few characters (about one token) at a
+time, and exits non-zero if any result differs from the expected code. Cases
+where the previous fence-by-fence extractor disagrees are listed.
+
+It then times both extractors on the corpus cases that have code, with the
+code grown to several lengths, and reports the per-token cost of feeding a
+streamed sample to the extractor against re-extracting the whole sample at
+every token.
+
+Usage:
+    python -m benchmarks.bench_extract [--sizes 500 5000 50000] [--tokens 1500]
+"""
+
+import sys
+import time
+import argparse
+from typing import Dict, List
+
+from agent_v2.extract import CodeExtractor, extract_code
+from benchmarks.extract_corpus import CASES
+
+CHARS_PER_TOKEN = 4
+
+def legacy_extract(response: str, language: str) -> str:
+    """The previous LocalLLM._extract_code, without its syntax check"""
+    response = response.strip()
+    if not response:
+        return ""
+
+    for marker in ["```python", "```javascript", "```java", "```cpp", "```c", "```sql", "```"]:
+        if marker in response:
+            start = response.find(marker) + len(marker)
+            end = response.find("```", start)
+            if end != -1:
+                response = response[start:end].strip()
+
+    lines = response.split('\n')
+    code_lines = []
+    found_code = False
+
+    for line in lines:
+        if not found_code:
+            if any(line.strip().startswith(kw) for kw in ['def ', 'class ', 'function', 'import ', 'from ', 'public ', '#include', 'SELECT', 'CREATE']):
+                found_code = True
+            else:
+                continue
+        code_lines.append(line)
+
+    code = '\n'.join(code_lines).strip()
+
+    if not code or len(code) < 15:
+        return ""
+
+    bad_patterns = ['TODO', 'FIXME', 'placeholder', 'implement', 'pass  #']
+    if any(p.lower() in code.lower() for p in bad_patterns):
+        return ""
+
+    return code
+
+def streamed(response: str, language: str) -> str:
+    extractor = CodeExtractor(language)
+    for i in range(0, len(response), CHARS_PER_TOKEN):
+        extractor.feed(response[i:i + CHARS_PER_TOKEN])
+    return extractor.finish()
+
+def check() -> int:
+    """Number of corpus cases the extractor gets wrong"""
+    failures = 0
+    for case in CASES:
+        whole = extract_code(case["response"], case["language"])
+        chunked = streamed(case["response"], case["language"])
+        if whole != case["expected"] or chunked != case["expected"]:
+            failures += 1
+            print(f"FAIL {case['name']}: got {whole!r} (streamed {chunked!r}), expected {case['expected']!r}")
+        if legacy_extract(case["response"], case["language"]) != case["expected"]:
+            print(f"  previous extractor differs on {case['name']}")
+    print(f"{len(CASES) - failures}/{len(CASES)} corpus cases extracted as expected")
+    return failures
+
+def grown(case: Dict[str, str], size: int) -> str:
+    """The case's response with its code repeated until it is about ``size`` characters"""
+    code = case["expected"]
+    body = "\n".join(code.split("\n")[1:]) or code
+    padding = "\n" + body
+    copies = max(0, (size - len(case["response"])) // len(padding))
+    return case["response"].replace(code, code + padding * copies, 1)
+
+def timed(fn, *args) -> (float, object):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def bench_stream(tokens: int, samples: int):
+    """Per-token cost of extracting from a sample as it streams"""
+    case = CASES[0]
+    text = grown(case, tokens * CHARS_PER_TOKEN)[:tokens * CHARS_PER_TOKEN]
+    chunks = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def incremental():
+        for _ in range(samples):
+            extractor = CodeExtractor(case["language"])
+            for chunk in chunks:
+                extractor.feed(chunk)
+            extractor.finish()
+
+    def rescan():
+        for _ in range(samples):
+            seen = ""
+            for chunk in chunks:
+                seen += chunk
+                extract_code(seen, case["language"])
+
+    per = lambda seconds: seconds / (samples * len(chunks)) * 1e6
+    incremental_s, _ = timed(incremental)
+    rescan_s, _ = timed(rescan)
+    print(f"\nStreaming {len(chunks)}-token samples")
+    print(f"{'incremental us/token':>22} {'rescan us/token':>16}")
+    print(f"{per(incremental_s):>22.2f} {per(rescan_s):>16.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark code extraction")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[500, 5000, 50000])
+    parser.add_argument("--repeat", type=int, default=20, help="Passes over the corpus per size")
+    parser.add_argument("--tokens", type=int, default=1500, help="Streamed sample length")
+    args = parser.parse_args()
+
+    if check():
+        sys.exit(1)
+
+    print(f"\n{'chars':>8} {'previous us':>12} {'single-pass us':>15} {'speedup':>8}")
+    for size in args.sizes:
+        corpus: List[Dict[str, str]] = [
+            {"response": grown(case, size), "language": case["language"]}
+            for case in CASES if case["expected"]
+        ]
+        run = lambda fn: [fn(c["response"], c["language"]) for c in corpus for _ in range(args.repeat)]
+        legacy_s, _ = timed(run, legacy_extract)
+        single_s, _ = timed(run, extract_code)
+        per = lambda seconds: seconds / (len(corpus) * args.repeat) * 1e6
+        print(f"{size:>8} {per(legacy_s):>12.1f} {per(single_s):>15.1f} {legacy_s / single_s:>7.1f}x")
+
+    bench_stream(args.tokens, samples=max(1, 5000 // args.tokens))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Micro-benchmark: per-rule re.search loop versus the combined GuardrailMatcher
+
+Builds a synthetic prompt corpus at several prompt lengths (a fraction of the
+prompts carry a restricted pattern), optionally grows the rule set with
+synthetic rules, checks that both approaches flag the same prompts, and
+reports the time per prompt. The matcher uses hyperscan when it is installed
+(pip install hyperscan) and per-rule regexes otherwise.
+
+It then streams generated-code-like samples through the output rules a few
+characters (about one token) at a time, and reports the cost per token of the
+incremental scanner against re-checking the whole sample at every token.
+
+Before timing anything, it checks that streamed scanning agrees with a
+whole-text check on samples cut into random chunks, including matches and
+near-misses (model.eval()) that straddle the start of the scanner's
+look-back, and exits non-zero if they disagree.
+
+Usage:
+    python -m benchmarks.bench_guardrails [--sizes 1000 10000 100000]
+                                          [--prompts 200] [--scale 1 10]
+                                          [--tokens 1500]
+"""
+
+import re
+import sys
+import time
+import random
+import argparse
+from typing import Dict, List
+
+from agent_v2.guardrails import GuardrailMatcher, StreamScanner, DEFAULT_RULES, OUTPUT_RULES
+
+WORDS = (
+    "write a function that parses the input file and returns a sorted list of "
+    "records grouped by category with totals per group using a dictionary and "
+    "handle errors for missing fields then print the summary table class method "
+    "loop index value string number array map filter reduce query select join"
+).split()
+
+INJECTIONS = ["os.system('ls')", "DROP TABLE users", "rm -rf /", "eval (code)", "sudo reboot"]
+
+def make_corpus(size: int, count: int, hit_rate: float, rng: random.Random) -> List[str]:
+    """``count`` prompts of about ``size`` characters; ``hit_rate`` of them contain an injection"""
+    corpus = []
+    for _ in range(count):
+        words, length = [], 0
+        while length < size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        if rng.random() < hit_rate:
+            words.insert(rng.randrange(len(words)), rng.choice(INJECTIONS))
+        corpus.append(" ".join(words)[:size + 40])
+    return corpus
+
+def scaled_rules(scale: int, rng: random.Random) -> Dict[str, str]:
+    """Built-in rules plus synthetic ones, ``scale`` times as many in total"""
+    rules = dict(DEFAULT_RULES)
+    for i in range(len(DEFAULT_RULES) * (scale - 1)):
+        a, b = rng.sample(WORDS, 2)
+        rules[f"synthetic_{i}"] = rf"{a}zz\s*{b}\d+"
+    return rules
+
+def legacy_flags(corpus: List[str], patterns: List[str]) -> List[bool]:
+    """The original validate_prompt loop"""
+    flags = []
+    for prompt in corpus:
+        prompt_lower = prompt.lower()
+        flags.append(any(re.search(pattern, prompt_lower) for pattern in patterns))
+    return flags
+
+CODE_LINE = "    total = compute(values[index], weight) + offset\n"
+CHARS_PER_TOKEN = 4
+
+# Output samples for the streaming check: (text, whether a rule must fire)
+STREAM_CASES = [
+    ("model.eval()\nwith torch.no_grad():\n    out = model(x)\n", False),
+    ("net.train()\nnet.eval()\nscore = evaluate(net)\n", False),
+    ("self.exec_plan(query)\nprint(plan.exec_time)\n", False),
+    ("result = eval(expression)\n", True),
+    ("eval(user_input)\n", True),
+    ("value = (eval (text))\n", True),
+    ("import os\nos.system('ls')\n", True),
+    ("def run(code):\n    exec(code)\n", True),
+]
+
+def stream(matcher: GuardrailMatcher, text: str, cuts: List[int], overlap_chars: int):
+    scanner = StreamScanner(matcher._compiled, overlap_chars=overlap_chars)
+    fired = None
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        fired = scanner.feed(text[start:end]) or fired
+    return scanner.finish() or fired
+
+def check_stream(rng: random.Random, rounds: int = 300) -> int:
+    """Number of streamed scans that disagree with checking the whole text"""
+    matcher = GuardrailMatcher(rules=OUTPUT_RULES, path=None, scope="output")
+    failures = 0
+    for text, expected in STREAM_CASES:
+        padded = CODE_LINE * 3 + text
+        if (matcher.first_match(padded) is not None) != expected:
+            failures += 1
+            print(f"FAIL whole-text check of {text!r}: expected {'a match' if expected else 'none'}")
+            continue
+        # Small look-backs put the look-back's start at every offset of the text,
+        # including right after the '.' of model.eval(
+        for overlap_chars in (1, 2, 4, 8):
+            splits = [split for split in range(1, len(padded))
+                      if (stream(matcher, padded, [split], overlap_chars) is not None) != expected]
+            if splits:
+                failures += 1
+                print(f"FAIL {text!r} split at {splits[:5]}..., look-back {overlap_chars}")
+                break
+        else:
+            for _ in range(rounds):
+                cuts = sorted(rng.sample(range(1, len(padded)), rng.randint(1, len(padded) // 3)))
+                overlap_chars = rng.choice((4, 16, 256))
+                if (stream(matcher, padded, cuts, overlap_chars) is not None) != expected:
+                    failures += 1
+                    print(f"FAIL {text!r} cut at {cuts}, look-back {overlap_chars}")
+                    break
+    print(f"{len(STREAM_CASES) - failures}/{len(STREAM_CASES)} streaming cases agree with whole-text checks")
+    return failures
+
+def bench_stream(tokens: int, samples: int):
+    """Per-token cost of scanning a streamed sample with the output rules"""
+    matcher = GuardrailMatcher(rules=OUTPUT_RULES, path=None, scope="output")
+    text = (CODE_LINE * (tokens * CHARS_PER_TOKEN // len(CODE_LINE) + 1))[:tokens * CHARS_PER_TOKEN]
+    chunks = [text[i:i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)]
+
+    def incremental():
+        for _ in range(samples):
+            scanner = matcher.scanner()
+            for chunk in chunks:
+                scanner.feed(chunk)
+            scanner.finish()
+
+    def rescan():
+        for _ in range(samples):
+            seen = ""
+            for chunk in chunks:
+                seen += chunk
+                matcher.first_match(seen)
+
+    per = lambda seconds: seconds / (samples * len(chunks)) * 1e6
+    incremental_s, _ = timed(incremental)
+    rescan_s, _ = timed(rescan)
+    print(f"\nStreaming {len(chunks)}-token samples through {len(matcher.rules)} output rules")
+    print(f"{'incremental us/token':>22} {'rescan us/token':>16}")
+    print(f"{per(incremental_s):>22.2f} {per(rescan_s):>16.2f}")
+
+def timed(fn, *args) -> (float, object):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark guardrail matching")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000])
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--scale", type=int, nargs="*", default=[1, 10], help="Rule set multipliers")
+    parser.add_argument("--hit-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tokens", type=int, default=1500, help="Streamed sample length")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"Matcher backend: {GuardrailMatcher(path=None).status()['backend']}")
+    if check_stream(rng):
+        sys.exit(1)
+    print(f"{'rules':>6} {'chars':>8} {'legacy us':>11} {'matches us':>11} {'first us':>9} {'speedup':>8}")
+
+    for scale in args.scale:
+        rules = scaled_rules(scale, rng)
+        matcher = GuardrailMatcher(rules=rules, path=None)
+        for size in args.sizes:
+            count = max(10, args.prompts * 1000 // size)
+            corpus = make_corpus(size, count, args.hit_rate, rng)
+
+            legacy_s, expected = timed(legacy_flags, corpus, list(rules.values()))
+            matches_s, found = timed(lambda c: [bool(matcher.matches(p)) for p in c], corpus)
+            first_s, first = timed(lambda c: [matcher.first_match(p) is not None for p in c], corpus)
+
+            if found != expected or first != expected:
+                raise SystemExit(f"Mismatch against the legacy loop at {len(rules)} rules, {size} chars")
+
+            per = lambda seconds: seconds / count * 1e6
+            print(
+                f"{len(rules):>6} {size:>8} {per(legacy_s):>11.1f} {per(matches_s):>11.1f} "
+                f"{per(first_s):>9.1f} {legacy_s / first_s:>7.1f}x"
+            )
+
+    bench_stream(args.tokens, samples=max(1, 20000 // args.tokens))
+
+if __name__ == "__main__":
+    main()
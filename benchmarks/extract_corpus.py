@@ -0,0 +1,326 @@
+"""
+Model responses and the code that should be extracted from each
+
+Shapes seen in Qwen2.5-Coder samples: fenced answers with prose around them,
+install or usage blocks next to the solution, unfenced answers, samples cut
+off mid-block at the deadline, and placeholders. ``expected`` is "" when the
+sample must be rejected.
+"""
+
+CASES = [
+    {
+        "name": "fenced_with_prose",
+        "language": "python",
+        "response": (
+            "Here is a function that checks whether a number is prime:\n\n"
+            "```python\n"
+            "def is_prime(n: int) -> bool:\n"
+            "    if n < 2:\n"
+            "        return False\n"
+            "    for i in range(2, int(n ** 0.5) + 1):\n"
+            "        if n % i == 0:\n"
+            "            return False\n"
+            "    return True\n"
+            "```\n\n"
+            "It runs in O(sqrt(n)) time."
+        ),
+        "expected": (
+            "def is_prime(n: int) -> bool:\n"
+            "    if n < 2:\n"
+            "        return False\n"
+            "    for i in range(2, int(n ** 0.5) + 1):\n"
+            "        if n % i == 0:\n"
+            "            return False\n"
+            "    return True"
+        ),
+    },
+    {
+        "name": "solution_then_usage_block",
+        "language": "python",
+        "response": (
+            "```python\n"
+            "def reverse_words(text: str) -> str:\n"
+            "    return \" \".join(reversed(text.split()))\n"
+            "```\n\n"
+            "Example usage:\n\n"
+            "```python\n"
+            "print(reverse_words(\"hello world\"))\n"
+            "```"
+        ),
+        "expected": (
+            "def reverse_words(text: str) -> str:\n"
+            "    return \" \".join(reversed(text.split()))"
+        ),
+    },
+    {
+        "name": "install_block_before_solution",
+        "language": "python",
+        "response": (
+            "First install the dependency:\n\n"
+            "```bash\n"
+            "pip install requests\n"
+            "```\n\n"
+            "Then:\n\n"
+            "```python\n"
+            "import requests\n\n"
+            "def fetch_status(url: str) -> int:\n"
+            "    return requests.get(url, timeout=10).status_code\n"
+            "```"
+        ),
+        "expected": (
+            "import requests\n\n"
+            "def fetch_status(url: str) -> int:\n"
+            "    return requests.get(url, timeout=10).status_code"
+        ),
+    },
+    {
+        "name": "output_block_before_solution",
+        "language": "python",
+        "response": (
+            "The expected output is:\n\n"
+            "```text\n"
+            "from 1 to 10: 55\n"
+            "```\n\n"
+            "```py\n"
+            "def total(start: int, stop: int) -> int:\n"
+            "    return sum(range(start, stop + 1))\n"
+            "```"
+        ),
+        "expected": (
+            "def total(start: int, stop: int) -> int:\n"
+            "    return sum(range(start, stop + 1))"
+        ),
+    },
+    {
+        "name": "unfenced",
+        "language": "python",
+        "response": (
+            "Sure! The following class keeps a running average.\n"
+            "class RunningAverage:\n"
+            "    def __init__(self):\n"
+            "        self.count = 0\n"
+            "        self.total = 0.0\n\n"
+            "    def add(self, value: float) -> float:\n"
+            "        self.count += 1\n"
+            "        self.total += value\n"
+            "        return self.total / self.count"
+        ),
+        "expected": (
+            "class RunningAverage:\n"
+            "    def __init__(self):\n"
+            "        self.count = 0\n"
+            "        self.total = 0.0\n\n"
+            "    def add(self, value: float) -> float:\n"
+            "        self.count += 1\n"
+            "        self.total += value\n"
+            "        return self.total / self.count"
+        ),
+    },
+    {
+        "name": "cut_off_mid_block",
+        "language": "python",
+        "response": (
+            "```python\n"
+            "def fibonacci(n: int) -> list:\n"
+            "    sequence = [0, 1]\n"
+            "    while len(sequence) < n:\n"
+            "        sequence.append(sequence[-1] + sequence[-2])\n"
+            "    return sequence[:n]\n"
+        ),
+        "expected": (
+            "def fibonacci(n: int) -> list:\n"
+            "    sequence = [0, 1]\n"
+            "    while len(sequence) < n:\n"
+            "        sequence.append(sequence[-1] + sequence[-2])\n"
+            "    return sequence[:n]"
+        ),
+    },
+    {
+        "name": "closing_fence_on_code_line",
+        "language": "python",
+        "response": (
+            "```python\n"
+            "def square(x: float) -> float:\n"
+            "    return x * x```\n"
+            "Done."
+        ),
+        "expected": (
+            "def square(x: float) -> float:\n"
+            "    return x * x"
+        ),
+    },
+    {
+        "name": "leading_comment_dropped",
+        "language": "python",
+        "response": (
+            "```python\n"
+            "# Count vowels in a string\n"
+            "def count_vowels(text: str) -> int:\n"
+            "    return sum(1 for ch in text.lower() if ch in \"aeiou\")\n"
+            "```"
+        ),
+        "expected": (
+            "def count_vowels(text: str) -> int:\n"
+            "    return sum(1 for ch in text.lower() if ch in \"aeiou\")"
+        ),
+    },
+    {
+        "name": "todo_placeholder",
+        "language": "python",
+        "response": (
+            "```python\n"
+            "def parse_config(path: str) -> dict:\n"
+            "    # TODO: handle nested sections\n"
+            "    return {}\n"
+            "```"
+        ),
+        "expected": "",
+    },
+    {
+        "name": "implement_in_prose_outside_block",
+        "language": "python",
+        "response": (
+            "To implement this we sort once and scan:\n\n"
+            "```python\n"
+            "def has_duplicates(items: list) -> bool:\n"
+            "    ordered = sorted(items)\n"
+            "    return any(a == b for a, b in zip(ordered, ordered[1:]))\n"
+            "```"
+        ),
+        "expected": (
+            "def has_duplicates(items: list) -> bool:\n"
+            "    ordered = sorted(items)\n"
+            "    return any(a == b for a, b in zip(ordered, ordered[1:]))"
+        ),
+    },
+    {
+        "name": "too_short",
+        "language": "python",
+        "response": "```python\nimport os\n```",
+        "expected": "",
+    },
+    {
+        "name": "no_code",
+        "language": "python",
+        "response": "I'm sorry, but I need more details about the input format.",
+        "expected": "",
+    },
+    {
+        "name": "empty",
+        "language": "python",
+        "response": "",
+        "expected": "",
+    },
+    {
+        "name": "javascript_short_tag",
+        "language": "javascript",
+        "response": (
+            "```js\n"
+            "function debounce(fn, wait) {\n"
+            "  let timer;\n"
+            "  return (...args) => {\n"
+            "    clearTimeout(timer);\n"
+            "    timer = setTimeout(() => fn(...args), wait);\n"
+            "  };\n"
+            "}\n"
+            "```"
+        ),
+        "expected": (
+            "function debounce(fn, wait) {\n"
+            "  let timer;\n"
+            "  return (...args) => {\n"
+            "    clearTimeout(timer);\n"
+            "    timer = setTimeout(() => fn(...args), wait);\n"
+            "  };\n"
+            "}"
+        ),
+    },
+    {
+        "name": "java_class",
+        "language": "java",
+        "response": (
+            "```java\n"
+            "public class Counter {\n"
+            "    private int count;\n\n"
+            "    public int increment() {\n"
+            "        return ++count;\n"
+            "    }\n"
+            "}\n"
+            "```"
+        ),
+        "expected": (
+            "public class Counter {\n"
+            "    private int count;\n\n"
+            "    public int increment() {\n"
+            "        return ++count;\n"
+            "    }\n"
+            "}"
+        ),
+    },
+    {
+        "name": "cpp_with_include",
+        "language": "cpp",
+        "response": (
+            "```cpp\n"
+            "#include <vector>\n\n"
+            "int sum(const std::vector<int>& values) {\n"
+            "    int total = 0;\n"
+            "    for (int v : values) total += v;\n"
+            "    return total;\n"
+            "}\n"
+            "```"
+        ),
+        "expected": (
+            "#include <vector>\n\n"
+            "int sum(const std::vector<int>& values) {\n"
+            "    int total = 0;\n"
+            "    for (int v : values) total += v;\n"
+            "    return total;\n"
+            "}"
+        ),
+    },
+    {
+        "name": "c_with_shell_block",
+        "language": "c",
+        "response": (
+            "```c\n"
+            "#include <string.h>\n\n"
+            "size_t count_char(const char *s, char c) {\n"
+            "    size_t n = 0;\n"
+            "    for (; *s; s++) n += (*s == c);\n"
+            "    return n;\n"
+            "}\n"
+            "```\n\n"
+            "Compile with:\n\n"
+            "```sh\n"
+            "gcc -O2 -c count.c\n"
+            "```"
+        ),
+        "expected": (
+            "#include <string.h>\n\n"
+            "size_t count_char(const char *s, char c) {\n"
+            "    size_t n = 0;\n"
+            "    for (; *s; s++) n += (*s == c);\n"
+            "    return n;\n"
+            "}"
+        ),
+    },
+    {
+        "name": "sql_query",
+        "language": "sql",
+        "response": (
+            "```sql\n"
+            "SELECT department, COUNT(*) AS employees\n"
+            "FROM staff\n"
+            "GROUP BY department\n"
+            "ORDER BY employees DESC;\n"
+            "```"
+        ),
+        "expected": (
+            "SELECT department, COUNT(*) AS employees\n"
+            "FROM staff\n"
+            "GROUP BY department\n"
+            "ORDER BY employees DESC;"
+        ),
+    },
+]
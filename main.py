@@ -1,3 +1,4 @@
+import argparse
 import uvicorn
 from app import app
 
@@ -8,14 +9,28 @@ if __name__ == "__main__":
     # Configure logging for uvicorn to match our app's logging if needed
     # But for now, we rely on app's logging configuration
     
+    parser = argparse.ArgumentParser(description="Code Wizard API server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=0,
+        help="Production mode: preload the model once and fork N workers "
+             "sharing its weights (default: single dev server with reload)"
+    )
+    args = parser.parse_args()
+    
     print("🔥 Starting FastAPI server...")
-    print("🌐 Server: http://0.0.0.0:8000")
-    print("📚 API Docs: http://localhost:8000/docs")
+    print(f"🌐 Server: http://{args.host}:{args.port}")
+    print(f"📚 API Docs: http://localhost:{args.port}/docs")
     
-    uvicorn.run(
-        "app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    if args.workers > 0:
+        from app.launcher import run_prefork
+        run_prefork(args.workers, host=args.host, port=args.port, log_level="info")
+    else:
+        uvicorn.run(
+            "app:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )